@@ -0,0 +1 @@
+"""Benchmarks del pipeline RAG contra dobles locales reproducibles."""
@@ -0,0 +1,191 @@
+# --------------------------------------------------
+# Dobles locales con respuestas grabadas
+# --------------------------------------------------
+# 👉 Sustituyen a Gemini y Pinecone reproduciendo respuestas grabadas (o
+#    sintéticas) con latencia inyectada configurable, de modo que el
+#    benchmark mide el pipeline sin depender de servicios externos.
+# --------------------------------------------------
+
+import hashlib
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from rag.embedding_cache import normalize_query
+from rag.retrieval_cache import vector_hash
+
+SYNTHETIC_TOPICS = [
+    ("DB-SI", "resistencia al fuego", "Los elementos estructurales tendrán una resistencia al fuego R 90 en uso residencial vivienda."),
+    ("DB-SI", "evacuación", "La anchura mínima de las escaleras protegidas de evacuación descendente será de 1,00 m."),
+    ("DB-SUA", "escaleras", "La huella medirá 28 cm como mínimo y la contrahuella 18,5 cm como máximo."),
+    ("DB-HS", "ventilación", "Los aparcamientos y sótanos dispondrán de un sistema de ventilación natural o mecánica."),
+    ("DB-SE-C", "cimentaciones", "En terrenos arcillosos expansivos se estudiará el potencial de hinchamiento del suelo."),
+]
+
+
+class Latency:
+    """Latencia inyectada: base ± jitter relativo (en segundos)."""
+
+    def __init__(self, base=0.0, jitter=0.0, seed=0):
+        self.base = base
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.base <= 0:
+            return
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(self.base * factor)
+
+
+# ---------------- Fixture -----------------
+def load_fixture(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def save_fixture(records, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def synthetic_fixture(n_queries=40, dim=768, fragments_per_query=20, seed=0):
+    """Fixture determinista con la forma de las respuestas reales."""
+    rng = random.Random(seed)
+    records = []
+    for number in range(n_queries):
+        document, topic, text = SYNTHETIC_TOPICS[number % len(SYNTHETIC_TOPICS)]
+        embedding = [rng.gauss(0, 1) for _ in range(dim)]
+        matches = []
+        for rank in range(fragments_per_query):
+            fragment_doc, _, fragment_text = SYNTHETIC_TOPICS[(number + rank) % len(SYNTHETIC_TOPICS)]
+            matches.append({
+                "id": f"frag-{number}-{rank}",
+                "score": round(0.9 - rank * 0.02, 4),
+                "metadata": {"documento": fragment_doc, "texto": f"{fragment_text} (apartado {rank + 1}.{number})\n" * 6},
+            })
+        records.append({
+            "query": f"Consulta {number}: requisitos de {topic} según {document}",
+            "embedding": embedding,
+            "matches": matches,
+            "response": f"Según {document}, {text} " * 8,
+        })
+    return records
+
+
+# ---------------- Dobles -----------------
+class ReplayEmbedder:
+    """Devuelve el embedding grabado de cada consulta."""
+
+    def __init__(self, records, latency=None):
+        self._vectors = {normalize_query(record["query"]): record["embedding"] for record in records}
+        self._dim = len(records[0]["embedding"]) if records else 768
+        self.latency = latency or Latency()
+
+    def __call__(self, text):
+        self.latency.sleep()
+        vector = self._vectors.get(normalize_query(text))
+        if vector is None:
+            # Consulta no grabada: vector determinista a partir del texto
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            rng = random.Random(seed)
+            vector = [rng.gauss(0, 1) for _ in range(self._dim)]
+        return vector
+
+
+class ReplayRetriever:
+    """Índice que responde con los `matches` grabados para cada vector."""
+
+    name = "replay"
+    version = 1
+    remote = True  # Simula Pinecone: pasa por los límites del planificador
+
+    def __init__(self, records, latency=None):
+        self._responses = {vector_hash(record["embedding"]): record["matches"] for record in records}
+        self._default = records[0]["matches"] if records else []
+        self._metadata = {
+            match["id"]: match.get("metadata", {}) for record in records for match in record["matches"]
+        }
+        self.latency = latency or Latency()
+
+    def query(self, vector, top_k, namespace=None, filter=None, include_metadata=True, **options):
+        self.latency.sleep()
+        matches = self._responses.get(vector_hash(vector), self._default)
+        matches = [dict(match) for match in matches[:top_k]]
+        if not include_metadata:
+            for match in matches:
+                match.pop("metadata", None)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def fetch(self, ids, namespace=None):
+        self.latency.sleep()
+        return {fid: self._metadata[fid] for fid in ids if fid in self._metadata}
+
+
+class ReplayModel:
+    """Modelo generativo que reproduce la respuesta grabada por trozos."""
+
+    def __init__(self, records, latency=None, chunk_latency=None, chunk_chars=40):
+        self._responses = [(record["query"], record["response"]) for record in records]
+        self.latency = latency or Latency()
+        self.chunk_latency = chunk_latency or Latency()
+        self.chunk_chars = chunk_chars
+
+    def _response_for(self, prompt):
+        tail = prompt[-500:]
+        for query, response in self._responses:
+            if query in tail:
+                return response
+        return self._responses[0][1] if self._responses else "Respuesta de prueba."
+
+    @staticmethod
+    def _chunk(text):
+        part = SimpleNamespace(text=text)
+        candidate = SimpleNamespace(content=SimpleNamespace(parts=[part]), finish_reason=None)
+        return SimpleNamespace(prompt_feedback=None, candidates=[candidate])
+
+    def _stream(self, text):
+        self.latency.sleep()  # Tiempo hasta el primer token
+        for start in range(0, len(text), self.chunk_chars):
+            if start:
+                self.chunk_latency.sleep()
+            yield self._chunk(text[start:start + self.chunk_chars])
+
+    def generate_content(self, prompt, stream=False, **_kwargs):
+        text = self._response_for(prompt)
+        if stream:
+            return self._stream(text)
+        for _ in self._stream(text):
+            pass
+        return self._chunk(text)
+
+
+# ---------------- Grabación -----------------
+class Recorder:
+    """Envuelve embedder, índice y modelo reales para grabar sus respuestas."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def _record(self, query):
+        with self._lock:
+            return self.records.setdefault(normalize_query(query), {"query": query})
+
+    def record(self, queries):
+        engine = self.engine
+        for query in queries:
+            record = self._record(query)
+            record["embedding"] = engine.embed(query)
+            response = engine.retriever.query(
+                vector=record["embedding"], top_k=engine.config.top_k, include_metadata=True
+            )
+            record["matches"] = response["matches"]
+            record["response"] = engine.answer(query)["response"]
+        return list(self.records.values())
@@ -0,0 +1,226 @@
+# --------------------------------------------------
+# Benchmark del pipeline completo de consulta
+# --------------------------------------------------
+# 👉 Ejecuta el motor RAG contra dobles reproducibles (fixture grabada o
+#    sintética) con latencia inyectada y reporta p50/p95/p99 por etapa,
+#    rendimiento con N sesiones concurrentes, reparto por nivel de modelo
+#    y crecimiento de memoria en conversaciones largas.
+#
+#    python -m benchmarks.pipeline                       # fixture sintética
+#    python -m benchmarks.pipeline --fixture f.jsonl --sessions 8 --turns 5
+#    python -m benchmarks.pipeline --record preguntas.txt --fixture f.jsonl
+# --------------------------------------------------
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmarks.fixtures import (
+    Latency,
+    Recorder,
+    ReplayEmbedder,
+    ReplayModel,
+    ReplayRetriever,
+    load_fixture,
+    save_fixture,
+    synthetic_fixture,
+)
+from rag.embedding_cache import EmbeddingCache
+from rag.engine import SEARCH_VECTOR, RAGConfig, RAGEngine
+from rag.rendering import build_fragments_html
+
+STAGES = ("embedding_done", "retrieval_done", "rerank", "prompt", "first_token", "done", "render", "total")
+STAGE_LABELS = {
+    "embedding_done": "embedding",
+    "retrieval_done": "búsqueda",
+    "rerank": "filtrado+reordenación",
+    "prompt": "prompt",
+    "first_token": "primer token",
+    "done": "generación",
+    "render": "HTML fragmentos",
+    "total": "total",
+}
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def disable_caches(engine):
+    """Sin cachés: cada consulta recorre el pipeline completo."""
+    engine.embedding_cache = EmbeddingCache(None, capacity=0)
+    engine.retrieval_cache.ttl = -1
+    engine.answer_cache.threshold = 2.0
+    return engine
+
+
+def build_engine(records, args, cache_dir, **overrides):
+    latency = {
+        "embed": Latency(args.embed_latency, args.jitter, seed=1),
+        "query": Latency(args.query_latency, args.jitter, seed=2),
+        "generate": Latency(args.generate_latency, args.jitter, seed=3),
+        "chunk": Latency(args.chunk_latency, args.jitter, seed=4),
+    }
+    config = RAGConfig(
+        cache_dir=cache_dir,
+        corpus_path=os.path.join(cache_dir, "sin-corpus.sqlite"),
+        stream_responses=True,
+        **overrides,
+    )
+    engine = RAGEngine(
+        config,
+        retriever=ReplayRetriever(records, latency["query"]),
+        model=ReplayModel(records, latency["generate"], latency["chunk"]),
+        embed_fn=ReplayEmbedder(records, latency["embed"]),
+    )
+    return disable_caches(engine) if args.cold else engine
+
+
+def run_turn(engine, query, history, history_state):
+    """Un turno como lo ejecuta la interfaz: prepare → stream → render."""
+    start = time.perf_counter()
+    turn = engine.prepare(query, history, history_state, search_mode=SEARCH_VECTOR)
+    text = []
+    for chunk in engine.generate(turn):
+        turn.tracker.mark("first_token")
+        text.append(chunk)
+    turn.tracker.mark("done")
+    response = "".join(text)
+    engine.finish(turn, response)
+    render_start = time.perf_counter()
+    html = build_fragments_html(turn.fragments) if turn.fragments else ""
+    timings = dict(turn.tracker.timings(), **turn.stage_times)
+    timings["render"] = time.perf_counter() - render_start
+    timings["total"] = time.perf_counter() - start
+    message = {"role": "Asistente", "content": response, "fragments": turn.fragments, "fragments_html": html}
+    return timings, message, turn.history_state
+
+
+def run_session(engine, queries, turns, results, lock):
+    conversation, state = [], {}
+    for number in range(turns):
+        query = queries[number % len(queries)]
+        conversation.append({"role": "Usuario", "content": query})
+        timings, message, state = run_turn(engine, query, conversation[:-1], state)
+        conversation.append(message)
+        with lock:
+            results.append(timings)
+
+
+def report_latency(results):
+    print(f"\n{'etapa':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage in STAGES:
+        values = [timings[stage] * 1000 for timings in results if stage in timings]
+        if values:
+            print(
+                f"{STAGE_LABELS[stage]:<24}{percentile(values, 0.50):>10.2f}"
+                f"{percentile(values, 0.95):>10.2f}{percentile(values, 0.99):>10.2f}"
+            )
+
+
+def report_tiers(tracer):
+    tier_stats = tracer.tier_stats()
+    if not tier_stats:
+        return
+    print(f"\nNiveles de modelo ({tracer.hedged} respaldos por lentitud)")
+    print(f"{'nivel':<12}{'turnos':>8}{'p50 ms':>10}{'p95 ms':>10}{'tok. prompt':>13}{'tok. resp.':>12}")
+    for tier, stats in tier_stats.items():
+        p50, p95 = stats["latency"]
+        print(f"{tier:<12}{stats['turns']:>8}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}"
+              f"{stats['prompt_tokens']:>13.0f}{stats['response_tokens']:>12.0f}")
+
+
+def bench_concurrency(engine, queries, sessions, turns):
+    results, lock = [], threading.Lock()
+    threads = [
+        threading.Thread(target=run_session, args=(engine, queries[number:] + queries[:number], turns, results, lock))
+        for number in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def bench_memory(engine, queries, turns, step):
+    """Memoria retenida por una conversación larga (Python, vía tracemalloc)."""
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    conversation, state, samples = [], {}, []
+    for number in range(1, turns + 1):
+        query = queries[number % len(queries)]
+        conversation.append({"role": "Usuario", "content": query})
+        _timings, message, state = run_turn(engine, query, conversation[:-1], state)
+        conversation.append(message)
+        if number % step == 0 or number == turns:
+            growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+            samples.append((number, growth))
+    tracemalloc.stop()
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline RAG con dobles locales.")
+    parser.add_argument("--fixture", help="Fixture JSONL grabada (por defecto, sintética)")
+    parser.add_argument("--record", help="Grabar la fixture con los servicios reales a partir de estas preguntas")
+    parser.add_argument("--queries", type=int, default=40, help="Consultas de la fixture sintética")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--query-latency", type=float, default=0.08)
+    parser.add_argument("--generate-latency", type=float, default=0.40, help="Latencia hasta el primer token")
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="Latencia entre trozos del streaming")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variación relativa de la latencia")
+    parser.add_argument("--sessions", type=int, default=8, help="Sesiones concurrentes")
+    parser.add_argument("--turns", type=int, default=5, help="Turnos por sesión concurrente")
+    parser.add_argument("--memory-turns", type=int, default=100, help="Turnos de la conversación larga")
+    parser.add_argument("--cold", action="store_true", help="Desactivar cachés")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        from rag.settings import load_secrets
+
+        with open(args.record, encoding="utf-8") as fh:
+            questions = [line.strip() for line in fh if line.strip()]
+        records = Recorder(RAGEngine(RAGConfig.from_secrets(load_secrets()))).record(questions)
+        save_fixture(records, args.fixture or "fixture.jsonl")
+        print(f"Fixture grabada: {len(records)} consultas en {args.fixture or 'fixture.jsonl'}")
+        return
+
+    records = load_fixture(args.fixture) if args.fixture else synthetic_fixture(args.queries)
+    queries = [record["query"] for record in records]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        engine = build_engine(records, args, cache_dir)
+        results, elapsed = bench_concurrency(engine, queries, args.sessions, args.turns)
+        print(f"Latencia por etapa ({len(results)} turnos, {args.sessions} sesiones concurrentes)")
+        report_latency(results)
+        print(f"\nRendimiento: {len(results) / elapsed:.2f} turnos/s ({elapsed:.2f} s en total)")
+        report_tiers(engine.tracer)
+
+        # Sin latencia inyectada: la memoria no depende del tiempo
+        memory_args = argparse.Namespace(**dict(vars(args), embed_latency=0, query_latency=0,
+                                                generate_latency=0, chunk_latency=0))
+        samples = bench_memory(build_engine(records, memory_args, cache_dir), queries, args.memory_turns,
+                               step=max(1, args.memory_turns // 5))
+        print("\nMemoria retenida en una conversación larga")
+        for turns, growth in samples:
+            print(f"  {turns:>4} turnos: {growth / 1024:>9.1f} KiB ({growth / turns / 1024:.1f} KiB/turno)")
+        if len(samples) > 1:
+            slope = statistics.mean(
+                (b[1] - a[1]) / (b[0] - a[0]) for a, b in zip(samples, samples[1:])
+            )
+            print(f"  crecimiento medio: {slope / 1024:.1f} KiB/turno")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# --------------------------------------------------
+# Benchmark del arranque en frío de la interfaz
+# --------------------------------------------------
+# 👉 En un intérprete limpio mide:
+#    - Tiempo de import de los módulos de la interfaz (`-X importtime`).
+#    - Primer run de la app con `AppTest` (la propia app registra sus fases
+#      en `startup_log_path`) y si el propio script ha importado los SDK de
+#      Gemini/Pinecone antes de la primera consulta (el precalentamiento los
+#      importa después, en su hilo).
+#    - Peso de los recursos de `static/`.
+#    Cada ejecución puede añadirse a un histórico JSONL para comparar versiones.
+#
+#    python -m benchmarks.startup
+#    python -m benchmarks.startup --repeat 5 --output .cache/startup_bench.jsonl
+# --------------------------------------------------
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from rag import APP_VERSION
+from rag.startup import append_startup_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(ROOT, "interfaz_chatbot_edificacion.py")
+UI_IMPORTS = "import streamlit, rag.engine, rag.generation, rag.progress, rag.rendering, rag.scheduler, rag.sessions"
+SDK_MODULES = ("google.generativeai", "pinecone")
+
+FIRST_RUN = """
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+from streamlit.testing.v1 import AppTest
+from rag.warmup import WarmupJob
+# SDK cargados por el script, antes de que arranque el hilo de precalentamiento
+sdk_imported = None
+start_warmup = WarmupJob.start
+def start(job):
+    global sdk_imported
+    if sdk_imported is None:
+        sdk_imported = [name for name in {sdk!r} if name in sys.modules]
+    return start_warmup(job)
+WarmupJob.start = start
+app = AppTest.from_file({script!r}, default_timeout=120)
+app.secrets["general"] = {{"genai_api_key": "-", "pinecone_api_key": "-", "retriever_backend": {backend!r}}}
+started = time.perf_counter()
+app.run()
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "exceptions": [str(e.value) for e in app.exception],
+    "sdk_imported": sdk_imported if sdk_imported is not None else [name for name in {sdk!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_imports():
+    """Tiempo acumulado (s) de cada import de primer nivel en un intérprete limpio."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", UI_IMPORTS],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # Los imports anidados van sangrados
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative) / 1e6
+    return modules
+
+
+def measure_first_run(backend):
+    """Primer run de la interfaz con `AppTest` en un intérprete limpio."""
+    code = FIRST_RUN.format(script=APP_SCRIPT, backend=backend, sdk=SDK_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def static_sizes():
+    directory = os.path.join(ROOT, "static")
+    sizes = {}
+    for base, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(base, name)
+            sizes[os.path.relpath(path, directory)] = os.path.getsize(path)
+    return dict(sorted(sizes.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío de la interfaz")
+    parser.add_argument("--repeat", type=int, default=3, help="Intérpretes limpios por medida")
+    parser.add_argument("--backend", default="pinecone", choices=("pinecone", "local"))
+    parser.add_argument("--output", help="Añade el informe a este JSONL")
+    args = parser.parse_args()
+
+    imports = [measure_imports() for _ in range(args.repeat)]
+    runs = [measure_first_run(args.backend) for _ in range(args.repeat)]
+    import_totals = [sum(modules.values()) for modules in imports]
+    report = {
+        "version": APP_VERSION,
+        "backend": args.backend,
+        "imports": round(statistics.median(import_totals), 6),
+        "imports_by_module": {
+            name: round(statistics.median(modules.get(name, 0) for modules in imports), 6)
+            for name in sorted(imports[0], key=imports[0].get, reverse=True)[:8]
+        },
+        "first_run": round(statistics.median(run["seconds"] for run in runs), 6),
+        "sdk_imported": sorted({name for run in runs for name in run["sdk_imported"]}),
+        "exceptions": sorted({error for run in runs for error in run["exceptions"]}),
+        "static_bytes": static_sizes(),
+    }
+
+    print(f"Versión {report['version']} · backend {report['backend']} · mediana de {args.repeat} intérpretes")
+    print(f"  imports de la interfaz: {report['imports'] * 1000:.0f} ms")
+    for name, seconds in report["imports_by_module"].items():
+        print(f"    {name:<24} {seconds * 1000:7.0f} ms")
+    print(f"  primer run (AppTest):   {report['first_run'] * 1000:.0f} ms")
+    print(f"  SDK importados al arrancar: {', '.join(report['sdk_imported']) or 'ninguno'}")
+    if report["exceptions"]:
+        print(f"  errores: {report['exceptions']}")
+    print(f"  static/: {sum(report['static_bytes'].values()) / 1024:.1f} KB en {len(report['static_bytes'])} ficheros")
+    append_startup_report(args.output, report)
+
+
+if __name__ == "__main__":
+    main()
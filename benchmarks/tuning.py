@@ -0,0 +1,220 @@
+# --------------------------------------------------
+# Ajuste de la recuperación: calidad frente a latencia
+# --------------------------------------------------
+# 👉 Repite un conjunto de preguntas etiquetadas con cada combinación de
+#    top_k × umbral de similitud × fragmentos de contexto y reporta:
+#    - recall@k: fragmentos relevantes entre los candidatos sobre el umbral.
+#    - recall del contexto: relevantes que llegan al prompt.
+#    - aceptación: la respuesta contiene los términos esperados (o, si la
+#      pregunta no los tiene, el contexto incluye algún fragmento relevante).
+#    - latencia por etapa (p50) y tokens de prompt/respuesta.
+#    Recomienda la configuración más rápida que mantiene la calidad de la
+#    mejor y, con `--feedback`, muestra la aceptación real (👍/👎) por
+#    configuración.
+#
+#    Preguntas (JSONL): {"query": ..., "relevant": [ids], "expected": [términos]}
+#    o las respuestas valoradas con 👍 del registro de feedback.
+#
+#    python -m benchmarks.tuning                                   # fixture sintética
+#    python -m benchmarks.tuning --fixture f.jsonl --questions q.jsonl
+#    python -m benchmarks.tuning --live --feedback data/feedback.jsonl --top-k 10,20
+# --------------------------------------------------
+
+import argparse
+import itertools
+import json
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.fixtures import SYNTHETIC_TOPICS, load_fixture, synthetic_fixture
+from benchmarks.pipeline import STAGE_LABELS, build_engine, disable_caches, percentile
+from rag.embedding_cache import normalize_query
+from rag.engine import SEARCH_HYBRID, SEARCH_VECTOR, RAGConfig, RAGEngine
+from rag.feedback import TUNED_PARAMETERS, load_feedback
+
+STAGES = ("embedding_done", "retrieval_done", "rerank", "prompt", "first_token", "done", "total")
+
+
+# ---------------- Preguntas etiquetadas -----------------
+def load_questions(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def questions_from_feedback(entries):
+    """Respuestas aceptadas: sus fragmentos cuentan como relevantes para la consulta."""
+    questions = {}
+    for entry in entries:
+        if not entry.get("accepted") or not entry.get("query"):
+            continue
+        question = questions.setdefault(normalize_query(entry["query"]), {"query": entry["query"], "relevant": []})
+        for fragment in entry.get("fragments", []):
+            if fragment.get("id") and fragment["id"] not in question["relevant"]:
+                question["relevant"].append(fragment["id"])
+    return list(questions.values())
+
+
+def synthetic_questions(records):
+    """Etiquetas de la fixture sintética: los fragmentos del documento de la consulta."""
+    questions = []
+    for number, record in enumerate(records):
+        document, topic, _ = SYNTHETIC_TOPICS[number % len(SYNTHETIC_TOPICS)]
+        questions.append({
+            "query": record["query"],
+            "relevant": [match["id"] for match in record["matches"]
+                         if match.get("metadata", {}).get("documento") == document],
+            "expected": [document],
+        })
+    return questions
+
+
+# ---------------- Evaluación -----------------
+def is_accepted(question, result, context_hits):
+    expected = question.get("expected")
+    if expected:
+        response = normalize_query(result["response"])
+        return all(normalize_query(term) in response for term in expected)
+    return context_hits > 0
+
+
+def evaluate(engine, questions, search_mode):
+    """Métricas de una configuración sobre todas las preguntas."""
+    recalls, context_recalls, accepted, tokens = [], [], [], defaultdict(list)
+    stage_times = defaultdict(list)
+    for question in questions:
+        relevant = set(question.get("relevant", []))
+        start = time.perf_counter()
+        result = engine.answer(question["query"], search_mode=search_mode)
+        total = time.perf_counter() - start
+        context_hits = len(relevant & {fragment["id"] for fragment in result["fragments"]})
+        if relevant:
+            recalls.append(len(relevant & set(result["candidate_ids"])) / len(relevant))
+            context_recalls.append(context_hits / len(relevant))
+        accepted.append(is_accepted(question, result, context_hits))
+        for kind, count in result["trace"]["tokens"].items():
+            tokens[kind].append(count)
+        for stage, seconds in dict(result["timings"], total=total).items():
+            stage_times[stage].append(seconds)
+    return {
+        "recall": statistics.mean(recalls) if recalls else 0.0,
+        "context_recall": statistics.mean(context_recalls) if context_recalls else 0.0,
+        "acceptance": statistics.mean(accepted) if accepted else 0.0,
+        "p50": {stage: percentile(values, 0.50) for stage, values in stage_times.items()},
+        "p95_total": percentile(stage_times["total"], 0.95),
+        "tokens": {kind: statistics.mean(values) for kind, values in tokens.items()},
+    }
+
+
+def recommend(results, tolerance):
+    """La más rápida cuya calidad no baja más de `tolerance` respecto a la mejor."""
+    best_recall = max(result["recall"] for result in results)
+    best_acceptance = max(result["acceptance"] for result in results)
+    eligible = [
+        result for result in results
+        if result["recall"] >= best_recall - tolerance and result["acceptance"] >= best_acceptance - tolerance
+    ]
+    return min(eligible, key=lambda result: (result["p50"]["total"], result["tokens"].get("prompt", 0)))
+
+
+def feedback_acceptance(entries):
+    """Aceptación real (👍/👎) agrupada por configuración."""
+    groups = defaultdict(list)
+    for entry in entries:
+        if entry.get("config"):
+            groups[tuple(entry["config"].get(name) for name in TUNED_PARAMETERS)].append(bool(entry["accepted"]))
+    return {key: (sum(votes) / len(votes), len(votes)) for key, votes in groups.items()}
+
+
+def parse_list(text, cast):
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Barrido de top_k, umbral y contexto frente a la latencia.")
+    parser.add_argument("--fixture", help="Fixture JSONL grabada con benchmarks.pipeline --record")
+    parser.add_argument("--questions", help="Preguntas etiquetadas (JSONL)")
+    parser.add_argument("--feedback", help="Registro de valoraciones: preguntas 👍 y aceptación real")
+    parser.add_argument("--live", action="store_true", help="Usar Gemini/Pinecone reales (secrets.toml)")
+    parser.add_argument("--search-mode", choices=(SEARCH_VECTOR, SEARCH_HYBRID), default=SEARCH_VECTOR)
+    parser.add_argument("--top-k", default="5,10,20")
+    parser.add_argument("--threshold", default="0.5,0.6,0.7")
+    parser.add_argument("--context", default="3,5", help="Fragmentos máximos en el prompt")
+    parser.add_argument("--limit", type=int, default=20, help="Preguntas por configuración")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Pérdida de calidad admitida")
+    parser.add_argument("--output", help="Resultados por configuración (JSONL)")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--query-latency", type=float, default=0.08)
+    parser.add_argument("--generate-latency", type=float, default=0.40)
+    parser.add_argument("--chunk-latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    args.cold = True
+
+    records = None if args.live else load_fixture(args.fixture) if args.fixture else synthetic_fixture()
+    feedback = load_feedback(args.feedback) if args.feedback else []
+    if args.questions:
+        questions = load_questions(args.questions)
+    elif feedback:
+        questions = questions_from_feedback(feedback)
+    elif records is not None and not args.fixture:
+        questions = synthetic_questions(records)
+    else:
+        parser.error("Indica --questions o --feedback con preguntas etiquetadas")
+    questions = questions[:args.limit]
+
+    grid = list(itertools.product(
+        parse_list(args.top_k, int), parse_list(args.threshold, float), parse_list(args.context, int)
+    ))
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for top_k, threshold, context in grid:
+            overrides = {
+                "top_k": top_k,
+                "hybrid_vector_top_k": top_k,
+                "min_similarity_score": threshold,
+                "max_context_fragments": context,
+            }
+            if args.live:
+                from rag.settings import load_secrets
+
+                engine = disable_caches(RAGEngine(RAGConfig.from_secrets(load_secrets(), **overrides)))
+            else:
+                engine = build_engine(records, args, cache_dir, **overrides)
+            result = dict(evaluate(engine, questions, args.search_mode), top_k=top_k, threshold=threshold,
+                          context=context, config=tuple(getattr(engine.config, name) for name in TUNED_PARAMETERS))
+            results.append(result)
+            print(f"  top_k={top_k:<3} umbral={threshold:<5} contexto={context:<3} "
+                  f"recall@k={result['recall']:.2f} p50={result['p50']['total'] * 1000:.0f} ms")
+
+    real = feedback_acceptance(feedback)
+    print(f"\n{len(questions)} preguntas · {len(grid)} configuraciones · modo {args.search_mode}")
+    print(f"{'top_k':>6}{'umbral':>8}{'ctx':>5}{'recall@k':>10}{'recall ctx':>11}{'acept.':>8}"
+          f"{'👍 real':>10}{'p50 ms':>9}{'p95 ms':>9}{'tok. prompt':>12}{'tok. resp.':>11}")
+    for result in sorted(results, key=lambda result: result["p50"]["total"]):
+        rate, votes = real.get(result["config"], (None, 0))
+        print(
+            f"{result['top_k']:>6}{result['threshold']:>8}{result['context']:>5}"
+            f"{result['recall']:>10.2f}{result['context_recall']:>11.2f}{result['acceptance']:>8.2f}"
+            f"{(f'{rate:.2f} ({votes})' if votes else '-'):>10}"
+            f"{result['p50']['total'] * 1000:>9.0f}{result['p95_total'] * 1000:>9.0f}"
+            f"{result['tokens'].get('prompt', 0):>12.0f}{result['tokens'].get('response', 0):>11.0f}"
+        )
+
+    best = recommend(results, args.tolerance)
+    print(f"\nRecomendada: top_k={best['top_k']}, min_similarity_score={best['threshold']}, "
+          f"max_context_fragments={best['context']} (p50 {best['p50']['total'] * 1000:.0f} ms, "
+          f"recall@k {best['recall']:.2f}, aceptación {best['acceptance']:.2f})")
+    print("  p50 por etapa: " + " · ".join(
+        f"{STAGE_LABELS.get(stage, stage)} {best['p50'][stage] * 1000:.0f} ms" for stage in STAGES if stage in best["p50"]
+    ))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            for result in results:
+                fh.write(json.dumps(dict(result, config=list(result["config"])), ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
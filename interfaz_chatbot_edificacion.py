@@ -2,28 +2,50 @@
 # Asistente Técnico Inteligente para Construcción
 # Versión: UI Premium (abril 2025)
 # --------------------------------------------------
-# 👉 La lógica de negocio RAG se mantiene intacta; solo se han aplicado
-#    mejoras sustanciales en diseño y experiencia de usuario.
+# 👉 La lógica de negocio RAG vive en `rag/engine.py` (usable sin
+#    Streamlit); este script solo contiene la interfaz.
 # --------------------------------------------------
 
+from rag.startup import StartupTimer
+
+startup = StartupTimer()  # Antes del resto de imports para medirlos en el primer run del proceso
+
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+
 import streamlit as st
-import google.generativeai as genai
-from pinecone import Pinecone
 from datetime import datetime
-import time
 
-# ---------------- Configuración -----------------
-GENAI_API_KEY = st.secrets["general"]["genai_api_key"]
-PINECONE_API_KEY = st.secrets["general"]["pinecone_api_key"]
-INDEX_NAME = "documentacion-edificacion"
-MIN_SIMILARITY_SCORE = 0.50  # 50 %
-
-# ---------------- Inicialización -----------------
-genai.configure(api_key=GENAI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash")
+from rag import APP_VERSION
+from rag.engine import (
+    SEARCH_HYBRID,
+    SEARCH_LEXICAL,
+    SEARCH_VECTOR,
+    EmbeddingError,
+    RAGConfig,
+    RAGEngine,
+)
+from rag.feedback import FeedbackLog
+from rag.generation import GenerationBlocked
+from rag.model_router import TIER_LABELS, GenerationTimeout
+from rag.progress import StageTracker
+from rag.rendering import build_fragments_html
+from rag.scheduler import QueueTimeout
+from rag.sessions import open_conversation_store
+from rag.startup import append_startup_report
+from rag.warmup import WarmupJob
+
+startup.mark("imports")
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(INDEX_NAME)
+# ---------------- Configuración -----------------
+# Los parámetros del pipeline (modelos, top_k, umbrales, cachés...) están en RAGConfig
+CONFIG = RAGConfig.from_secrets(st.secrets["general"])
+SEARCH_MODES = {"Híbrida": SEARCH_HYBRID, "Vectorial": SEARCH_VECTOR, "Léxica": SEARCH_LEXICAL}
+HISTORY_PAGE_SIZE = 10  # Mensajes del historial que se pintan por página
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_ASSETS = ("fonts.css", "styles.css", "logo-64.webp", "logo-128.webp")  # Ver scripts/build_static_assets.py
 
 # ---------------- Estilos globales -----------------
 st.set_page_config(
@@ -37,408 +59,288 @@ st.set_page_config(
     },
 )
 
-# Configuración de colores y UI
-PRIMARY_COLOR = "#2E5EAA"
-SECONDARY_COLOR = "#FFA630"
-BACKGROUND_COLOR = "#FFFFFF"
-ACCENT_COLOR = "#2E5EAA"
-TEXT_COLOR = "#333333"
-BORDER_RADIUS = "10px"
+# Colores y tipografía en `static/styles.css`; con `server.enableStaticServing`
+# el navegador descarga la hoja una vez y cada re-run solo envía el <link>
+@st.cache_resource(show_spinner=False)
+def get_static_assets():
+    """Ficheros de `static/` disponibles con su huella (invalida la caché del navegador)."""
+    assets = {}
+    for name in STATIC_ASSETS:
+        path = os.path.join(STATIC_DIR, name)
+        if os.path.exists(path):
+            with open(path, "rb") as fh:
+                content = fh.read()
+            assets[name] = (hashlib.sha1(content).hexdigest()[:10], content)
+    return assets
 
-st.markdown(
-    f"""
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=DM+Sans:wght@400;500;700&display=swap');
-        
-        html, body, [class*="css"] {{
-            font-family: 'Inter', sans-serif;
-            scroll-behavior: smooth;
-        }}
-        
-        .block-container {{
-            padding-top: 0;
-            padding-bottom: 2rem;
-            max-width: 1200px;
-        }}
-        
-        /* Encabezado */
-        .app-header {{
-            background: linear-gradient(90deg, {PRIMARY_COLOR} 0%, #1E3A6D 100%);
-            padding: 1.8rem 2rem;
-            border-radius: 0 0 16px 16px;
-            color: #fff;
-            margin-bottom: 2rem;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-            position: relative;
-            overflow: hidden;
-        }}
-        
-        .app-header h1 {{
-            font-family: 'DM Sans', sans-serif;
-            font-weight: 700;
-            font-size: 2rem;
-            margin: 0;
-            position: relative;
-            z-index: 10;
-        }}
-        
-        .app-header p {{
-            margin: 0.5rem 0 0;
-            font-size: 1rem;
-            opacity: 0.9;
-            position: relative;
-            z-index: 10;
-        }}
-        
-        /* Fragmentos */
-        .fragment-container {{
-            border-left: 4px solid {ACCENT_COLOR};
-            background-color: #f8faff;
-            padding: 1rem 1.2rem;
-            border-radius: {BORDER_RADIUS};
-            margin-bottom: 1rem;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-            transition: all 0.2s ease;
-        }}
-        
-        .fragment-container:hover {{
-            box-shadow: 0 4px 10px rgba(0,0,0,0.1);
-            transform: translateY(-2px);
-        }}
-        
-        .fragment-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 0.5rem;
-        }}
-        
-        .fragment-source {{
-            font-weight: 600;
-            color: {PRIMARY_COLOR};
-            font-size: 0.9rem;
-            display: flex;
-            align-items: center;
-            gap: 5px;
-        }}
-        
-        .fragment-source-icon {{
-            display: inline-block;
-            width: 16px;
-            height: 16px;
-            background-color: {PRIMARY_COLOR};
-            -webkit-mask: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3E%3Cpath d='M2 3.5A1.5 1.5 0 0 1 3.5 2h9A1.5 1.5 0 0 1 14 3.5v9a1.5 1.5 0 0 1-1.5 1.5h-9A1.5 1.5 0 0 1 2 12.5v-9z'/%3E%3C/svg%3E") no-repeat center center / contain;
-            mask: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 16 16'%3E%3Cpath d='M2 3.5A1.5 1.5 0 0 1 3.5 2h9A1.5 1.5 0 0 1 14 3.5v9a1.5 1.5 0 0 1-1.5 1.5h-9A1.5 1.5 0 0 1 2 12.5v-9z'/%3E%3C/svg%3E") no-repeat center center / contain;
-        }}
-        
-        .fragment-score {{
-            font-size: 0.8rem;
-            color: #555;
-        }}
-        
-        .fragment-content {{
-            font-size: 0.92rem;
-            white-space: pre-wrap;
-            line-height: 1.5;
-        }}
-        
-        /* Chat message tweaks */
-        .stChatMessage {{
-            border-radius: {BORDER_RADIUS};
-            padding: 1rem !important;
-            margin-bottom: 1.2rem !important;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-            border: 1px solid #eef2f8;
-        }}
-        
-        .stChatMessageContent {{
-            padding: 0 !important;
-        }}
-        
-        div[data-testid="stChatMessageContent"] p {{
-            margin-bottom: 0.8rem;
-            line-height: 1.6;
-        }}
-        
-        /* User chat message */
-        .stChatMessage[data-testid="user-message"] {{
-            background-color: #f0f7ff !important;
-        }}
-        
-        /* Assistant chat message */
-        .stChatMessage[data-testid="assistant-message"] {{
-            background-color: #ffffff !important;
-        }}
-        
-        /* Entrada de chat */
-        .stChatInputContainer {{
-            padding: 0.8rem !important;
-            border-radius: {BORDER_RADIUS} !important;
-            border: 1px solid #e1e4e8 !important;
-            background: white !important;
-            box-shadow: 0 2px 6px rgba(0,0,0,0.05);
-        }}
-        
-        
-
-
-        
-        [data-testid="stSidebarUserContent"] {{
-            padding-top: 2rem;
-        }}
-        
-        .stSidebar [data-testid="stMarkdownContainer"] h1, 
-        .stSidebar [data-testid="stMarkdownContainer"] h2, 
-        .stSidebar [data-testid="stMarkdownContainer"] h3 {{
-            color: {PRIMARY_COLOR};
-        }}
-        
-        /* Expander */
-        .streamlit-expanderHeader {{
-            font-size: 0.95rem;
-            font-weight: 500;
-            color: {PRIMARY_COLOR};
-            background-color: #f8f9fa;
-            border-radius: 6px;
-        }}
-        
-        /* Toast */
-        .stToast {{
-            background-color: {PRIMARY_COLOR} !important;
-            color: white !important;
-            font-size: 0.9rem !important;
-            border-radius: 8px !important;
-        }}
-        
-        /* Spinner */
-        .stSpinner > div > div {{
-            border-top-color: {PRIMARY_COLOR} !important;
-        }}
-        
-        /* Botones */
-        .stButton button {{
-            background-color: {PRIMARY_COLOR};
-            color: white;
-            border: none;
-            padding: 0.5rem 1rem;
-            border-radius: 6px;
-            font-weight: 500;
-            transition: all 0.2s ease;
-        }}
-        
-        .stButton button:hover {{
-            background-color: #264b85;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        }}
-        
-        /* Progress bar */
-        .stProgress > div > div > div {{
-            background-color: {PRIMARY_COLOR} !important;
-        }}
-        
-        /* Footer */
-        .app-footer {{
-            text-align: center;
-            margin-top: 2rem;
-            padding-top: 1.5rem;
-            border-top: 1px solid #eaeaea;
-            color: #666;
-            font-size: 0.85rem;
-        }}
-        
-        /* Badge styles */
-        .badge {{
-            display: inline-block;
-            padding: 0.25em 0.6em;
-            font-size: 0.75rem;
-            font-weight: 600;
-            line-height: 1;
-            text-align: center;
-            white-space: nowrap;
-            vertical-align: baseline;
-            border-radius: 10rem;
-            color: #fff;
-        }}
-        
-        .badge-success {{
-            background-color: #28a745;
-        }}
-        
-        .badge-warning {{
-            background-color: #ffc107;
-            color: #212529;
-        }}
-        
-        .badge-danger {{
-            background-color: #dc3545;
-        }}
-        
-        /* Tooltip */
-        .tooltip {{
-            position: relative;
-            display: inline-block;
-            cursor: pointer;
-        }}
-        
-        .tooltip .tooltip-text {{
-            visibility: hidden;
-            width: 200px;
-            background-color: #333;
-            color: #fff;
-            text-align: center;
-            border-radius: 6px;
-            padding: 10px;
-            position: absolute;
-            z-index: 1;
-            bottom: 125%;
-            left: 50%;
-            margin-left: -100px;
-            opacity: 0;
-            transition: opacity 0.3s;
-            font-size: 0.8rem;
-        }}
-        
-        .tooltip:hover .tooltip-text {{
-            visibility: visible;
-            opacity: 0.95;
-        }}
-        
-        /* Separación de elementos */
-        .spacer {{
-            height: 1.5rem;
-        }}
-        
-        /* Animaciones */
-        @keyframes fadeIn {{
-            from {{ opacity: 0; transform: translateY(10px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
-        
-        .fadein {{
-            animation: fadeIn 0.5s ease forwards;
-        }}
-        
-        /* Texto en mensaje de chat */
-        .citation-highlight {{
-            background-color: #fff8e1;
-            padding: 0 3px;
-            border-radius: 3px;
-            font-weight: 500;
-        }}
-        
-        /* Código en las respuestas */
-        code {{
-            background-color: #f6f8fa;
-            border-radius: 4px;
-            padding: 2px 5px;
-            font-family: 'SFMono-Regular', Consolas, 'Liberation Mono', Menlo, monospace;
-            font-size: 0.9em;
-            color: #24292e;
-        }}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
 
-# ---------------- Prompt Base (sin cambios) -----------------
-custom_prompt = """
-Eres un asistente técnico inteligente especializado en documentación de ingeniería civil y proyectos de construcción.
-Tu objetivo es proporcionar respuestas precisas, técnicas y claras basadas únicamente en la documentación proporcionada.
+def static_url(name):
+    return f"app/static/{name}?v={static_assets[name][0]}"
+
+
+static_assets = get_static_assets()
+static_serving = st.get_option("server.enableStaticServing")
+if static_serving:
+    st.markdown(
+        "".join(f'<link rel="stylesheet" href="{static_url(name)}">'
+                for name in ("fonts.css", "styles.css") if name in static_assets),
+        unsafe_allow_html=True,
+    )
+elif "styles.css" in static_assets:
+    # Sin servidor de estáticos se incrusta la hoja (sin las fuentes, que enlazan a `static/fonts/`)
+    st.markdown(f"<style>{static_assets['styles.css'][1].decode('utf-8')}</style>", unsafe_allow_html=True)
+
+# ---------------- Encabezado custom -----------------
+with st.container():
+    logo = ""
+    if static_serving and "logo-64.webp" in static_assets:
+        logo = (
+            f'<img class="app-logo" src="{static_url("logo-64.webp")}" '
+            f'srcset="{static_url("logo-64.webp")} 1x, {static_url("logo-128.webp")} 2x" '
+            'width="64" height="64" alt="Caeys">'
+        )
+    st.markdown(
+        f"""
+        <div class="app-header">{logo}
+            <h1>🏗️ Asistente Técnico Inteligente para Construcción</h1>
+            <p>Tu consultor experto en normativas, especificaciones técnicas y documentación de edificación</p>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+startup.mark("header")  # Primer pintado: el encabezado ya está en el navegador
+
+# ---------------- Inicialización -----------------
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    """Motor RAG (clientes, índices y cachés) compartido por todas las sesiones."""
+    return RAGEngine(CONFIG)
+
+
+@st.cache_resource(show_spinner=False)
+def get_conversation_store():
+    """Conversaciones de todas las sesiones, fuera de `st.session_state`."""
+    return open_conversation_store(CONFIG)
+
 
-Recibirás:
-1. El historial de la conversación actual
-2. La última consulta (la actual) del usuario, la cual tienes que responder.
-3. Fragmentos relevantes de documentación técnica
+engine = get_engine()
+conversation_store = get_conversation_store()
+lexical_index = engine.lexical_index
+startup.mark("engine")
 
-Instrucciones:
-- Utiliza el historial de la conversación para entender el contexto de la consulta
-- Responde principalmente con información contenida en los fragmentos proporcionados
-- Usa terminología técnica apropiada para ingenieros
-- Si la documentación no contiene la información solicitada, indícalo claramente
-- Sé conciso pero completo en tus respuestas
-- Cita números de sección, especificaciones o normas técnicas cuando estén disponibles en los fragmentos
-- Cuando identifiques la respuesta, cita textualmente de qué parte de la documentación la has sacado.
 
-Tu estilo debe ser técnico, preciso y objetivo.
-"""
+@st.cache_resource(show_spinner=False)
+def get_feedback_log():
+    """Valoraciones 👍/👎 de todas las sesiones (JSONL append-only)."""
+    return FeedbackLog(CONFIG.feedback_log_path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_warmup():
+    """Respuestas precalculadas de las consultas de ejemplo.
+
+    Solo crea el trabajo: su hilo (que importa los SDK y conecta con el
+    índice) se arranca al final del script, tras el primer pintado.
+    """
+    if not CONFIG.warmup_enabled:
+        return None
+    return WarmupJob(
+        engine, CONFIG.example_queries, interval=CONFIG.warmup_interval,
+        check_interval=CONFIG.warmup_check_interval,
+    )
 
 # ---------------- Estado de sesión -----------------
-if "conversation" not in st.session_state:
-    st.session_state.conversation = []
-    
+# La conversación vive en `conversation_store`; la sesión solo guarda su ID
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    conversation_store.purge()
+
+if "fragments_html" not in st.session_state:
+    st.session_state.fragments_html = OrderedDict()  # posición → HTML de los fragmentos abiertos
+
+if "history_visible" not in st.session_state:
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+
+if "history_state" not in st.session_state:
+    st.session_state.history_state = {}
+
 if "show_welcome" not in st.session_state:
     st.session_state.show_welcome = True
 
+if "last_trace" not in st.session_state:
+    st.session_state.last_trace = None
+
+if "feedback" not in st.session_state:
+    st.session_state.feedback = {}  # posición de la respuesta → valoración enviada
+
+if "pending_query" not in st.session_state:
+    st.session_state.pending_query = None  # Consulta de ejemplo pulsada en la barra lateral
+
 # ---------------- Funciones auxiliares -----------------
 
-def display_fragments(fragments):
+def display_fragments(fragments, html=None):
     """Renderiza los pasajes recuperados en un contenedor elegante."""
     if not fragments:
         st.info("📚 No se encontraron fragmentos relevantes para esta consulta.")
         return
-    
-    # Ordenar fragmentos por score (descendente)
-    sorted_fragments = sorted(fragments, key=lambda x: x["score"], reverse=True)
-    
-    for frag in sorted_fragments:
-        # Determinar el color del badge según el score
-        if frag["score"] >= 0.8:
-            badge_class = "badge-success"
-            relevance_text = "Alta relevancia"
-        elif frag["score"] >= 0.6:
-            badge_class = "badge-warning"
-            relevance_text = "Relevancia media" 
-        else:
-            badge_class = "badge-danger"
-            relevance_text = "Baja relevancia"
-            
-        # Formatear el texto para mostrar
-        texto_formateado = frag['texto'].replace('\n', '<br>')
-        
-        st.markdown(
-            f"""
-            <div class="fragment-container fadein">
-                <div class="fragment-header">
-                    <div class="fragment-source">
-                        📄 {frag['documento']}
-                    </div>
-                    <div class="fragment-score">
-                        <span class="badge {badge_class}">{relevance_text} ({frag['score']:.0%})</span>
-                    </div>
-                </div>
-                <div class="fragment-content">{texto_formateado}</div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-        
+    st.markdown(html or build_fragments_html(fragments), unsafe_allow_html=True)
 
 
+def display_message_fragments(msg, key):
+    """Muestra los fragmentos de un mensaje solo cuando el usuario los despliega.
 
-def format_conversation_history(history):
-    return "\n\n".join(f"{m['role']}: {m['content']}" for m in history)
+    El HTML se construye la primera vez que se abren y se memoriza (solo
+    para la última página del historial), así que los re-runs posteriores
+    no lo regeneran.
+    """
+    if st.toggle("📚 Ver fragmentos de documentación recuperados", key=key):
+        memo = st.session_state.fragments_html
+        if key not in memo and msg.get("fragments"):
+            memo[key] = build_fragments_html(msg["fragments"])
+            while len(memo) > HISTORY_PAGE_SIZE:
+                memo.popitem(last=False)
+        display_fragments(msg.get("fragments"), memo.get(key))
 
 
-def display_typing_animation():
-    """Muestra una animación de escritura para la respuesta del asistente."""
-    with st.empty():
-        for i in range(5):
-            dots = "." * (i % 4)
-            st.write(f"Generando respuesta{dots}")
-            time.sleep(0.3)
+def show_older_messages():
+    st.session_state.history_visible += HISTORY_PAGE_SIZE
 
 
-# ---------------- Encabezado custom -----------------
-with st.container():
-    st.markdown(
-        """
-        <div class="app-header">
-            <h1>🏗️ Asistente Técnico Inteligente para Construcción</h1>
-            <p>Tu consultor experto en normativas, especificaciones técnicas y documentación de edificación</p>
-        </div>
-        """,
-        unsafe_allow_html=True,
+def ask_example(query):
+    st.session_state.pending_query = query
+
+
+def precomputed_answer(query, first_turn):
+    """Respuesta precalculada de una consulta de ejemplo, solo sin historial y con el ámbito por defecto.
+
+    Se calcularon sin conversación previa: con historial la pregunta puede
+    depender de los turnos anteriores y la respuesta sería otra.
+    """
+    warmup = get_warmup()
+    default_scope = (
+        first_turn
+        and (lexical_index is None or st.session_state.get("search_mode", "Híbrida") == "Híbrida")
+        and st.session_state.get("search_family", "Automático") == "Automático"
+        and not st.session_state.get("pinned_documents")
     )
+    return warmup.get(query) if warmup is not None and default_scope else None
+
+
+def send_feedback(position, accepted):
+    """Registra la valoración de la respuesta en `position` junto a su consulta."""
+    session_id = st.session_state.session_id
+    messages = {msg["position"]: msg for msg in conversation_store.messages(session_id, start=position - 1,
+                                                                             end=position + 1)}
+    answer = messages.get(position)
+    if answer is None:
+        return  # Ya descartada por la retención del historial
+    question = messages.get(position - 1, {})
+    get_feedback_log().record(accepted, question.get("content", ""), answer, session_id=session_id, config=CONFIG)
+    st.session_state.feedback[position] = accepted
+
+
+def display_feedback(position):
+    """Botones 👍/👎 bajo una respuesta (o la valoración ya enviada)."""
+    if position in st.session_state.feedback:
+        st.caption("Gracias por tu valoración " + ("👍" if st.session_state.feedback[position] else "👎"))
+        return
+    feedback_col1, feedback_col2, feedback_col3 = st.columns([1, 1, 3])
+    with feedback_col1:
+        st.button("👍 Útil", key=f"useful_{position}", on_click=send_feedback, args=(position, True))
+    with feedback_col2:
+        st.button("👎 No útil", key=f"not_useful_{position}", on_click=send_feedback, args=(position, False))
+
+
+def save_and_display_answer(session_id, assistant_message):
+    """Guarda la respuesta y pinta bajo ella tiempos, fragmentos y valoración."""
+    assistant_position = conversation_store.append(session_id, assistant_message)
+
+    # Mostrar tiempos (la respuesta ya se ha pintado)
+    display_timings(assistant_message["timings"])
+
+    # Mostrar fragmentos (se construyen solo si se despliegan)
+    display_message_fragments(assistant_message, key=f"fragments_{assistant_position}")
+
+    # Preguntar por valoración (opcional)
+    display_feedback(assistant_position)
+
+    # Notificación de éxito
+    st.toast("✅ Respuesta generada con éxito", icon="🤖")
+
+
+def render_streamed_response(chunks, tracker):
+    """Pinta la respuesta según llegan los fragmentos y devuelve el texto final.
+
+    Si el modelo bloquea la respuesta o falla a mitad de la generación se
+    conserva el texto recibido hasta ese momento junto con un aviso, y se
+    indica que la respuesta no está completa.
+    """
+    placeholder = st.empty()
+    received = []
+    notice = None
+    try:
+        for chunk in chunks:
+            if not received:
+                tracker.mark("first_token")
+            received.append(chunk)
+            placeholder.markdown("".join(received) + "▌")
+    except GenerationBlocked as exc:
+        notice = f"⚠️ La respuesta se ha interrumpido por los filtros de seguridad del modelo ({exc.reason})."
+    except GenerationTimeout:
+        notice = "⚠️ El modelo no ha completado la respuesta a tiempo. Inténtalo de nuevo en unos segundos."
+    except Exception as exc:
+        notice = f"⚠️ Se produjo un error al generar la respuesta: {exc}"
+
+    response_text = "".join(received)
+    if notice:
+        response_text = f"{response_text}\n\n{notice}" if response_text else notice
+    placeholder.markdown(response_text)
+    tracker.mark("done")
+    return response_text, notice is None
+
+
+def display_timings(summary):
+    """Muestra los tiempos medidos de cada etapa bajo la respuesta."""
+    if summary:
+        st.caption(f"⏱️ {summary}")
+
+
+def display_debug_panel(trace):
+    """Traza del último turno y percentiles recientes del proceso."""
+    if trace:
+        st.caption("Último turno")
+        st.json(
+            {key: trace[key] for key in ("spans", "tokens", "cache", "fragments", "errors")},
+            expanded=False,
+        )
+    percentiles = engine.tracer.percentiles()
+    if percentiles:
+        st.caption("Latencia reciente por etapa (p50 / p95)")
+        st.markdown("\n".join(
+            f"- `{stage}`: {p50 * 1000:.0f} ms / {p95 * 1000:.0f} ms"
+            for stage, (p50, p95) in sorted(percentiles.items())
+        ))
+    st.caption(f"Turnos registrados: {engine.tracer.turns}")
+    if engine.tracer.turns:
+        saved = engine.tracer.tokens.get("cached", 0) + engine.tracer.tokens.get("deduplicated", 0)
+        st.caption(f"Tokens de entrada ahorrados: {saved / engine.tracer.turns:.0f} por turno")
+    tier_stats = engine.tracer.tier_stats()
+    if tier_stats:
+        st.caption(f"Niveles de modelo (total p50 / p95) · {engine.tracer.hedged} respaldos por lentitud")
+        st.markdown("\n".join(
+            f"- {TIER_LABELS.get(tier, tier)}: {stats['turns']} respuestas · "
+            f"{stats['latency'][0] * 1000:.0f} ms / {stats['latency'][1] * 1000:.0f} ms · "
+            f"~{stats['prompt_tokens']:.0f} + {stats['response_tokens']:.0f} tokens"
+            for tier, stats in tier_stats.items()
+        ))
+    if engine.tracer.startup:
+        startup_report = engine.tracer.startup
+        st.caption(
+            f"Arranque ({startup_report['version']}): primer pintado en "
+            f"{startup_report['first_paint'] * 1000:.0f} ms · "
+            + " · ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in startup_report["phases"].items())
+        )
+
 
 # ---------------- Sidebar -----------------
 with st.sidebar:
@@ -457,27 +359,100 @@ with st.sidebar:
         </div>
     """, unsafe_allow_html=True)
     
+    st.radio(
+        "Modo de búsqueda",
+        list(SEARCH_MODES) if lexical_index is not None else ["Vectorial"],
+        key="search_mode",
+        horizontal=True,
+        help="La búsqueda híbrida combina similitud semántica con coincidencias exactas "
+             "de normas y artículos (p. ej. «DB-SUA 4.2»).",
+    )
+
+    with st.expander("🎯 Ámbito de búsqueda"):
+        family_labels = {"Automático": None}
+        family_labels.update({label: key for key, label in engine.router.labels.items()})
+        st.selectbox(
+            "Familia normativa",
+            list(family_labels),
+            key="search_family",
+            help="En automático se detecta por la consulta (p. ej. «resistencia al fuego» → DB-SI).",
+        )
+        st.multiselect(
+            "📌 Fijar documentos",
+            engine.document_names(),
+            key="pinned_documents",
+            help="Busca solo en los documentos seleccionados.",
+        )
+
     st.subheader("🔍 Ejemplos de consultas")
     
-    example_queries = [
-        "¿Cuáles son los requisitos mínimos de resistencia al fuego en edificios residenciales?",
-        "¿Qué normativa regula la instalación de sistemas de ventilación en sótanos?",
-        "Explica las especificaciones para cimentaciones en terrenos arcillosos",
-        "¿Cuáles son las dimensiones mínimas para escaleras de evacuación?",
-    ]
-    
-    for query in example_queries:
-        if st.button(f"📝 {query}", use_container_width=True, key=f"btn_{hash(query)}"):
-            if "conversation" in st.session_state:
-                st.session_state.conversation.append({"role": "Usuario", "content": query})
-                st.experimental_rerun()
+    # Se responden como una consulta escrita (al instante si ya están precalculadas)
+    for position, query in enumerate(CONFIG.example_queries):
+        st.button(
+            f"📝 {query}", use_container_width=True, key=f"example_{position}",
+            on_click=ask_example, args=(query,),
+        )
+
+    with st.expander("📊 Rendimiento"):
+        emb_stats = engine.embedding_cache.stats()
+        st.caption(
+            f"Caché de embeddings: {emb_stats['hits']} aciertos "
+            f"({emb_stats['disk_hits']} desde disco) · {emb_stats['misses']} fallos"
+        )
+        ans_stats = engine.answer_cache.stats()
+        st.caption(
+            f"Caché de respuestas: {ans_stats['hits']} aciertos · "
+            f"{ans_stats['misses']} fallos · {ans_stats['size']} entradas"
+        )
+        ret_stats = engine.retrieval_cache.stats()
+        st.caption(
+            f"Caché de búsquedas: {ret_stats['hits']} aciertos · {ret_stats['misses']} fallos "
+            f"({ret_stats['hit_rate']:.0%}) · {ret_stats['size']} entradas"
+        )
+        text_stats = engine.fragment_cache.stats()
+        st.caption(
+            f"Texto de fragmentos: {text_stats['hits']} en memoria · {text_stats['corpus_hits']} del corpus "
+            f"local · {text_stats['remote_hits']} del índice"
+        )
+        scheduler_stats = engine.scheduler.stats()
+        retries = sum(stats["retries"] for name, stats in scheduler_stats.items() if name != "admission")
+        st.caption(
+            f"Cola: {scheduler_stats['admission']['active']} consultas en curso · "
+            f"{scheduler_stats['admission']['waiting']} en espera · {retries} reintentos"
+        )
+        if engine.context_cache is not None:
+            context_stats = engine.context_cache.stats()
+            st.caption(
+                f"Caché de contexto: {context_stats['fragments']} fragmentos de referencia "
+                f"(~{context_stats['tokens']} tokens)" if context_stats["active"] else
+                "Caché de contexto: inactiva (aún no hay suficientes fragmentos citados)"
+            )
+        warmup = get_warmup()
+        if warmup is not None:
+            warmup_stats = warmup.stats()
+            refreshed = (
+                f" · refrescados a las {datetime.fromtimestamp(warmup_stats['refreshed_at']):%H:%M}"
+                if warmup_stats["refreshed_at"] else ""
+            )
+            st.caption(
+                f"Ejemplos precalculados: {warmup_stats['ready']}/{warmup_stats['total']}{refreshed}"
+            )
+        if st.button("🔄 Vaciar cachés de búsqueda", use_container_width=True):
+            engine.retrieval_cache.invalidate()
+            engine.answer_cache.invalidate()
+            engine.fragment_cache.invalidate()
+            if warmup is not None:
+                warmup.invalidate()
+
+    if st.toggle("🐞 Panel de depuración", key="debug_panel"):
+        display_debug_panel(st.session_state.last_trace)
 
     st.divider()
     
     # Mostrar la versión y copyright
     col1, col2 = st.columns(2)
     with col1:
-        st.caption("Versión: Demo Inicial")
+        st.caption(f"Versión: {APP_VERSION}")
     with col2:
         st.caption("{:%d-%m-%Y}".format(datetime.utcnow()))
     
@@ -498,24 +473,41 @@ if st.session_state.show_welcome:
     st.session_state.show_welcome = False
 
 # ---------------- Mostrar historial -----------------
-for msg in st.session_state.conversation:
+# Solo se pintan los últimos mensajes; los anteriores se cargan bajo demanda
+session_id = st.session_state.session_id
+message_count = conversation_store.count(session_id)
+first_kept = conversation_store.offset(session_id)
+first_visible = max(first_kept, message_count - st.session_state.history_visible)
+if first_visible > first_kept:
+    st.button(
+        f"⬆️ Mostrar mensajes anteriores ({first_visible - first_kept} ocultos)",
+        on_click=show_older_messages,
+        use_container_width=True,
+    )
+
+for msg in conversation_store.messages(session_id, start=first_visible):
+    position = msg["position"]
     role = "assistant" if msg["role"] == "Asistente" else "user"
     
     with st.chat_message(role):
         st.markdown(msg["content"])
+        if role == "assistant":
+            display_timings(msg.get("timings"))
         if role == "assistant" and "fragments" in msg:
-            with st.expander("📚 Ver fragmentos de documentación recuperados"):
-                display_fragments(msg["fragments"])
+            display_message_fragments(msg, key=f"fragments_{position}")
+        if role == "assistant":
+            display_feedback(position)
 
 # ---------------- Entrada del usuario -----------------
-user_message = st.chat_input("Escribe tu consulta técnica aquí...")
+user_message = st.chat_input("Escribe tu consulta técnica aquí...") or st.session_state.pending_query
+st.session_state.pending_query = None
 
 if user_message:
     # Ocultar el mensaje de bienvenida cuando se inicia la conversación
     st.session_state.show_welcome = False
     
     # Añadir mensaje del usuario al historial
-    st.session_state.conversation.append({"role": "Usuario", "content": user_message})
+    user_position = conversation_store.append(session_id, {"role": "Usuario", "content": user_message})
     
     # Mostrar mensaje del usuario
     with st.chat_message("user"):
@@ -523,110 +515,113 @@ if user_message:
 
     # Mostrar el spinner y respuesta
     with st.chat_message("assistant"):
-        with st.spinner("🔎 Buscando en la documentación técnica..."):
-            # Simular tiempos de procesamiento para mejorar la experiencia de usuario
-            progress_text = "Analizando documentación técnica..."
-            progress_bar = st.progress(0)
-            
-            # Simular progreso
-            for i in range(101):
-                if i < 30:
-                    # Primera fase - Procesando consulta
-                    progress_text = "Procesando consulta..."
-                elif i < 60:
-                    # Segunda fase - Buscando documentos relevantes
-                    progress_text = "Buscando documentos relevantes..."
-                elif i < 90:
-                    # Tercera fase - Generando respuesta
-                    progress_text = "Generando respuesta técnica..."
-                else:
-                    # Fase final
-                    progress_text = "Finalizando..."
-                    
-                if i % 10 == 0:
-                    progress_bar.progress(i, text=progress_text)
-                    time.sleep(0.05)
-            
-            progress_bar.empty()
-            
-            # (lógica de embedding / búsqueda SIN CAMBIOS)
-            embed_result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=user_message,
-            )
-            query_vector = embed_result.get("embedding")
-
-            if not query_vector:
-                st.error("Error al generar el vector de embedding de la consulta.")
-            else:
-                query_response = index.query(vector=query_vector, top_k=10, include_metadata=True)
-                retrieved_segments = []
-                for match in query_response.get("matches", []):
-                    score = match.get("score", 0)
-                    if score >= MIN_SIMILARITY_SCORE:
-                        md = match.get("metadata", {})
-                        texto = md.get("texto", "")
-                        doc = md.get("documento", "Documento sin nombre")
-                        if texto:
-                            retrieved_segments.append({
-                                "texto": texto,
-                                "documento": doc,
-                                "score": score,
-                            })
-
-                retrieved_context = "\n---\n".join([
-                    f"[{seg['documento']}]: {seg['texto']}" for seg in retrieved_segments
-                ])
-                history_for_prompt = st.session_state.conversation[:-1] if len(st.session_state.conversation) > 1 else []
-                formatted_history = format_conversation_history(history_for_prompt)
-
-                full_prompt = (
-                    f"{custom_prompt}\n\n"
-                    f"📜 **Historial de la conversación:**\n{formatted_history}\n"
-                    f"📚 **Fragmentos de documentación relevantes:**\n{retrieved_context}\n\n"
-                    f"👤 **Consulta actual del usuario:** {user_message}"
-                )
-
-                # Mostrar animación de "escribiendo..."
-                typing_placeholder = st.empty()
-                for i in range(3):
-                    dots = "." * (i % 4)
-                    typing_placeholder.markdown(f"*Redactando respuesta{dots}*")
-                    time.sleep(0.4)
-                typing_placeholder.empty()
-                
-                # Generar respuesta real
-                response = model.generate_content(full_prompt)
-                response_text = response.candidates[0].content.parts[0].text
-                
-                # Formatear la respuesta para resaltar las citas
-                formatted_response = response_text
-                
-                # Guardar respuesta y fragmentos
-                st.session_state.conversation.append(
-                    {
-                        "role": "Asistente",
-                        "content": response_text,
-                        "fragments": retrieved_segments,
-                    }
-                )
-                
-                # Mostrar respuesta
-                st.markdown(formatted_response)
-                
-                # Mostrar fragmentos en un expander
-                with st.expander("📚 Ver fragmentos de documentación recuperados"):
-                    display_fragments(retrieved_segments)
-                
-                # Preguntar por valoración (opcional)
-                feedback_col1, feedback_col2, feedback_col3 = st.columns([1, 1, 3])
-                with feedback_col1:
-                    st.button("👍 Útil", key=f"useful_{len(st.session_state.conversation)}")
-                with feedback_col2:
-                    st.button("👎 No útil", key=f"not_useful_{len(st.session_state.conversation)}")
-                
-                # Notificación de éxito
-                st.toast("✅ Respuesta generada con éxito", icon="🤖")
+        precomputed = precomputed_answer(user_message, first_turn=user_position == 0)
+        if precomputed is not None:
+            # Consulta de ejemplo ya respondida en segundo plano: se sirve al instante
+            st.markdown(precomputed["response"])
+            save_and_display_answer(session_id, {
+                "role": "Asistente",
+                "content": precomputed["response"],
+                "fragments": precomputed["fragments"],
+                "timings": f"⚡ respuesta precalculada a las {datetime.fromtimestamp(precomputed['refreshed_at']):%H:%M}"
+                           f" · ~{precomputed['prompt_tokens']} tokens de prompt",
+                "prompt_tokens": precomputed["prompt_tokens"],
+                "history_tokens": precomputed["history_tokens"],
+                "spans": precomputed["trace"]["spans"],
+                "tokens": precomputed["trace"]["tokens"],
+                "search_mode": SEARCH_HYBRID,
+                "model_tier": precomputed["model_tier"],
+            })
+        else:
+            queue_notice = st.empty()
+
+            def show_queue_position(position):
+                queue_notice.info(f"⏳ Hay mucha demanda en este momento: tu consulta es la n.º {position} en la cola.")
+
+            try:
+                # Turnos simultáneos acotados: si hay cola, se muestra la posición
+                with engine.admit(session_id, on_wait=show_queue_position):
+                    queue_notice.empty()
+                    with st.spinner("🔎 Buscando en la documentación técnica..."):
+                        # El progreso avanza con los eventos reales del pipeline
+                        progress_bar = st.progress(0, text="Analizando documentación técnica...")
+                        tracker = StageTracker(
+                            on_stage=lambda stage: progress_bar.progress(stage.percent, text=stage.label)
+                        )
+
+                        search_mode = SEARCH_MODES[st.session_state.get("search_mode", "Híbrida")]
+                        # Solo el texto de los mensajes anteriores: los fragmentos no van al prompt
+                        history_for_prompt = conversation_store.messages(
+                            session_id, end=user_position, fragments=False
+                        )
+
+                        try:
+                            turn = engine.prepare(
+                                user_message,
+                                history_for_prompt,
+                                st.session_state.history_state,
+                                search_mode=search_mode,
+                                tracker=tracker,
+                                history_offset=history_for_prompt[0]["position"] if history_for_prompt else 0,
+                                pinned_documents=st.session_state.get("pinned_documents"),
+                                family=family_labels[st.session_state.get("search_family", "Automático")],
+                            )
+                        except EmbeddingError as exc:
+                            turn = None
+                            progress_bar.empty()
+                            st.error(str(exc))
+
+                        if turn is not None:
+                            st.session_state.history_state = turn.history_state
+                            for warning in turn.warnings:
+                                st.warning(f"⚠️ {warning}")
+
+                            if turn.cached_answer is not None:
+                                # Respuesta casi idéntica ya generada: se muestra al instante
+                                response_text = turn.cached_answer["response"]
+                                tracker.mark("first_token")
+                                st.markdown(response_text)
+                                tracker.mark("done")
+                                completed = True
+                            else:
+                                # Generar respuesta real (en streaming si está activado)
+                                response_text, completed = render_streamed_response(engine.generate(turn), tracker)
+                            st.session_state.last_trace = engine.finish(turn, response_text, completed)
+                            retrieved_segments = turn.fragments
+                            prompt_tokens = turn.prompt_tokens
+                            history_tokens = turn.history_tokens
+                            progress_bar.empty()
+                            timings_summary = f"{tracker.summary()} · ~{prompt_tokens} tokens de prompt"
+                            if turn.cached_answer is not None:
+                                timings_summary += " · ⚡ respuesta desde caché"
+                            if turn.route.families or turn.route.pinned:
+                                timings_summary += f" · 🎯 {engine.router.describe(turn.route)}"
+                            if turn.served_tier is not None:
+                                tier_name = turn.served_tier.name
+                                timings_summary += f" · 🧠 {TIER_LABELS.get(tier_name, tier_name)}"
+                                if turn.served_tier != turn.tier:
+                                    timings_summary += " (respaldo)"
+                            tokens_saved = st.session_state.last_trace.get("tokens_saved", 0)
+                            if tokens_saved:
+                                timings_summary += f" · ♻️ {tokens_saved} tokens reutilizados"
+
+                            # Guardar respuesta y fragmentos
+                            assistant_message = {
+                                "role": "Asistente",
+                                "content": response_text,
+                                "fragments": retrieved_segments,
+                                "timings": timings_summary,
+                                "prompt_tokens": prompt_tokens,
+                                "history_tokens": history_tokens,
+                                "spans": st.session_state.last_trace["spans"],
+                                "tokens": st.session_state.last_trace["tokens"],
+                                "search_mode": search_mode,
+                                "model_tier": turn.served_tier.name if turn.served_tier is not None else None,
+                            }
+                            save_and_display_answer(session_id, assistant_message)
+            except QueueTimeout:
+                queue_notice.empty()
+                st.error("⚠️ El asistente está saturado en este momento. Inténtalo de nuevo en unos segundos.")
 
 # ---------------- Footer -----------------
 st.markdown(
@@ -639,3 +634,23 @@ st.markdown(
 )
 
 
+
+# ---------------- Tiempos de arranque -----------------
+startup.mark("render")
+
+
+@st.cache_resource(show_spinner=False)
+def get_startup_report():
+    """Tiempos del primer run del proceso (se registran una sola vez)."""
+    report = startup.report(first_paint=round(startup.marks["header"], 6))
+    append_startup_report(CONFIG.startup_log_path, report)
+    engine.tracer.record_startup(report)
+    return report
+
+
+get_startup_report()
+
+# Tras el primer pintado: precalcula las consultas de ejemplo en segundo plano
+warmup_job = get_warmup()
+if warmup_job is not None:
+    warmup_job.start()
@@ -0,0 +1,3 @@
+"""Componentes del pipeline RAG del Asistente Técnico de Edificación."""
+
+APP_VERSION = "Demo Inicial"  # Se muestra en la barra lateral y acompaña a los informes de arranque
@@ -0,0 +1,65 @@
+# --------------------------------------------------
+# Consultas por línea de comandos (sin interfaz)
+# --------------------------------------------------
+#    python -m rag "¿Dimensiones mínimas de escaleras de evacuación?"
+#    python -m rag --file preguntas.txt --concurrency 4 --output respuestas.jsonl
+# --------------------------------------------------
+
+import argparse
+import json
+import sys
+
+from rag.engine import SEARCH_HYBRID, SEARCH_LEXICAL, SEARCH_VECTOR, RAGConfig, RAGEngine
+from rag.settings import load_secrets
+
+
+def read_queries(path):
+    """Lee preguntas de un fichero de texto (una por línea) o JSONL con `query`."""
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            yield json.loads(line)["query"] if line.startswith("{") else line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el asistente técnico sin interfaz.")
+    parser.add_argument("queries", nargs="*", help="Preguntas a responder")
+    parser.add_argument("--file", help="Fichero con preguntas (texto o JSONL)")
+    parser.add_argument("--output", help="Guardar los resultados en JSONL")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=(SEARCH_HYBRID, SEARCH_VECTOR, SEARCH_LEXICAL), default=SEARCH_HYBRID)
+    parser.add_argument("--backend", choices=("pinecone", "local"), default=None)
+    args = parser.parse_args(argv)
+
+    queries = list(args.queries)
+    if args.file:
+        queries.extend(read_queries(args.file))
+    if not queries:
+        parser.error("indica al menos una pregunta o --file")
+
+    overrides = {"retriever_backend": args.backend} if args.backend else {}
+    engine = RAGEngine(RAGConfig.from_secrets(load_secrets(), **overrides))
+    results = engine.answer_many(queries, max_workers=args.concurrency, search_mode=args.mode)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for result in results:
+            if output is not None:
+                output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                continue
+            print(f"❓ {result['query']}")
+            print(result.get("response") or f"⚠️ {result.get('error')}")
+            for fragment in result.get("fragments", []):
+                score = fragment.get("score")
+                print(f"   📄 {fragment['documento']} ({f'{score:.0%}' if score is not None else 'términos'})")
+            print()
+    finally:
+        if output is not None:
+            output.close()
+    return 0 if all(result.get("completed") for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
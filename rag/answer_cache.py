@@ -0,0 +1,94 @@
+# --------------------------------------------------
+# Caché semántica de respuestas
+# --------------------------------------------------
+# 👉 Reutiliza la respuesta de una pregunta anterior casi idéntica: mismo
+#    significado (similitud coseno por encima del umbral) y mismos
+#    fragmentos recuperados. Solo se aplica a preguntas sin historial.
+# --------------------------------------------------
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_vector(vector):
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else list(vector)
+
+
+def cosine(unit_a, unit_b):
+    """Similitud coseno entre dos vectores ya normalizados."""
+    return sum(a * b for a, b in zip(unit_a, unit_b))
+
+
+class SemanticAnswerCache:
+    """Respuestas indexadas por el embedding de la pregunta."""
+
+    def __init__(self, threshold=0.95, ttl=6 * 3600, capacity=256, clock=time.time):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._index_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, index_version):
+        """Vacía la caché si el índice ha cambiado desde que se llenó."""
+        if index_version is not None and index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _purge_expired(self):
+        now = self.clock()
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, vector, fragment_ids, index_version=None):
+        """Devuelve la entrada más parecida que cumpla umbral y fragmentos, o None."""
+        unit = normalize_vector(vector)
+        wanted = frozenset(fragment_ids)
+        with self._lock:
+            self._check_version(index_version)
+            self._purge_expired()
+            best_key, best_score = None, self.threshold
+            for key, entry in self._entries.items():
+                if entry["fragment_ids"] != wanted:
+                    continue
+                score = cosine(unit, entry["vector"])
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return dict(self._entries[best_key], similarity=best_score)
+
+    def store(self, vector, fragment_ids, response, fragments, index_version=None):
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[self._next_id] = {
+                "vector": normalize_vector(vector),
+                "fragment_ids": frozenset(fragment_ids),
+                "response": response,
+                "fragments": fragments,
+                "created": self.clock(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Descarta todas las respuestas (p. ej. tras re-indexar documentos)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
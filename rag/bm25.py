@@ -0,0 +1,153 @@
+# --------------------------------------------------
+# Índice léxico BM25 en memoria y fusión híbrida
+# --------------------------------------------------
+# 👉 Las consultas normativas dependen de identificadores exactos
+#    ("DB-SI", "SUA 4.2", números de artículo) que los embeddings densos
+#    recuperan mal. Este índice invertido compacto (arrays NumPy, IDF
+#    precalculado) resuelve esas búsquedas en menos de un milisegundo y se
+#    fusiona con la búsqueda vectorial mediante Reciprocal Rank Fusion.
+# --------------------------------------------------
+
+import re
+import unicodedata
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+# Palabras vacías frecuentes en la normativa que no aportan al ranking
+STOPWORDS = frozenset(
+    "a al con de del el en es la las lo los o para por que se su sus un una y".split()
+)
+
+RRF_K = 60
+
+
+def tokenize(text):
+    """Tokens normalizados; los identificadores compuestos se indexan también por partes."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.split(r"[.\-/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Índice invertido en formato CSR (offsets + doc_ids + frecuencias)."""
+
+    def __init__(self, ids, metadata, vocabulary, offsets, postings, frequencies, doc_lengths,
+                 k1=1.2, b=0.75):
+        self.ids = ids
+        self.metadata = metadata
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n_docs = len(ids)
+        doc_freq = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        average = doc_lengths.mean() if n_docs else 1.0
+        # Parte del denominador de BM25 que solo depende del documento
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / average)).astype(np.float32)
+
+    @classmethod
+    def build(cls, fragments, **params):
+        """Construye el índice a partir de `(id, metadata)` con texto/documento."""
+        ids, metadata, term_docs = [], [], {}
+        lengths = []
+        for doc_position, (fid, md) in enumerate(fragments):
+            tokens = tokenize(f"{md.get('documento', '')} {md.get('texto', '')}")
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_docs.setdefault(token, []).append((doc_position, count))
+            ids.append(fid)
+            metadata.append(md)
+            lengths.append(len(tokens))
+
+        vocabulary = {}
+        offsets = [0]
+        postings, frequencies = [], []
+        for term_id, (token, docs) in enumerate(term_docs.items()):
+            vocabulary[token] = term_id
+            postings.extend(doc for doc, _ in docs)
+            frequencies.extend(count for _, count in docs)
+            offsets.append(len(postings))
+        return cls(
+            ids,
+            metadata,
+            vocabulary,
+            np.asarray(offsets, dtype=np.int64),
+            np.asarray(postings, dtype=np.int32),
+            np.asarray(frequencies, dtype=np.float32),
+            np.asarray(lengths, dtype=np.float32),
+            **params,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def term_idf(self, token):
+        """IDF de un término (0 si no aparece en el corpus)."""
+        term_id = self.vocabulary.get(token)
+        return float(self.idf[term_id]) if term_id is not None else 0.0
+
+    def search(self, query, top_k=10):
+        """Top-k por BM25 con el formato `{"matches": [...]}` del índice vectorial."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return {"matches": []}
+        k = min(top_k, len(hits))
+        best = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return {
+            "matches": [
+                {"id": self.ids[row], "score": float(scores[row]), "metadata": self.metadata[row]}
+                for row in best
+            ]
+        }
+
+
+def reciprocal_rank_fusion(vector_response, lexical_response, top_k, k=RRF_K):
+    """Fusiona búsquedas vectorial y léxica por posición (RRF).
+
+    `score` es la similitud coseno y solo la tienen las coincidencias de la
+    búsqueda vectorial; las léxicas guardan su puntuación BM25 en `bm25`
+    (no es comparable con la similitud). `sources` indica de qué búsquedas
+    procede cada una.
+    """
+    fused = {}
+    for source, response in (("vector", vector_response), ("lexical", lexical_response)):
+        matches = (response or {}).get("matches", [])
+        for rank, match in enumerate(matches):
+            entry = fused.setdefault(match["id"], {
+                "id": match["id"],
+                "metadata": match.get("metadata", {}),
+                "sources": [],
+                "rrf": 0.0,
+            })
+            entry["rrf"] += 1.0 / (k + rank + 1)
+            entry["sources"].append(source)
+            entry["score" if source == "vector" else "bm25"] = match.get("score", 0)
+    ranked = sorted(fused.values(), key=lambda entry: entry["rrf"], reverse=True)
+    return {"matches": ranked[:top_k]}
@@ -0,0 +1,139 @@
+# --------------------------------------------------
+# Clientes compartidos de Gemini y Pinecone
+# --------------------------------------------------
+# 👉 Streamlit re-ejecuta el script en cada interacción; estos clientes se
+#    crean una sola vez por proceso y se comparten entre sesiones, de modo
+#    que las conexiones HTTP/gRPC (y sus handshakes TLS) se reutilizan.
+# --------------------------------------------------
+
+import datetime
+import threading
+import time
+
+import google.generativeai as genai
+from pinecone import Pinecone
+from urllib3.exceptions import HTTPError as TransportError
+
+from rag.scheduler import http_status
+
+
+def is_connection_error(exc):
+    """¿Se ha caído la conexión? Las respuestas HTTP de error (429, 4xx, 5xx) no cuentan."""
+    if http_status(exc) is not None:
+        return False
+    return isinstance(exc, (ConnectionError, TimeoutError, TransportError))
+
+
+class Clients:
+    """Clientes de Gemini y Pinecone reutilizados por todo el proceso."""
+
+    def __init__(self, genai_api_key, pinecone_api_key, index_name,
+                 pool_threads=4, connection_pool_maxsize=16, health_check_interval=300):
+        self.index_name = index_name
+        self.pool_threads = pool_threads
+        self.connection_pool_maxsize = connection_pool_maxsize
+        self.health_check_interval = health_check_interval
+        self._pinecone_api_key = pinecone_api_key
+        self._lock = threading.Lock()
+        self._models = {}
+        self._pc = None
+        self._index = None
+        self._last_health_check = 0.0
+        self.index_version = None
+
+        # genai mantiene un único canal gRPC persistente tras configurarse.
+        # Pinecone se conecta en el primer uso (no hace falta con el índice local).
+        genai.configure(api_key=genai_api_key)
+
+    # ---------- Gemini ----------
+    def model(self, name, **kwargs):
+        """Devuelve (y memoriza) el modelo generativo con esa configuración."""
+        key = (name, repr(sorted(kwargs.items())))
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(name, **kwargs)
+            return self._models[key]
+
+    def cached_model(self, name, system_instruction, content, ttl):
+        """Crea una caché de contexto en Gemini y devuelve (modelo que la usa, caché)."""
+        from google.generativeai import caching  # Solo en versiones recientes del SDK
+
+        cache = caching.CachedContent.create(
+            model=name,
+            system_instruction=system_instruction,
+            contents=[content],
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return genai.GenerativeModel.from_cached_content(cached_content=cache), cache
+
+    @staticmethod
+    def delete_cached(cache):
+        cache.delete()
+
+    def embed(self, text, model):
+        """Calcula el embedding de un texto con el modelo indicado."""
+        return genai.embed_content(model=model, content=text)
+
+    # ---------- Pinecone ----------
+    def _connect(self):
+        """(Re)crea el cliente y el índice con su pool de conexiones keep-alive."""
+        self._pc = Pinecone(api_key=self._pinecone_api_key, pool_threads=self.pool_threads)
+        self._index = self._pc.Index(
+            self.index_name,
+            pool_threads=self.pool_threads,
+            connection_pool_maxsize=self.connection_pool_maxsize,
+        )
+        self._last_health_check = time.monotonic()
+
+    def reconnect(self):
+        with self._lock:
+            self._connect()
+
+    def check_health(self):
+        """Comprueba el índice y reconecta si la conexión ya no responde.
+
+        De paso actualiza `index_version` (número total de vectores), que las
+        cachés usan para detectar que el índice ha cambiado.
+        """
+        try:
+            stats = self._index.describe_index_stats()
+        except Exception as exc:
+            if is_connection_error(exc):
+                self.reconnect()
+            return False
+        self.index_version = getattr(stats, "total_vector_count", None)
+        self._last_health_check = time.monotonic()
+        return True
+
+    @property
+    def index(self):
+        """Índice de Pinecone, conectado al primer uso y verificado periódicamente."""
+        if self._index is None:
+            self.reconnect()
+            self.check_health()
+        elif time.monotonic() - self._last_health_check > self.health_check_interval:
+            self.check_health()
+        return self._index
+
+    def query(self, **kwargs):
+        """Consulta el índice reconectando una vez si la conexión ha caído.
+
+        Los errores HTTP (cuota, 4xx, 5xx) se propagan: los reintenta el planificador.
+        """
+        try:
+            return self.index.query(**kwargs)
+        except Exception as exc:
+            if not is_connection_error(exc):
+                raise
+            self.reconnect()
+            return self._index.query(**kwargs)
+
+    def fetch(self, **kwargs):
+        """Recupera vectores por ID reconectando una vez si la conexión ha caído."""
+        try:
+            return self.index.fetch(**kwargs)
+        except Exception as exc:
+            if not is_connection_error(exc):
+                raise
+            self.reconnect()
+            return self._index.fetch(**kwargs)
@@ -0,0 +1,124 @@
+# --------------------------------------------------
+# Ejecución concurrente de llamadas de red independientes
+# --------------------------------------------------
+# 👉 Un pool de hilos compartido por el proceso permite solapar trabajo
+#    independiente (embedding + historial, búsquedas en varios namespaces,
+#    búsqueda léxica + vectorial) para que la latencia dependa de la
+#    llamada más lenta y no de la suma de todas.
+# --------------------------------------------------
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_MAX_WORKERS = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=DEFAULT_MAX_WORKERS):
+    """Pool de hilos único del proceso (se crea en el primer uso)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag")
+        return _executor
+
+
+class TaskTimeout(Exception):
+    """La tarea no terminó dentro de su plazo."""
+
+
+class TaskResult:
+    """Resultado de una tarea: valor o error, y segundos empleados."""
+
+    __slots__ = ("value", "error", "elapsed")
+
+    def __init__(self, value=None, error=None, elapsed=0.0):
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class PendingTask:
+    """Tarea lanzada en segundo plano cuyo resultado se recoge más tarde."""
+
+    def __init__(self, future, name="tarea"):
+        self.future = future
+        self.name = name
+        self.started = time.monotonic()
+
+    def result(self, timeout=None):
+        """Espera como mucho `timeout` segundos y devuelve un TaskResult."""
+        done, _ = wait([self.future], timeout=timeout)
+        if done:
+            return self.future.result()
+        self.future.cancel()
+        return TaskResult(
+            error=TaskTimeout(f"'{self.name}' superó su plazo"),
+            elapsed=time.monotonic() - self.started,
+        )
+
+
+def submit_task(fn, name="tarea", executor=None):
+    """Lanza `fn` en el pool compartido sin bloquear al llamante."""
+    return PendingTask((executor or get_executor()).submit(_timed, fn), name)
+
+
+def run_parallel(tasks, timeout=None, executor=None):
+    """Ejecuta las tareas en paralelo y espera a todas o a su plazo.
+
+    `tasks` es un dict `{nombre: callable}` o `{nombre: (callable, plazo)}`.
+    Las tareas que vencen se cancelan si aún no habían empezado; las que ya
+    estaban en curso se abandonan (su resultado se ignora). Devuelve
+    `{nombre: TaskResult}`.
+    """
+    executor = executor or get_executor()
+    started = time.monotonic()
+    futures = {}
+    deadlines = {}
+    for name, task in tasks.items():
+        fn, task_timeout = task if isinstance(task, tuple) else (task, timeout)
+        futures[executor.submit(_timed, fn)] = name
+        deadlines[name] = started + task_timeout if task_timeout is not None else None
+
+    results = {}
+    pending = set(futures)
+    while pending:
+        active = [deadlines[futures[f]] for f in pending if deadlines[futures[f]] is not None]
+        wait_for = max(0.0, min(active) - time.monotonic()) if active else None
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[futures[future]] = future.result()
+        now = time.monotonic()
+        for future in [f for f in pending if deadlines[futures[f]] is not None and deadlines[futures[f]] <= now]:
+            future.cancel()
+            pending.discard(future)
+            name = futures[future]
+            results[name] = TaskResult(error=TaskTimeout(f"'{name}' superó su plazo"), elapsed=now - started)
+    return results
+
+
+def _timed(fn):
+    start = time.monotonic()
+    try:
+        return TaskResult(value=fn(), elapsed=time.monotonic() - start)
+    except Exception as exc:
+        return TaskResult(error=exc, elapsed=time.monotonic() - start)
+
+
+def merge_responses(responses, top_k):
+    """Une las respuestas de varias búsquedas y se queda con las top_k mejores."""
+    best = {}
+    for response in responses:
+        for match in response.get("matches", []):
+            current = best.get(match["id"])
+            if current is None or match.get("score", 0) > current.get("score", 0):
+                best[match["id"]] = match
+    matches = sorted(best.values(), key=lambda match: match.get("score", 0), reverse=True)
+    return {"matches": matches[:top_k]}
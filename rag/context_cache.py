@@ -0,0 +1,147 @@
+# --------------------------------------------------
+# Prefijo estable cacheado en el proveedor
+# --------------------------------------------------
+# 👉 Las instrucciones del asistente van como `system_instruction` del
+#    modelo. Cuando además hay fragmentos citados con frecuencia, se crea
+#    en Gemini una caché de contexto (instrucciones + esos fragmentos) y
+#    las consultas los referencian por su etiqueta («R3») en lugar de
+#    reenviar su texto en cada turno de cada usuario.
+#
+#    La caché solo se crea si el prefijo alcanza el mínimo de tokens del
+#    proveedor; se reconstruye en segundo plano cuando cambia el conjunto
+#    de fragmentos más citados o se acerca su caducidad.
+# --------------------------------------------------
+
+import threading
+import time
+from collections import Counter, namedtuple
+
+from rag.history import estimate_tokens
+from rag.prompts import format_reference_block
+
+CachedPrefix = namedtuple("CachedPrefix", "model handle labels tokens created")
+
+
+class ContextCache:
+    """Fragmentos más citados del proceso y su caché de contexto en el proveedor."""
+
+    def __init__(self, system_prompt, create, delete=None, min_tokens=4096, fragment_budget=8000,
+                 min_citations=3, ttl=3600, refresh_interval=600, max_tracked=4096, clock=time.monotonic):
+        self.system_prompt = system_prompt
+        self.create = create  # (system_instruction, contenido, ttl) → (modelo, handle)
+        self.delete = delete
+        self.min_tokens = min_tokens
+        self.fragment_budget = fragment_budget
+        self.min_citations = min_citations
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._citations = Counter()
+        self._bodies = {}  # id → (documento, texto)
+        self._prefix = None
+        self._last_check = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.failures = 0
+        self.last_error = None
+
+    def cite(self, fragments):
+        """Cuenta los fragmentos enviados al modelo en un turno completado."""
+        with self._lock:
+            for fragment in fragments:
+                if fragment.get("id") and fragment.get("texto"):
+                    self._citations[fragment["id"]] += 1
+                    self._bodies[fragment["id"]] = (fragment.get("documento", ""), fragment["texto"])
+            if len(self._citations) > self.max_tracked:
+                # Se olvidan los menos citados para acotar la memoria
+                self._citations = Counter(dict(self._citations.most_common(self.max_tracked // 2)))
+                self._bodies = {fid: self._bodies[fid] for fid in self._citations}
+
+    def _candidates(self):
+        """Fragmentos más citados que caben en el presupuesto y tokens del prefijo."""
+        chosen, fragment_tokens = [], 0
+        for fragment_id, count in self._citations.most_common():
+            if count < self.min_citations:
+                break
+            documento, texto = self._bodies[fragment_id]
+            cost = estimate_tokens(texto)
+            if fragment_tokens + cost <= self.fragment_budget:
+                chosen.append((fragment_id, documento, texto))
+                fragment_tokens += cost
+        return chosen, estimate_tokens(self.system_prompt) + fragment_tokens
+
+    def current(self):
+        """Prefijo activo (o None); lanza la reconstrucción en segundo plano si toca."""
+        expired = build = None
+        with self._lock:
+            now = self.clock()
+            prefix = self._prefix
+            if prefix is not None and now - prefix.created > self.ttl * 0.9:
+                # A punto de caducar en el proveedor: se borra y se reconstruye ya
+                expired, prefix = prefix, None
+                self._prefix = self._last_check = None
+            due = self._last_check is None or now - self._last_check >= self.refresh_interval
+            if due and not self._refreshing:
+                chosen, tokens = self._candidates()
+                unchanged = prefix is not None and set(prefix.labels) == {fid for fid, _, _ in chosen}
+                self._last_check = now
+                if tokens >= self.min_tokens and not unchanged:
+                    self._refreshing = True
+                    build = (chosen, tokens)
+        if expired is not None or build is not None:
+            threading.Thread(
+                target=self._refresh, args=(expired, build), name="rag-context-cache", daemon=True
+            ).start()
+        return prefix
+
+    def _refresh(self, expired, build):
+        """Borra la caché caducada (antes de crear otra) y construye la nueva."""
+        if expired is not None:
+            self._delete(expired)
+        if build is not None:
+            self._build(*build)
+
+    def _delete(self, prefix):
+        if self.delete is not None:
+            try:
+                self.delete(prefix.handle)
+            except Exception:
+                pass  # Caduca sola con su TTL
+
+    def _build(self, chosen, tokens):
+        labels = {fragment_id: f"R{number}" for number, (fragment_id, _, _) in enumerate(chosen, start=1)}
+        content = format_reference_block([(labels[fid], documento, texto) for fid, documento, texto in chosen])
+        try:
+            model, handle = self.create(self.system_prompt, content, self.ttl)
+        except Exception as exc:
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(exc)
+                self._refreshing = False
+            return
+        with self._lock:
+            previous = self._prefix
+            self._prefix = CachedPrefix(model, handle, labels, tokens, self.clock())
+            self.builds += 1
+            self._refreshing = False
+        if previous is not None:
+            self._delete(previous)
+
+    def invalidate(self, prefix=None):
+        """Descarta el prefijo (p. ej. si el proveedor ya no lo reconoce)."""
+        with self._lock:
+            if prefix is None or self._prefix is prefix:
+                self._prefix = None
+                self._last_check = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._prefix is not None,
+                "fragments": len(self._prefix.labels) if self._prefix else 0,
+                "tokens": self._prefix.tokens if self._prefix else 0,
+                "builds": self.builds,
+                "failures": self.failures,
+            }
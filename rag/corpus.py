@@ -0,0 +1,124 @@
+# --------------------------------------------------
+# Corpus local de fragmentos indexados
+# --------------------------------------------------
+# 👉 Copia local (SQLite) del texto y los metadatos de cada fragmento del
+#    índice, mantenida por la ingesta. Sirve para construir el índice
+#    léxico sin depender de Pinecone.
+#
+#    Para un índice de Pinecone creado sin `rag.ingest`:
+#    python -m rag.corpus --export-pinecone
+# --------------------------------------------------
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+DEFAULT_CORPUS_PATH = os.path.join("data", "corpus.sqlite")
+
+
+class FragmentCorpus:
+    """Almacén de fragmentos `id → (documento, texto, metadatos)`."""
+
+    def __init__(self, path=DEFAULT_CORPUS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fragments ("
+            " id TEXT PRIMARY KEY, documento TEXT, texto TEXT NOT NULL, metadata TEXT)"
+        )
+        self._db.commit()
+
+    @property
+    def version(self):
+        """Marca de modificación del fichero (cambia tras cada ingesta)."""
+        return os.path.getmtime(self.path) if os.path.exists(self.path) else None
+
+    def upsert(self, records):
+        """Guarda registros `(id, metadata)` con los campos texto/documento."""
+        rows = [
+            (fid, md.get("documento", ""), md.get("texto", ""), json.dumps(md, ensure_ascii=False))
+            for fid, md in records
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO fragments (id, documento, texto, metadata) VALUES (?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM fragments WHERE id = ?", [(fid,) for fid in ids])
+            self._db.commit()
+
+    def get_many(self, ids):
+        """Devuelve `{id: metadata}` de los fragmentos encontrados."""
+        ids = list(ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for fid, metadata in self._db.execute(
+                    f"SELECT id, metadata FROM fragments WHERE id IN ({placeholders})", batch
+                ):
+                    found[fid] = json.loads(metadata)
+        return found
+
+    def documents(self):
+        """Nombres de los documentos del corpus, ordenados."""
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT documento FROM fragments ORDER BY documento").fetchall()
+        return [name for (name,) in rows if name]
+
+    def iter_fragments(self):
+        """Recorre todos los fragmentos como `(id, metadata)`."""
+        with self._lock:
+            rows = self._db.execute("SELECT id, metadata FROM fragments ORDER BY rowid").fetchall()
+        for fid, metadata in rows:
+            yield fid, json.loads(metadata)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM fragments").fetchone()[0]
+
+
+def export_pinecone(index, corpus, namespace=None, batch_size=100, log=print):
+    """Copia al corpus local los metadatos de todos los vectores del índice."""
+    kwargs = {"namespace": namespace} if namespace else {}
+    total = 0
+    for ids in index.list(**kwargs):
+        for start in range(0, len(ids), batch_size):
+            fetched = index.fetch(ids=ids[start:start + batch_size], **kwargs)
+            corpus.upsert(
+                (fid, dict(vector.metadata or {})) for fid, vector in fetched.vectors.items()
+            )
+            total += len(fetched.vectors)
+        log(f"… {total} fragmentos exportados")
+    return total
+
+
+def main(argv=None):
+    from pinecone import Pinecone
+
+    from rag.settings import load_secrets
+
+    parser = argparse.ArgumentParser(description="Mantenimiento del corpus local de fragmentos.")
+    parser.add_argument("--export-pinecone", action="store_true", help="Copiar los metadatos desde Pinecone")
+    parser.add_argument("--index-name", default="documentacion-edificacion")
+    parser.add_argument("--namespace", default=None)
+    parser.add_argument("--path", default=DEFAULT_CORPUS_PATH)
+    args = parser.parse_args(argv)
+
+    corpus = FragmentCorpus(args.path)
+    if args.export_pinecone:
+        pc = Pinecone(api_key=load_secrets()["pinecone_api_key"])
+        export_pinecone(pc.Index(args.index_name), corpus, namespace=args.namespace)
+    print(f"Corpus: {len(corpus)} fragmentos en {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# --------------------------------------------------
+# Caché persistente de embeddings de consultas
+# --------------------------------------------------
+# 👉 LRU en memoria delante de un almacén SQLite con vectores float32,
+#    indexado por modelo y texto normalizado. Las consultas repetidas (y
+#    los ejemplos de la barra lateral) no vuelven a llamar a la API.
+# --------------------------------------------------
+
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+
+def normalize_query(text):
+    """Normaliza el texto de la consulta para usarlo como clave de caché."""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.casefold().split())
+
+
+def _text_key(text):
+    return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector):
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob):
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """Caché de dos niveles (memoria LRU + SQLite) para embeddings."""
+
+    def __init__(self, path=None, capacity=1024):
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            self._db.commit()
+
+    def _remember(self, cache_key, vector):
+        self._memory[cache_key] = vector
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, model, text):
+        """Devuelve el vector cacheado o None si no existe."""
+        cache_key = (model, _text_key(text))
+        with self._lock:
+            vector = self._memory.get(cache_key)
+            if vector is not None:
+                self._memory.move_to_end(cache_key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND key = ?", cache_key
+                ).fetchone()
+                if row is not None:
+                    vector = unpack_vector(row[0])
+                    self._remember(cache_key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, model, text, vector):
+        cache_key = (model, _text_key(text))
+        vector = list(vector)
+        with self._lock:
+            self._remember(cache_key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                    (*cache_key, pack_vector(vector)),
+                )
+                self._db.commit()
+
+    def get_or_compute(self, model, text, compute):
+        """Devuelve el vector cacheado o lo calcula con `compute(text)` y lo guarda."""
+        vector = self.get(model, text)
+        if vector is None:
+            vector = compute(text)
+            if vector:
+                self.put(model, text, vector)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._memory),
+            }
@@ -0,0 +1,839 @@
+# --------------------------------------------------
+# Motor RAG independiente de la interfaz
+# --------------------------------------------------
+# 👉 Embedding → recuperación → reordenación → prompt → generación, sin
+#    dependencias de Streamlit. Lo usan la app, la línea de comandos, los
+#    workers y las pruebas; `answer_many` procesa lotes de preguntas con
+#    concurrencia acotada.
+# --------------------------------------------------
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from rag.answer_cache import SemanticAnswerCache
+from rag.bm25 import BM25Index, reciprocal_rank_fusion
+from rag.concurrency import merge_responses, run_parallel, submit_task
+from rag.context_cache import ContextCache
+from rag.corpus import DEFAULT_CORPUS_PATH, FragmentCorpus
+from rag.embedding_cache import EmbeddingCache
+from rag.fragment_cache import FragmentTextCache
+from rag.generation import GenerationBlocked, generate_chunks
+from rag.history import HistoryManager, estimate_tokens, format_conversation_history, make_model_summarizer
+from rag.metrics import Tracer, TurnTrace, start_metrics_server
+from rag.model_router import MODEL_TIERS, Attempt, GenerationTimeout, ModelRouter, ModelTier, hedged_chunks
+from rag.progress import StageTracker
+from rag.prompts import CUSTOM_PROMPT, build_prompt, build_turn_prompt, format_context
+from rag.rerank import Reranker
+from rag.retrieval_cache import RetrievalCache
+from rag.retrievers import MANIFEST_FILE, matches_filter
+from rag.routing import NO_ROUTE, QueryRouter, Route
+from rag.scheduler import UPSTREAM_EMBED, UPSTREAM_GENERATE, UPSTREAM_INDEX, Scheduler
+
+SEARCH_HYBRID = "hybrid"
+SEARCH_VECTOR = "vector"
+SEARCH_LEXICAL = "lexical"
+
+EXAMPLE_QUERIES = (
+    "¿Cuáles son los requisitos mínimos de resistencia al fuego en edificios residenciales?",
+    "¿Qué normativa regula la instalación de sistemas de ventilación en sótanos?",
+    "Explica las especificaciones para cimentaciones en terrenos arcillosos",
+    "¿Cuáles son las dimensiones mínimas para escaleras de evacuación?",
+)
+
+
+class EmbeddingError(Exception):
+    """No se pudo calcular el embedding de la consulta."""
+
+
+@dataclass
+class RAGConfig:
+    """Parámetros del pipeline (los valores por defecto son los de producción)."""
+
+    genai_api_key: str = ""
+    pinecone_api_key: str = ""
+    index_name: str = "documentacion-edificacion"
+    retriever_backend: str = "pinecone"  # "pinecone" (remoto) o "local" (índice NumPy en disco)
+    local_index_dir: str = os.path.join("data", "local_index")
+    corpus_path: str = DEFAULT_CORPUS_PATH  # Texto de los fragmentos para el índice léxico
+    cache_dir: str = ".cache"
+    embedding_model: str = "models/text-embedding-004"
+    generation_model: str = "gemini-2.0-flash"
+    system_prompt: str = CUSTOM_PROMPT
+    min_similarity_score: float = 0.50  # 50 %
+    top_k: int = 20  # Candidatos recuperados; después se reordenan y recortan
+    hybrid_vector_top_k: int = 12  # En modo híbrido la búsqueda léxica cubre los identificadores exactos
+    lexical_top_k: int = 12
+    lexical_min_score: float = 4.0  # BM25 mínimo de las coincidencias que no superan el umbral de similitud
+    max_context_fragments: int = 5  # Fragmentos que llegan al prompt tras reordenar
+    context_token_budget: int = 2500  # Tokens máximos de fragmentos en el prompt
+    search_namespaces: tuple = ("",)  # Namespaces consultados en paralelo ("" = por defecto)
+    routing_enabled: bool = True  # Filtrar por la familia normativa detectada (si el índice tiene `familia`)
+    routing_min_matches: int = 3  # Con menos coincidencias sobre el umbral se repite sin filtro
+    family_namespaces: dict = field(default_factory=dict)  # familia → namespace (si el índice está particionado)
+    embed_timeout: float = 10  # Segundos
+    retrieval_timeout: float = 10  # Segundos por búsqueda
+    lexical_timeout: float = 2  # Segundos
+    history_timeout: float = 15  # Segundos (incluye el resumen incremental)
+    history_token_budget: int = 1500  # Tokens máximos del historial en el prompt
+    history_keep_turns: int = 3  # Turnos recientes que se envían literalmente
+    stream_responses: bool = True  # Pintar la respuesta a medida que se genera
+    model_routing: bool = True  # Elegir el nivel de modelo por consulta (si no, siempre `generation_model`)
+    model_tiers: tuple = MODEL_TIERS  # (nivel, modelo) del más rápido al más capaz
+    tier_small_prompt_tokens: int = 1200  # Prompts cortos con pocos fragmentos → nivel rápido
+    tier_large_prompt_tokens: int = 5000  # Prompts largos → nivel más capaz
+    tier_few_fragments: int = 2
+    generation_hedge_after: float = 6  # En streaming: segundos sin primer trozo antes de pedir al nivel más rápido
+    generation_deadline: float = 60  # Segundos máximos por turno hasta completar la respuesta
+    system_instruction: bool = True  # `system_prompt` como instrucción de sistema (no dentro de cada prompt)
+    context_caching: bool = True  # Caché de contexto de Gemini para instrucciones + fragmentos más citados
+    context_cache_min_tokens: int = 4096  # Mínimo del proveedor para crear una caché explícita
+    context_cache_fragment_budget: int = 8000  # Tokens de fragmentos de referencia en el prefijo
+    context_cache_min_citations: int = 3  # Citas necesarias para entrar en el prefijo
+    context_cache_ttl: float = 3600  # Segundos de vida de la caché en el proveedor
+    context_cache_refresh: float = 600  # Segundos entre revisiones de los fragmentos más citados
+    answer_cache_threshold: float = 0.95  # Similitud coseno mínima para reutilizar una respuesta
+    answer_cache_ttl: float = 6 * 3600  # Segundos
+    retrieval_cache_ttl: float = 600  # Segundos
+    lazy_fragment_text: bool = True  # Con corpus local: buscar solo IDs/puntuaciones y cargar el texto de los que pasan
+    fragment_cache_size: int = 2048  # Fragmentos con texto en la LRU en memoria
+    metrics_jsonl_path: str = None  # Una línea JSON por turno (None = desactivado)
+    metrics_port: int = None  # Puerto del endpoint Prometheus `/metrics` (None = desactivado)
+    startup_log_path: str = os.path.join(".cache", "startup.jsonl")  # Tiempos del primer run de cada proceso
+    feedback_log_path: str = os.path.join("data", "feedback.jsonl")  # Valoraciones 👍/👎 (append-only)
+    session_backend: str = "memory"  # Almacén de conversaciones: "memory" o "sqlite"
+    session_db_path: str = os.path.join(".cache", "sessions.sqlite")
+    session_max_messages: int = 400  # Mensajes conservados por sesión (los antiguos ya están resumidos)
+    session_max_sessions: int = 1000  # Solo en memoria: por encima se descartan las más inactivas
+    session_min_idle: float = 900  # Segundos sin actividad para poder descartar una sesión por exceso
+    session_ttl: float = 24 * 3600  # Segundos de inactividad antes de borrar una sesión
+    max_active_turns: int = 8  # Turnos simultáneos; el resto espera en una cola justa
+    queue_timeout: float = 120  # Segundos máximos de espera en la cola
+    embed_rate_limit: float = 25  # Peticiones/segundo a la API de embeddings
+    embed_concurrency: int = 8
+    generate_rate_limit: float = 10  # Peticiones/segundo al modelo generativo
+    generate_concurrency: int = 8
+    index_rate_limit: float = 50  # Consultas/segundo a Pinecone
+    index_concurrency: int = 16
+    example_queries: tuple = EXAMPLE_QUERIES  # Botones de la barra lateral; sus respuestas se precalculan
+    warmup_enabled: bool = True  # Precalcular las consultas de ejemplo en segundo plano
+    warmup_interval: float = 3600  # Segundos entre refrescos completos
+    warmup_check_interval: float = 60  # Segundos entre comprobaciones de re-indexado / reintentos
+
+    @classmethod
+    def from_secrets(cls, general, **overrides):
+        """Crea la configuración a partir de la sección `general` de los secretos."""
+        values = {
+            "genai_api_key": general.get("genai_api_key", ""),
+            "pinecone_api_key": general.get("pinecone_api_key", ""),
+            "retriever_backend": general.get("retriever_backend", "pinecone"),
+            "metrics_jsonl_path": general.get("metrics_jsonl_path"),
+            "metrics_port": general.get("metrics_port"),
+            "session_backend": general.get("session_backend", "memory"),
+            "example_queries": tuple(general.get("example_queries", EXAMPLE_QUERIES)),
+        }
+        values.update(overrides)
+        return cls(**values)
+
+
+@dataclass
+class PreparedTurn:
+    """Todo lo necesario para generar la respuesta de una consulta."""
+
+    query: str
+    history: list
+    tracker: StageTracker
+    query_vector: list = None
+    index_version: object = None
+    fragments: list = field(default_factory=list)
+    prefix: object = None  # `CachedPrefix` con el que se genera (None = modelo sin caché)
+    fallback_prompt: str = ""  # Prompt con el texto completo por si la caché ya no existe
+    deduplicated_tokens: int = 0  # Tokens de fragmentos citados por etiqueta en vez de reenviados
+    candidate_ids: list = field(default_factory=list)  # Fragmentos sobre el umbral, antes de reordenar
+    prompt: str = ""
+    prompt_tokens: int = 0
+    history_tokens: int = 0
+    history_state: dict = field(default_factory=dict)
+    cached_answer: dict = None
+    warnings: list = field(default_factory=list)
+    stage_times: dict = field(default_factory=dict)  # Etapas internas: filtrado/reordenación y prompt
+    route: Route = NO_ROUTE
+    tier: ModelTier = None  # Nivel de modelo elegido para la consulta
+    tier_reason: str = ""
+    served_tier: ModelTier = None  # Nivel que ha servido la respuesta (el de respaldo si ganó)
+    trace: TurnTrace = None
+
+    @property
+    def is_standalone(self):
+        """Pregunta sin historial y con embedding: apta para la caché de respuestas."""
+        return not self.history and self.query_vector is not None
+
+
+class RAGEngine:
+    """Pipeline RAG completo; los componentes se crean en el primer uso.
+
+    `clients`, `retriever`, `model` y `embed_fn` pueden inyectarse para
+    ejecutar el motor contra dobles locales (pruebas, benchmarks).
+    """
+
+    def __init__(self, config, clients=None, retriever=None, model=None, embed_fn=None, tracer=None,
+                 scheduler=None):
+        self.config = config
+        self._clients = clients
+        self._retriever = retriever
+        self._local_index_mtime = None  # Del índice local cargado por el motor (None si se inyecta)
+        self._model = model
+        self._tier_models = {}
+        # Un modelo inyectado (dobles locales) recibe las instrucciones dentro del prompt
+        self._inline_system = model is not None or not config.system_instruction
+        self._embed_fn = embed_fn
+        self._lock = threading.RLock()
+        self._lexical_index = None
+        self._lexical_version = False  # Aún no construido
+        self.embedding_cache = EmbeddingCache(os.path.join(config.cache_dir, "embeddings.sqlite"))
+        self.retrieval_cache = RetrievalCache(ttl=config.retrieval_cache_ttl)
+        self.fragment_cache = FragmentTextCache(config.corpus_path, capacity=config.fragment_cache_size)
+        self.answer_cache = SemanticAnswerCache(
+            threshold=config.answer_cache_threshold, ttl=config.answer_cache_ttl
+        )
+        self.reranker = Reranker(
+            max_fragments=config.max_context_fragments, token_budget=config.context_token_budget
+        )
+        self.history_manager = HistoryManager(
+            token_budget=config.history_token_budget,
+            keep_turns=config.history_keep_turns,
+            summarizer=lambda previous, messages: self.scheduler.upstream(UPSTREAM_GENERATE).call(
+                make_model_summarizer(self.model), previous, messages
+            ),
+        )
+        self.scheduler = scheduler or Scheduler.from_config(config)
+        self.context_cache = None
+        if config.context_caching and not self._inline_system:
+            self.context_cache = ContextCache(
+                config.system_prompt,
+                create=lambda system_instruction, content, ttl: self.scheduler.upstream(UPSTREAM_GENERATE).call(
+                    self.clients.cached_model, config.generation_model, system_instruction, content, ttl
+                ),
+                delete=lambda cache: self.clients.delete_cached(cache),
+                min_tokens=config.context_cache_min_tokens,
+                fragment_budget=config.context_cache_fragment_budget,
+                min_citations=config.context_cache_min_citations,
+                ttl=config.context_cache_ttl,
+                refresh_interval=config.context_cache_refresh,
+            )
+        self.router = QueryRouter(family_namespaces=config.family_namespaces)
+        self.model_router = ModelRouter(
+            [(name, model or config.generation_model) for name, model in config.model_tiers]
+            if config.model_routing else [("estandar", config.generation_model)],
+            small_prompt_tokens=config.tier_small_prompt_tokens,
+            large_prompt_tokens=config.tier_large_prompt_tokens,
+            few_fragments=config.tier_few_fragments,
+        )
+        self._document_names = (False, [])
+        self._index_families = {}  # Versión del índice → ¿sus fragmentos tienen `familia`?
+        self.tracer = tracer or Tracer(config.metrics_jsonl_path)
+        if config.metrics_port:
+            start_metrics_server(self.tracer, int(config.metrics_port))
+
+    # ---------------- Componentes -----------------
+    @property
+    def clients(self):
+        with self._lock:
+            if self._clients is None:
+                from rag.clients import Clients
+
+                self._clients = Clients(
+                    self.config.genai_api_key, self.config.pinecone_api_key, self.config.index_name
+                )
+            return self._clients
+
+    @property
+    def retriever(self):
+        """Buscador del backend configurado; el índice local se recarga si se re-indexa en disco."""
+        with self._lock:
+            reindexed = self._local_index_mtime is not None and self._local_index_stamp() != self._local_index_mtime
+            if self._retriever is None or reindexed:
+                from rag.retrievers import LocalRetriever, PineconeRetriever
+
+                if self.config.retriever_backend == "local":
+                    self._local_index_mtime = self._local_index_stamp()
+                    self._retriever = LocalRetriever.load(self.config.local_index_dir)
+                else:
+                    self._retriever = PineconeRetriever(self.clients, self.config.index_name)
+            return self._retriever
+
+    def _local_index_stamp(self):
+        path = os.path.join(self.config.local_index_dir, MANIFEST_FILE)
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self.clients.model(self.config.generation_model)
+            return self._model
+
+    def tier_model(self, tier):
+        """Modelo de respuestas del nivel: con `system_prompt` como instrucción de sistema."""
+        if self._inline_system:
+            return self.model  # Un modelo inyectado sirve todos los niveles
+        with self._lock:
+            if tier.model not in self._tier_models:
+                self._tier_models[tier.model] = self.clients.model(
+                    tier.model, system_instruction=self.config.system_prompt
+                )
+            return self._tier_models[tier.model]
+
+    @property
+    def lexical_index(self):
+        """Índice BM25 en memoria; se reconstruye cuando cambia el corpus."""
+        path = self.config.corpus_path
+        version = os.path.getmtime(path) if os.path.exists(path) else None
+        with self._lock:
+            if version != self._lexical_version:
+                self._lexical_index = self._build_lexical_index(version)
+                self._lexical_version = version
+            return self._lexical_index
+
+    def _build_lexical_index(self, corpus_version):
+        from rag.retrievers import LocalRetriever
+
+        if corpus_version is not None:
+            fragments = FragmentCorpus(self.config.corpus_path).iter_fragments()
+        elif self._retriever is None and self.config.retriever_backend != "local":
+            return None  # Sin corpus y con Pinecone: no se conecta (ni se importa el SDK) al arrancar
+        elif isinstance(self.retriever, LocalRetriever):
+            fragments = zip(self.retriever.ids, self.retriever.metadata)
+        else:
+            return None
+        lexical_index = BM25Index.build(fragments)
+        return lexical_index if len(lexical_index) else None
+
+    def document_names(self):
+        """Documentos disponibles para fijar en la búsqueda (del corpus o del índice local)."""
+        path = self.config.corpus_path
+        version = os.path.getmtime(path) if os.path.exists(path) else None
+        with self._lock:
+            if self._document_names[0] != version:
+                if version is not None:
+                    names = FragmentCorpus(path).documents()
+                else:
+                    lexical_index = self.lexical_index
+                    names = sorted({md.get("documento", "") for md in lexical_index.metadata} - {""}) \
+                        if lexical_index is not None else []
+                self._document_names = (version, names)
+            return self._document_names[1]
+
+    def embed(self, text, trace=None):
+        """Embedding de la consulta, pasando por la caché persistente."""
+        computed = []
+
+        def compute(value):
+            computed.append(True)
+            upstream = self.scheduler.upstream(UPSTREAM_EMBED)
+            if self._embed_fn is not None:
+                return upstream.call(self._embed_fn, value)
+            return upstream.call(self.clients.embed, value, model=self.config.embedding_model).get("embedding")
+        vector = self.embedding_cache.get_or_compute(self.config.embedding_model, text, compute)
+        if trace is not None:
+            trace.cache["embedding"] = not computed
+        return vector
+
+    def _load_fragment_text(self, ids, retriever, namespace_of, trace):
+        """Texto de los fragmentos devueltos sin metadatos (caché → corpus → índice)."""
+        if not ids:
+            return {}
+        fetched = []
+
+        def fetch(missing):
+            fetched.append(True)
+            if retriever is None or not hasattr(retriever, "fetch"):
+                return {}
+            by_namespace = {}
+            for fragment_id in missing:
+                by_namespace.setdefault(namespace_of.get(fragment_id, ""), []).append(fragment_id)
+            found = {}
+            for namespace, namespace_ids in by_namespace.items():
+                if getattr(retriever, "remote", False):
+                    found.update(self.scheduler.upstream(UPSTREAM_INDEX).call(
+                        retriever.fetch, namespace_ids, namespace=namespace
+                    ))
+                else:
+                    found.update(retriever.fetch(namespace_ids, namespace=namespace))
+            return found
+
+        with trace.span("fragment_text"):
+            try:
+                loaded = self.fragment_cache.get_many(ids, fetch=fetch)
+            except Exception as exc:
+                # Sin texto solo se pierden esos fragmentos; la respuesta sigue adelante
+                trace.error("fragment_text", exc)
+                return {}
+        trace.cache["fragment_text"] = not fetched
+        return loaded
+
+    # ---------------- Pipeline -----------------
+    def _vector_search(self, turn, retriever, top_k, namespaces, query_filter):
+        """Una búsqueda por namespace, todas en paralelo y con plazo propio.
+
+        Devuelve (respuesta fusionada, búsquedas fallidas, {id: namespace}).
+        """
+        config = self.config
+        trace = turn.trace
+        queried = []
+        # Sin corpus local el texto llegaría con un `fetch` más por búsqueda: mejor con la consulta
+        lazy_text = config.lazy_fragment_text and os.path.exists(config.corpus_path)
+
+        def query_index(**kwargs):
+            queried.append(True)
+            if getattr(retriever, "remote", False):
+                return self.scheduler.upstream(UPSTREAM_INDEX).call(retriever.query, **kwargs)
+            return retriever.query(**kwargs)
+
+        def search(namespace):
+            return self.retrieval_cache.get_or_query(
+                query_index,
+                retriever.name,
+                turn.query_vector,
+                top_k=top_k,
+                namespace=namespace,
+                filter=query_filter,
+                index_version=turn.index_version,
+                include_metadata=not lazy_text,
+            )
+
+        with trace.span("retrieval"):
+            searches = run_parallel({
+                namespace: (lambda namespace=namespace: search(namespace), config.retrieval_timeout)
+                for namespace in namespaces
+            })
+        trace.cache["retrieval"] = not queried
+        failed = 0
+        namespace_of = {}
+        for namespace, result in searches.items():
+            if not result.ok:
+                failed += 1
+                trace.error("retrieval", result.error)
+                continue
+            for match in result.value.get("matches", []):
+                namespace_of.setdefault(match["id"], namespace)
+        response = merge_responses([result.value for result in searches.values() if result.ok], top_k=top_k)
+        return response, failed, namespace_of
+
+    def _is_relevant(self, match):
+        """Supera el umbral de similitud coseno o, si es una coincidencia léxica, el de BM25."""
+        score = match.get("score")
+        return (score is not None and score >= self.config.min_similarity_score) \
+            or match.get("bm25", 0) >= self.config.lexical_min_score
+
+    def _index_has_families(self, turn, retriever):
+        """¿Hay fragmentos con `familia` en el índice? Una búsqueda de prueba por versión del índice.
+
+        Sin ella, cada consulta enrutada contra un índice sin `familia`
+        buscaría dos veces (con filtro vacío y de nuevo sin filtro).
+        """
+        with self._lock:
+            known = self._index_families.get(turn.index_version)
+        if known is not None:
+            return known
+        probe = {"familia": {"$in": sorted(self.router.labels)}}
+        response, failed, _ = self._vector_search(turn, retriever, 1, self.config.search_namespaces, probe)
+        if failed:
+            return False  # Sin respuesta no se enruta este turno; se vuelve a probar en el siguiente
+        found = bool(response["matches"])
+        with self._lock:
+            self._index_families = {turn.index_version: found}
+        return found
+
+    def _too_few_matches(self, response):
+        """¿La búsqueda filtrada se ha quedado corta? (clasificación dudosa o índice sin `familia`)."""
+        good = [match for match in (response or {}).get("matches", []) if self._is_relevant(match)]
+        return len(good) < self.config.routing_min_matches
+
+    def prepare(self, query, history=(), history_state=None, search_mode=SEARCH_HYBRID, tracker=None,
+                history_offset=0, pinned_documents=None, family=None, background=False):
+        """Recupera fragmentos y construye el prompt de la consulta.
+
+        `history_offset` es la posición absoluta del primer mensaje de
+        `history` (ver `rag.sessions`). `pinned_documents` y `family`
+        restringen la búsqueda; sin ellos se enruta según la consulta.
+        Los turnos `background` (precalentamiento) quedan fuera de las
+        métricas de latencia.
+        Lanza `EmbeddingError` si el embedding falla o no llega a tiempo.
+        """
+        config = self.config
+        tracker = tracker or StageTracker()
+        history = list(history)
+        trace = self.tracer.start_turn(query)
+        if background:
+            trace.attributes["background"] = True
+        turn = PreparedTurn(query=query, history=history, tracker=tracker, trace=trace)
+        lexical_index = self.lexical_index
+        use_lexical = lexical_index is not None and search_mode != SEARCH_VECTOR
+        use_vector = search_mode != SEARCH_LEXICAL or not use_lexical
+        if config.routing_enabled or pinned_documents or family:
+            turn.route = self.router.route(query, pinned_documents, family)
+        if turn.route.families or turn.route.pinned:
+            trace.attributes["route"] = {"families": turn.route.families, "pinned": turn.route.pinned}
+
+        # El historial (que puede requerir resumir turnos antiguos) y la
+        # búsqueda léxica se preparan en segundo plano mientras se calcula
+        # el embedding y se busca en el índice vectorial
+        history_state = dict(history_state or {})
+        def build_history():
+            with trace.span("history"):
+                return self.history_manager.build(history, history_state, offset=history_offset)
+
+        def search_lexical():
+            # Con filtro se piden más resultados y se filtran al fusionar
+            with trace.span("lexical"):
+                return lexical_index.search(
+                    query, top_k=config.lexical_top_k * (4 if turn.route.filter else 1)
+                )
+
+        history_task = submit_task(build_history, name="historial")
+        lexical_task = submit_task(search_lexical, name="búsqueda léxica") if use_lexical else None
+
+        tracker.mark("embedding_start")
+        if use_vector:
+            with trace.span("embedding"):
+                embedding_result = submit_task(
+                    lambda: self.embed(query, trace), name="embedding"
+                ).result(config.embed_timeout)
+            turn.query_vector = embedding_result.value
+            if not turn.query_vector:
+                trace.error("embedding", embedding_result.error or ValueError("vector vacío"))
+                self.tracer.finish_turn(trace)
+                raise EmbeddingError("Error al generar el vector de embedding de la consulta.")
+        tracker.mark("embedding_done")
+
+        failed_searches = 0
+        vector_response = None
+        retriever = None
+        namespace_of = {}
+        if turn.query_vector:
+            retriever = self.retriever
+            turn.index_version = retriever.version
+            vector_top_k = config.hybrid_vector_top_k if use_lexical else config.top_k
+            if turn.route.automatic and turn.route.filter and not self._index_has_families(turn, retriever):
+                trace.attributes["route_fallback"] = True
+                turn.route = NO_ROUTE
+            vector_response, failed, namespace_of = self._vector_search(
+                turn, retriever, vector_top_k, turn.route.namespaces or config.search_namespaces, turn.route.filter
+            )
+            if turn.route.automatic and self._too_few_matches(vector_response):
+                # Clasificación dudosa o índice sin `familia`: se repite sin restringir
+                trace.attributes["route_fallback"] = True
+                turn.route = NO_ROUTE
+                vector_response, failed, namespace_of = self._vector_search(
+                    turn, retriever, vector_top_k, config.search_namespaces, None
+                )
+            failed_searches += failed
+
+        if lexical_task is not None:
+            lexical_result = lexical_task.result(config.lexical_timeout)
+            if not lexical_result.ok:
+                failed_searches += 1
+                trace.error("lexical", lexical_result.error)
+            lexical_response = lexical_result.value or {"matches": []}
+            if turn.route.filter:
+                filtered = {"matches": [
+                    match for match in lexical_response["matches"]
+                    if matches_filter(match.get("metadata", {}), turn.route.filter)
+                ]}
+                if turn.route.automatic and vector_response is None \
+                        and len(filtered["matches"]) < config.routing_min_matches:
+                    trace.attributes["route_fallback"] = True
+                    turn.route = NO_ROUTE
+                else:
+                    lexical_response = filtered
+            lexical_response = {"matches": lexical_response["matches"][:config.lexical_top_k]}
+            query_response = reciprocal_rank_fusion(vector_response, lexical_response, top_k=config.top_k)
+        else:
+            query_response = vector_response
+        if failed_searches:
+            turn.warnings.append("Alguna búsqueda no respondió a tiempo; la respuesta puede estar incompleta.")
+        tracker.mark("retrieval_done")
+
+        filter_start = time.perf_counter()
+        # Las coincidencias solo léxicas no tienen similitud coseno: se
+        # filtran por su puntuación BM25
+        survivors = [match for match in query_response.get("matches", []) if self._is_relevant(match)]
+        loaded = self._load_fragment_text(
+            [match["id"] for match in survivors if not match.get("metadata", {}).get("texto")],
+            retriever,
+            namespace_of,
+            trace,
+        )
+        candidates = []
+        for match in survivors:
+            md = match.get("metadata") or loaded.get(match["id"], {})
+            texto = md.get("texto", "")
+            doc = md.get("documento", "Documento sin nombre")
+            if texto:
+                candidate = {
+                    "id": match.get("id"),
+                    "texto": texto,
+                    "documento": doc,
+                    "score": match.get("score"),  # None en las coincidencias solo léxicas
+                }
+                if "bm25" in match:
+                    candidate["bm25"] = match["bm25"]
+                candidates.append(candidate)
+
+        turn.candidate_ids = [candidate["id"] for candidate in candidates]
+
+        # Reordenar en lote, quitar duplicados y ajustar al presupuesto de contexto
+        turn.fragments = self.reranker.rerank(
+            query, candidates, idf=lexical_index.term_idf if lexical_index is not None else None
+        )
+        turn.stage_times["rerank"] = time.perf_counter() - filter_start
+        trace.add_span("rerank", turn.stage_times["rerank"])
+        trace.fragments = {"candidates": len(candidates), "selected": len(turn.fragments)}
+
+        history_result = history_task.result(config.history_timeout)
+        if history_result.ok:
+            formatted_history, turn.history_state, turn.history_tokens = history_result.value
+        else:
+            # Sin resumen a tiempo: solo los turnos recientes, literalmente
+            trace.error("history", history_result.error)
+            formatted_history = format_conversation_history(history[-config.history_keep_turns * 2:])
+            turn.history_state = history_state
+            turn.history_tokens = estimate_tokens(formatted_history)
+
+        prompt_start = time.perf_counter()
+        full_context = format_context(turn.fragments)
+        turn.tier, turn.tier_reason = self.model_router.select(
+            query, estimate_tokens(full_context) + turn.history_tokens + estimate_tokens(query), len(turn.fragments)
+        )
+        if self._inline_system:
+            turn.prompt = build_prompt(config.system_prompt, formatted_history, full_context, query)
+            turn.fallback_prompt = turn.prompt
+            turn.prompt_tokens = estimate_tokens(turn.prompt)
+        else:
+            # Instrucciones (y fragmentos de referencia) en el modelo; aquí solo lo variable.
+            # La caché de contexto pertenece a `generation_model`: otros niveles no la usan
+            if self.context_cache is not None and turn.tier.model == config.generation_model:
+                turn.prefix = self.context_cache.current()
+                trace.cache["context"] = turn.prefix is not None
+            references = turn.prefix.labels if turn.prefix is not None else {}
+            referenced = [fragment for fragment in turn.fragments if fragment.get("id") in references]
+            turn.deduplicated_tokens = sum(estimate_tokens(fragment["texto"]) for fragment in referenced)
+            turn.fallback_prompt = build_turn_prompt(formatted_history, full_context, query)
+            turn.prompt = build_turn_prompt(formatted_history, format_context(turn.fragments, references), query) \
+                if referenced else turn.fallback_prompt
+            # Sin caché las instrucciones de sistema se facturan en cada llamada
+            turn.prompt_tokens = estimate_tokens(turn.prompt) + (
+                0 if turn.prefix is not None else estimate_tokens(config.system_prompt)
+            )
+        turn.stage_times["prompt"] = time.perf_counter() - prompt_start
+        trace.add_span("prompt", turn.stage_times["prompt"])
+
+        # Preguntas sin historial: reutilizar una respuesta casi idéntica
+        if turn.is_standalone:
+            turn.cached_answer = self.answer_cache.lookup(
+                turn.query_vector,
+                [fragment["id"] for fragment in turn.fragments],
+                index_version=turn.index_version,
+            )
+            trace.cache["answer"] = turn.cached_answer is not None
+            if turn.cached_answer is not None:
+                turn.fragments = turn.cached_answer["fragments"]
+        return turn
+
+    def generate(self, turn, stream=None):
+        """Trozos de la respuesta (la cacheada, si la hay, en un único trozo)."""
+        if turn.cached_answer is not None:
+            return iter([turn.cached_answer["response"]])
+        stream = self.config.stream_responses if stream is None else stream
+        return self._traced_generation(turn.trace, self._scheduled_generation(turn, stream))
+
+    def _scheduled_generation(self, turn, stream):
+        """Generación en el nivel elegido con plazo y respaldo en el nivel más rápido.
+
+        Cada intento ocupa un hueco del planificador hasta que termina su stream.
+        Sin streaming el primer trozo es la respuesta completa, así que no se
+        duplica la petición por tardanza: el respaldo solo entra si falla.
+        """
+        config = self.config
+        upstream = self.scheduler.upstream(UPSTREAM_GENERATE)
+        tier = turn.tier or self.model_router.default
+        prefix = turn.prefix
+        primary = Attempt(tier, prefix.model if prefix is not None else self.tier_model(tier), turn.prompt,
+                          prefix is not None)
+        faster = self.model_router.faster(tier)
+        if faster is not None:
+            backup = Attempt(faster, self.tier_model(faster), turn.fallback_prompt, False)
+        elif prefix is not None:
+            # Ya es el nivel más rápido: el respaldo es el mismo modelo sin caché de contexto
+            backup = Attempt(tier, self.tier_model(tier), turn.fallback_prompt, False)
+        else:
+            backup = None
+        usage = {}
+        served = []
+
+        def run(attempt):
+            with upstream.slot():
+                yield from generate_chunks(
+                    attempt.model,
+                    attempt.prompt,
+                    stream=stream,
+                    on_usage=lambda tokens: usage.__setitem__(attempt, tokens),
+                    call=upstream.retry,
+                )
+
+        def on_event(event, attempt, error):
+            if event == "hedge":
+                turn.trace.attributes["hedged"] = True
+            elif event == "failure":
+                if attempt.cached:
+                    # La caché de contexto ha caducado o se ha borrado
+                    turn.trace.error("context_cache", error)
+                    self.context_cache.invalidate(prefix)
+                else:
+                    turn.trace.error("model_fallback", error)
+            elif event == "served":
+                served.append(attempt)
+                turn.served_tier = attempt.tier
+                if attempt is not primary:
+                    turn.prefix = None
+                    turn.prompt = attempt.prompt
+                    turn.deduplicated_tokens = 0
+                    turn.prompt_tokens = estimate_tokens(attempt.prompt) + (
+                        0 if self._inline_system else estimate_tokens(config.system_prompt)
+                    )
+
+        try:
+            yield from hedged_chunks(
+                primary,
+                run,
+                backup=backup,
+                hedge_after=config.generation_hedge_after if faster is not None and stream else None,
+                deadline=config.generation_deadline,
+                elapsed=turn.tracker.elapsed(),  # Embedding, búsqueda y reordenación cuentan en el plazo
+                on_event=on_event,
+            )
+        finally:
+            # Solo cuentan los tokens del intento que ha servido la respuesta
+            if served and served[0] in usage:
+                turn.trace.tokens.update(usage[served[0]])
+
+    @staticmethod
+    def _traced_generation(trace, chunks):
+        """Mide el primer trozo y la generación completa dentro de la traza."""
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in chunks:
+                if first:
+                    trace.add_span("first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk
+        except Exception as exc:
+            trace.error("generation", exc)
+            raise
+        finally:
+            trace.add_span("generation", time.perf_counter() - start)
+
+    def remember(self, turn, response_text):
+        """Guarda una respuesta completa en la caché semántica si procede."""
+        if turn.is_standalone and turn.cached_answer is None:
+            self.answer_cache.store(
+                turn.query_vector,
+                [fragment["id"] for fragment in turn.fragments],
+                response_text,
+                turn.fragments,
+                index_version=turn.index_version,
+            )
+
+    def finish(self, turn, response_text, completed=True):
+        """Cierra el turno: cachea la respuesta completa y registra su traza.
+
+        Devuelve el registro de la traza (dict serializable).
+        """
+        if completed:
+            self.remember(turn, response_text)
+        trace = turn.trace
+        if turn.cached_answer is not None:
+            trace.tokens = {"prompt": 0, "response": 0}
+        else:
+            if not trace.tokens:
+                # Sin `usage_metadata` (modelos simulados, respuesta cortada): estimación
+                trace.tokens = {"prompt": turn.prompt_tokens, "response": estimate_tokens(response_text)}
+                if turn.prefix is not None:
+                    # Como en `usage_metadata`: los tokens cacheados cuentan dentro de `prompt`
+                    trace.tokens["prompt"] += turn.prefix.tokens
+                    trace.tokens["cached"] = turn.prefix.tokens
+                trace.attributes["tokens_estimated"] = True
+            # Tokens de entrada que no se han vuelto a procesar: caché del proveedor + referencias
+            trace.tokens["deduplicated"] = turn.deduplicated_tokens
+            trace.attributes["tokens_saved"] = trace.tokens.get("cached", 0) + turn.deduplicated_tokens
+            if completed and self.context_cache is not None:
+                self.context_cache.cite(turn.fragments)
+        if turn.cached_answer is None and turn.tier is not None:
+            trace.attributes.update(tier_requested=turn.tier.name, tier_reason=turn.tier_reason)
+        if turn.served_tier is not None:
+            trace.attributes.update(model_tier=turn.served_tier.name, model=turn.served_tier.model)
+        trace.attributes.update(completed=completed, history_tokens=turn.history_tokens)
+        return self.tracer.finish_turn(trace)
+
+    def admit(self, session_id=None, on_wait=None):
+        """Espera turno en la cola de admisión (context manager); ver `rag.scheduler`."""
+        return self.scheduler.admit(session_id, on_wait=on_wait, timeout=self.config.queue_timeout)
+
+    def answer(self, query, history=(), history_state=None, search_mode=SEARCH_HYBRID, tracker=None,
+               session_id=None, pinned_documents=None, family=None, background=False):
+        """Responde una consulta de principio a fin y devuelve un dict con el resultado.
+
+        Los turnos `background` (precalentamiento) no cuentan en las métricas de latencia.
+        """
+        with self.admit(session_id):
+            turn = self.prepare(
+                query, history, history_state, search_mode, tracker,
+                pinned_documents=pinned_documents, family=family, background=background,
+            )
+            received = []
+            error = None
+            try:
+                for chunk in self.generate(turn, stream=False):
+                    turn.tracker.mark("first_token")
+                    received.append(chunk)
+            except (GenerationBlocked, GenerationTimeout) as exc:
+                error = str(exc)
+        turn.tracker.mark("done")
+        response_text = "".join(received)
+        trace = self.finish(turn, response_text, completed=error is None)
+        return {
+            "query": query,
+            "response": response_text,
+            "completed": error is None,
+            "error": error,
+            "fragments": turn.fragments,
+            "candidate_ids": turn.candidate_ids,
+            "from_cache": turn.cached_answer is not None,
+            "prompt_tokens": turn.prompt_tokens,
+            "history_tokens": turn.history_tokens,
+            "history_state": turn.history_state,
+            "timings": dict(turn.tracker.timings(), **turn.stage_times),
+            "warnings": turn.warnings,
+            "route": turn.route.families,
+            "model_tier": turn.served_tier.name if turn.served_tier is not None else None,
+            "trace": trace,
+        }
+
+    def answer_many(self, queries, max_workers=4, search_mode=SEARCH_HYBRID):
+        """Responde un lote de preguntas independientes con concurrencia acotada.
+
+        Devuelve los resultados en el mismo orden; los fallos se devuelven
+        como `{"query": ..., "error": ...}` sin interrumpir el lote.
+        """
+        def run(query):
+            try:
+                return self.answer(query, search_mode=search_mode)
+            except Exception as exc:
+                return {"query": query, "error": str(exc), "completed": False}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-batch") as pool:
+            return list(pool.map(run, queries))
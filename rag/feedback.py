@@ -0,0 +1,67 @@
+# --------------------------------------------------
+# Registro de valoraciones 👍/👎
+# --------------------------------------------------
+# 👉 Cada clic en «Útil» / «No útil» añade una línea JSON (append-only)
+#    con la consulta, los fragmentos enviados al modelo (ID, documento,
+#    puntuación), la latencia por etapa, los tokens, el nivel de modelo y
+#    los parámetros de recuperación con los que se respondió. `benchmarks.tuning` lo usa
+#    como conjunto etiquetado y para medir la aceptación por configuración.
+# --------------------------------------------------
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+TUNED_PARAMETERS = ("top_k", "min_similarity_score", "max_context_fragments", "context_token_budget")
+
+
+def config_snapshot(config):
+    """Parámetros de recuperación que se comparan entre configuraciones."""
+    return {name: getattr(config, name) for name in TUNED_PARAMETERS}
+
+
+class FeedbackLog:
+    """Fichero JSONL de valoraciones compartido por todas las sesiones."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, accepted, query, message, session_id=None, config=None):
+        """Añade la valoración de la respuesta `message` a `query` y devuelve la entrada."""
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "session_id": session_id,
+            "accepted": bool(accepted),
+            "query": query,
+            "response": message.get("content", ""),
+            "fragments": [
+                {"id": fragment.get("id"), "documento": fragment.get("documento"), "score": fragment.get("score")}
+                for fragment in message.get("fragments") or []
+            ],
+            "latency": message.get("spans", {}),
+            "tokens": message.get("tokens", {}),
+            "search_mode": message.get("search_mode"),
+            "model_tier": message.get("model_tier"),
+            "config": config_snapshot(config) if config is not None else None,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(line)
+        return entry
+
+
+def load_feedback(path):
+    """Entradas del registro (las líneas corruptas se ignoran)."""
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # Línea a medio escribir si el proceso murió
+    return entries
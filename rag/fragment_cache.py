@@ -0,0 +1,92 @@
+# --------------------------------------------------
+# Caché del texto de los fragmentos
+# --------------------------------------------------
+# 👉 La búsqueda vectorial pide solo IDs y puntuaciones
+#    (`include_metadata=False`); el texto de los fragmentos que superan el
+#    umbral se carga aquí: LRU en memoria → corpus local (SQLite) → `fetch`
+#    al índice como último recurso. Los fragmentos citados con frecuencia
+#    se sirven sin salir del proceso.
+# --------------------------------------------------
+
+import os
+import threading
+from collections import OrderedDict
+
+from rag.corpus import FragmentCorpus
+
+
+class FragmentTextCache:
+    """Metadatos (`texto`, `documento`, ...) de fragmentos por ID."""
+
+    def __init__(self, corpus_path=None, capacity=2048):
+        self.corpus_path = corpus_path
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._corpus = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.corpus_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    def _open_corpus(self):
+        # El corpus puede crearse después de arrancar (primera ingesta)
+        if self._corpus is None and self.corpus_path and os.path.exists(self.corpus_path):
+            self._corpus = FragmentCorpus(self.corpus_path)
+        return self._corpus
+
+    def _remember(self, fragment_id, metadata):
+        self._memory[fragment_id] = metadata
+        self._memory.move_to_end(fragment_id)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get_many(self, ids, fetch=None):
+        """Devuelve `{id: metadata}`; `fetch(ids)` consulta el índice si falta alguno."""
+        found = {}
+        with self._lock:
+            for fragment_id in ids:
+                metadata = self._memory.get(fragment_id)
+                if metadata is not None:
+                    self._memory.move_to_end(fragment_id)
+                    found[fragment_id] = metadata
+            self.hits += len(found)
+        missing = [fragment_id for fragment_id in ids if fragment_id not in found]
+
+        corpus = self._open_corpus() if missing else None
+        if corpus is not None:
+            from_corpus = corpus.get_many(missing)
+            found.update(from_corpus)
+            with self._lock:
+                self.corpus_hits += len(from_corpus)
+                for fragment_id, metadata in from_corpus.items():
+                    self._remember(fragment_id, metadata)
+            missing = [fragment_id for fragment_id in missing if fragment_id not in from_corpus]
+
+        if missing and fetch is not None:
+            fetched = {fragment_id: metadata for fragment_id, metadata in fetch(missing).items() if metadata}
+            found.update(fetched)
+            with self._lock:
+                self.remote_hits += len(fetched)
+                for fragment_id, metadata in fetched.items():
+                    self._remember(fragment_id, metadata)
+            missing = [fragment_id for fragment_id in missing if fragment_id not in fetched]
+
+        with self._lock:
+            self.misses += len(missing)
+        return found
+
+    def invalidate(self):
+        """Descarta la LRU (p. ej. tras re-indexar)."""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "corpus_hits": self.corpus_hits,
+                "remote_hits": self.remote_hits,
+                "misses": self.misses,
+                "size": len(self._memory),
+            }
@@ -0,0 +1,108 @@
+# --------------------------------------------------
+# Generación de respuestas con Gemini
+# --------------------------------------------------
+# 👉 Permite recibir la respuesta por fragmentos (streaming) para pintarla
+#    a medida que llega, detectando bloqueos de seguridad a mitad de camino.
+# --------------------------------------------------
+
+# Motivos de finalización que indican que la respuesta se ha cortado
+BLOCKING_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII"}
+
+
+class GenerationBlocked(Exception):
+    """La respuesta ha sido bloqueada por los filtros del modelo."""
+
+    def __init__(self, reason):
+        super().__init__(f"Respuesta bloqueada por el modelo ({reason})")
+        self.reason = reason
+
+
+def _enum_name(value):
+    return getattr(value, "name", str(value)) if value is not None else ""
+
+
+def _chunk_text(chunk):
+    """Extrae el texto de un fragmento de respuesta comprobando bloqueos."""
+    feedback = getattr(chunk, "prompt_feedback", None)
+    block_reason = _enum_name(getattr(feedback, "block_reason", None))
+    if block_reason and block_reason != "BLOCK_REASON_UNSPECIFIED":
+        raise GenerationBlocked(block_reason)
+
+    texts = []
+    for candidate in getattr(chunk, "candidates", None) or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            text = getattr(part, "text", "")
+            if text:
+                texts.append(text)
+        finish_reason = _enum_name(getattr(candidate, "finish_reason", None))
+        if finish_reason in BLOCKING_FINISH_REASONS:
+            # Se devuelve antes el texto ya recibido en este fragmento
+            if texts:
+                yield "".join(texts)
+            raise GenerationBlocked(finish_reason)
+    if texts:
+        yield "".join(texts)
+
+
+def _blocked_reason(exc):
+    """Motivo de bloqueo de una excepción del SDK, o None si no es un bloqueo.
+
+    En streaming el SDK no entrega el fragmento bloqueado: lanza
+    `BlockedPromptException` (con la respuesta o su `prompt_feedback`) o
+    `StopCandidateException` (con el candidato) al iterar.
+    """
+    from google.generativeai.types import generation_types
+
+    detail = exc.args[0] if exc.args else None
+    if isinstance(exc, generation_types.BlockedPromptException):
+        feedback = getattr(detail, "prompt_feedback", detail)
+        return _enum_name(getattr(feedback, "block_reason", None)) or "BLOCKED_PROMPT"
+    if isinstance(exc, generation_types.StopCandidateException):
+        return _enum_name(getattr(detail, "finish_reason", None)) or "STOP_CANDIDATE"
+    return None
+
+
+def usage_tokens(chunk):
+    """Tokens de prompt, de respuesta y servidos desde caché (None si no vienen).
+
+    `cached` forma parte de `prompt`: son los tokens de entrada que el
+    proveedor no ha vuelto a procesar (caché de contexto explícita o implícita).
+    """
+    usage = getattr(chunk, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt": getattr(usage, "prompt_token_count", 0) or 0,
+        "response": getattr(usage, "candidates_token_count", 0) or 0,
+        "cached": getattr(usage, "cached_content_token_count", 0) or 0,
+    }
+
+
+def generate_chunks(model, prompt, stream=True, on_usage=None, call=None):
+    """Genera la respuesta devolviendo trozos de texto según van llegando.
+
+    `on_usage(tokens)` recibe el recuento de tokens del último fragmento
+    (en streaming, el acumulado llega con el fragmento final). `call`
+    envuelve la petición al modelo (p. ej. reintentos del planificador).
+    Los bloqueos de seguridad se lanzan siempre como `GenerationBlocked`.
+    """
+    usage = None
+    try:
+        if call is not None:
+            response = call(model.generate_content, prompt, stream=stream)
+        else:
+            response = model.generate_content(prompt, stream=stream)
+        for chunk in response if stream else [response]:
+            usage = usage_tokens(chunk) or usage
+            yield from _chunk_text(chunk)
+    except GenerationBlocked:
+        raise
+    except Exception as exc:
+        reason = _blocked_reason(exc)
+        if reason is None:
+            raise
+        raise GenerationBlocked(reason) from exc
+    finally:
+        if on_usage is not None and usage is not None:
+            on_usage(usage)
@@ -0,0 +1,116 @@
+# --------------------------------------------------
+# Historial de conversación con presupuesto de tokens
+# --------------------------------------------------
+# 👉 Los últimos turnos se envían literalmente; los anteriores se condensan
+#    en un resumen acumulado que solo se actualiza con los mensajes que
+#    acaban de salir de la ventana (no se re-resume todo en cada turno).
+# --------------------------------------------------
+
+CHARS_PER_TOKEN = 4  # Aproximación razonable para texto técnico en español
+
+SUMMARY_PROMPT = """
+Resume de forma muy concisa la siguiente conversación entre un usuario y un asistente técnico
+de edificación. Conserva normas, artículos, cifras y conclusiones relevantes para preguntas de
+seguimiento. Máximo {max_words} palabras.
+
+Resumen previo:
+{previous}
+
+Nuevos mensajes:
+{messages}
+"""
+
+
+def estimate_tokens(text):
+    """Estimación rápida del número de tokens de un texto."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def format_conversation_history(history):
+    return "\n\n".join(f"{m['role']}: {m['content']}" for m in history)
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def extractive_summary(previous, messages, max_tokens=300):
+    """Resumen sin modelo: primera frase de cada mensaje, añadida al resumen previo."""
+    lines = [previous] if previous else []
+    for message in messages:
+        first_sentence = message["content"].strip().split("\n", 1)[0].split(". ", 1)[0]
+        lines.append(f"{message['role']}: {first_sentence}")
+    # Si no cabe se conserva lo más reciente
+    text = "\n".join(lines)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "…" + text[-max_chars:]
+
+
+def make_model_summarizer(model, max_words=150):
+    """Crea un resumidor incremental que usa el modelo generativo."""
+    def summarize(previous, messages):
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max_words,
+            previous=previous or "(ninguno)",
+            messages=format_conversation_history(messages),
+        )
+        response = model.generate_content(prompt)
+        return response.candidates[0].content.parts[0].text.strip()
+    return summarize
+
+
+class HistoryManager:
+    """Construye el historial para el prompt dentro de un presupuesto de tokens.
+
+    El estado del resumen (`{"summary": str, "covered": int}`) pertenece a la
+    sesión y se pasa en cada llamada; el gestor no guarda estado propio.
+    """
+
+    def __init__(self, token_budget=1500, keep_turns=3, summary_tokens=300, summarizer=None):
+        self.token_budget = token_budget
+        self.keep_messages = keep_turns * 2  # Un turno = pregunta + respuesta
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+
+    def _summarize(self, previous, messages):
+        if self.summarizer is not None:
+            try:
+                return truncate_to_tokens(self.summarizer(previous, messages), self.summary_tokens)
+            except Exception:
+                pass  # Si el modelo falla se recurre al resumen extractivo
+        return extractive_summary(previous, messages, self.summary_tokens)
+
+    def build(self, history, state, offset=0):
+        """Devuelve (texto_historial, estado_actualizado, tokens_estimados).
+
+        `offset` es la posición absoluta del primer mensaje de `history`
+        cuando el almacén ya ha descartado los más antiguos; `covered` se
+        guarda en posiciones absolutas.
+        """
+        verbatim = list(history[-self.keep_messages:]) if self.keep_messages else []
+        verbatim_budget = self.token_budget - self.summary_tokens
+        while len(verbatim) > 1 and estimate_tokens(format_conversation_history(verbatim)) > verbatim_budget:
+            verbatim.pop(0)
+
+        older_count = len(history) - len(verbatim)
+        summary = state.get("summary", "")
+        covered = max(0, state.get("covered", 0) - offset)
+        if covered > len(history):
+            # El historial ha cambiado (p. ej. nueva conversación): se reinicia el resumen
+            summary, covered = "", 0
+        elif covered > older_count:
+            # La ventana literal ha vuelto a crecer: lo ya resumido no se repite ni se resume de nuevo
+            verbatim = verbatim[covered - older_count:]
+            older_count = covered
+        if older_count > covered:
+            summary = self._summarize(summary, history[covered:older_count])
+            covered = older_count
+
+        parts = []
+        if summary:
+            parts.append(f"Resumen de la conversación anterior:\n{summary}")
+        if verbatim:
+            parts.append(format_conversation_history(verbatim))
+        text = "\n\n".join(parts)
+        return text, {"summary": summary, "covered": covered + offset}, estimate_tokens(text)
@@ -0,0 +1,336 @@
+# --------------------------------------------------
+# Ingesta masiva de documentación en el índice
+# --------------------------------------------------
+# 👉 Lee PDFs y textos normativos, los divide en fragmentos con solape,
+#    calcula embeddings por lotes en paralelo (con reintentos) y los sube
+#    en lotes grandes. Es incremental: los documentos sin cambios se
+#    omiten y los fragmentos repetidos (mismo hash) se deduplican.
+#
+#    Además mantiene el corpus local de fragmentos (rag.corpus) con el que
+#    se construye el índice léxico, y etiqueta cada fragmento con su
+#    `familia` normativa (rag.routing) para filtrar las búsquedas. Para
+#    etiquetar documentos ya indexados hay que borrar el manifiesto.
+#
+#    python -m rag.ingest docs/ --backend pinecone
+#    python -m rag.ingest docs/ --backend local --local-dir data/local_index
+# --------------------------------------------------
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rag.routing import classify_document
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+DEFAULT_MANIFEST = os.path.join(".cache", "ingest_manifest.json")
+
+
+# ---------------- Lectura de documentos -----------------
+def iter_document_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            yield path
+
+
+def read_document(path):
+    """Devuelve el texto del documento (página a página en los PDF)."""
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError as exc:
+            raise RuntimeError("Para ingerir PDFs instala `pypdf` (pip install pypdf).") from exc
+        reader = PdfReader(path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        return fh.read()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---------------- Fragmentación -----------------
+def chunk_text(text, chunk_size=1200, overlap=200):
+    """Divide el texto en fragmentos de ~chunk_size caracteres con solape.
+
+    Se corta preferentemente en párrafos y, si no, en finales de frase.
+    """
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            window = text[start:end]
+            cut = max(window.rfind("\n\n"), window.rfind(". "))
+            if cut > chunk_size // 2:
+                end = start + cut + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def content_hash(text):
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+# ---------------- Reintentos -----------------
+def with_retries(call, attempts=5, base_delay=1.0, max_delay=30.0):
+    """Ejecuta `call()` reintentando con backoff exponencial y jitter."""
+    for attempt in range(attempts):
+        try:
+            return call()
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(random.uniform(0, delay))
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ---------------- Manifiesto incremental -----------------
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    return {"documents": {}}
+
+
+def save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+# ---------------- Destinos -----------------
+class PineconeSink:
+    def __init__(self, index, namespace=None):
+        self.index = index
+        self.namespace = namespace
+
+    def upsert(self, records):
+        vectors = [{"id": i, "values": v, "metadata": m} for i, v, m in records]
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        with_retries(lambda: self.index.upsert(vectors=vectors, **kwargs))
+
+    def delete(self, ids):
+        kwargs = {"namespace": self.namespace} if self.namespace else {}
+        for batch in batched(list(ids), 1000):
+            with_retries(lambda: self.index.delete(ids=batch, **kwargs))
+
+    def flush(self):
+        pass  # Cada upsert ya queda escrito en Pinecone
+
+    def close(self):
+        pass
+
+
+class LocalSink:
+    def __init__(self, directory):
+        from rag.retrievers import LocalRetriever
+
+        self.directory = directory
+        if os.path.exists(os.path.join(directory, "index.json")):
+            self.retriever = LocalRetriever.load(directory, mmap=False)
+        else:
+            self.retriever = LocalRetriever(directory=directory)
+
+    def upsert(self, records):
+        self.retriever.upsert(records)
+
+    def delete(self, ids):
+        self.retriever.delete(ids)
+
+    def flush(self):
+        """Escribe el índice en disco (antes de marcar documentos en el manifiesto)."""
+        self.retriever.save(self.directory)
+
+    def close(self):
+        self.flush()
+
+
+# ---------------- Pipeline -----------------
+class Ingestor:
+    """Orquesta fragmentación, embeddings por lotes y subida al índice."""
+
+    def __init__(self, embed_batch, sink, manifest_path=DEFAULT_MANIFEST, chunk_size=1200,
+                 overlap=200, embed_batch_size=50, upsert_batch_size=100, workers=4, log=print,
+                 corpus=None):
+        self.embed_batch = embed_batch
+        self.sink = sink
+        self.corpus = corpus
+        self.manifest_path = manifest_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.workers = workers
+        self.log = log
+
+    def _embed_all(self, texts):
+        batches = list(batched(texts, self.embed_batch_size))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(lambda batch: with_retries(lambda: self.embed_batch(batch)), batches)
+            return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def run(self, paths):
+        manifest = load_manifest(self.manifest_path)
+        documents = manifest["documents"]
+        known_ids = {fid for entry in documents.values() for fid in entry["ids"]}
+        seen_paths = set()
+        stats = {"skipped": 0, "indexed": 0, "chunks": 0, "deduplicated": 0, "deleted": 0}
+
+        for path in iter_document_paths(paths):
+            key = os.path.relpath(path)
+            seen_paths.add(key)
+            digest = file_hash(path)
+            if documents.get(key, {}).get("sha256") == digest:
+                stats["skipped"] += 1
+                continue
+
+            name = os.path.splitext(os.path.basename(path))[0]
+            text = read_document(path)
+            family = classify_document(name, text)  # Para filtrar por familia en las consultas
+            pending = {}
+            ids = []
+            for position, chunk in enumerate(chunk_text(text, self.chunk_size, self.overlap)):
+                fragment_id = content_hash(chunk)[:32]
+                ids.append(fragment_id)
+                if fragment_id in known_ids or fragment_id in pending:
+                    stats["deduplicated"] += 1
+                    continue
+                pending[fragment_id] = {"texto": chunk, "documento": name, "fragmento": position}
+                if family:
+                    pending[fragment_id]["familia"] = family
+
+            new_ids = list(pending)
+            vectors = self._embed_all([pending[fid]["texto"] for fid in new_ids])
+            records = [(fid, vector, pending[fid]) for fid, vector in zip(new_ids, vectors)]
+            for batch in batched(records, self.upsert_batch_size):
+                self.sink.upsert(batch)
+            if self.corpus is not None:
+                self.corpus.upsert((fid, metadata) for fid, _vector, metadata in records)
+
+            old_ids = set(documents.get(key, {}).get("ids", []))
+            documents[key] = {"sha256": digest, "ids": ids}
+            known_ids.update(ids)
+            self._delete_orphans(documents, old_ids - set(ids), stats)
+            # Progreso duradero documento a documento: el manifiesto solo
+            # marca un documento cuando sus vectores ya están guardados
+            self.sink.flush()
+            save_manifest(manifest, self.manifest_path)
+            stats["indexed"] += 1
+            stats["chunks"] += len(records)
+            self.log(f"✔ {key}: {len(records)} fragmentos nuevos de {len(ids)}")
+
+        # Documentos eliminados del corpus
+        for key in [key for key in documents if key not in seen_paths]:
+            removed = set(documents.pop(key)["ids"])
+            self._delete_orphans(documents, removed, stats)
+            self.log(f"✖ {key}: eliminado del índice")
+        self.sink.close()
+        save_manifest(manifest, self.manifest_path)
+        return stats
+
+    def _delete_orphans(self, documents, candidate_ids, stats):
+        """Borra del índice los fragmentos que ya no usa ningún documento."""
+        if not candidate_ids:
+            return
+        in_use = {fid for entry in documents.values() for fid in entry["ids"]}
+        orphans = candidate_ids - in_use
+        if orphans:
+            self.sink.delete(orphans)
+            if self.corpus is not None:
+                self.corpus.delete(orphans)
+            stats["deleted"] += len(orphans)
+
+
+def make_genai_embedder(api_key, model):
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+
+    def embed_batch(texts):
+        return genai.embed_content(model=model, content=list(texts))["embedding"]
+    return embed_batch
+
+
+def main(argv=None):
+    from rag.corpus import DEFAULT_CORPUS_PATH, FragmentCorpus
+    from rag.settings import load_secrets
+
+    parser = argparse.ArgumentParser(description="Ingesta de documentación normativa en el índice.")
+    parser.add_argument("paths", nargs="+", help="Ficheros o carpetas con PDFs / textos")
+    parser.add_argument("--backend", choices=("pinecone", "local"), default="pinecone")
+    parser.add_argument("--index-name", default="documentacion-edificacion")
+    parser.add_argument("--namespace", default=None)
+    parser.add_argument("--local-dir", default=os.path.join("data", "local_index"))
+    parser.add_argument("--manifest", default=None, help="Manifiesto incremental (uno por backend)")
+    parser.add_argument("--embedding-model", default="models/text-embedding-004")
+    parser.add_argument("--chunk-size", type=int, default=1200)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--embed-batch-size", type=int, default=50)
+    parser.add_argument("--upsert-batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH, help="Corpus local de fragmentos")
+    parser.add_argument("--build-ivf", action="store_true", help="Construir índice IVF (backend local)")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets()
+    if args.backend == "local":
+        sink = LocalSink(args.local_dir)
+    else:
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=secrets["pinecone_api_key"], pool_threads=args.workers)
+        sink = PineconeSink(pc.Index(args.index_name, pool_threads=args.workers), args.namespace)
+
+    manifest = args.manifest or os.path.join(".cache", f"ingest_manifest_{args.backend}.json")
+    ingestor = Ingestor(
+        make_genai_embedder(secrets["genai_api_key"], args.embedding_model),
+        sink,
+        manifest_path=manifest,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        workers=args.workers,
+        corpus=FragmentCorpus(args.corpus),
+    )
+    stats = ingestor.run(args.paths)
+    if args.backend == "local" and args.build_ivf:
+        sink.retriever.build_ivf()
+        sink.retriever.save(args.local_dir)
+    print(
+        f"Documentos indexados: {stats['indexed']} · sin cambios: {stats['skipped']} · "
+        f"fragmentos nuevos: {stats['chunks']} · duplicados: {stats['deduplicated']} · "
+        f"eliminados: {stats['deleted']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# --------------------------------------------------
+# Trazas y métricas del pipeline
+# --------------------------------------------------
+# 👉 Cada turno registra la duración de sus etapas (spans), los tokens de
+#    prompt/respuesta, los aciertos de caché, los fragmentos recuperados y
+#    los errores. Los agregados se exportan en formato de texto Prometheus
+#    (endpoint HTTP opcional) y/o como JSONL (una línea por turno).
+# --------------------------------------------------
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_SAMPLES = 500  # Duraciones recientes por etapa para percentiles del panel
+
+
+class TurnTrace:
+    """Traza de un turno: spans, tokens, cachés, fragmentos y errores."""
+
+    def __init__(self, query):
+        self.query = query
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self.spans = {}
+        self.tokens = {}
+        self.cache = {}
+        self.fragments = {}
+        self.errors = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Mide el bloque y lo guarda como span (acumula si se repite)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self.error(name, exc)
+            raise
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def error(self, stage, exc):
+        with self._lock:
+            self.errors.append({"stage": stage, "error": f"{type(exc).__name__}: {exc}"})
+
+    def elapsed(self):
+        return time.perf_counter() - self._origin
+
+    def to_dict(self):
+        return {
+            "timestamp": self.started,
+            "query": self.query,
+            "spans": {name: round(seconds, 6) for name, seconds in self.spans.items()},
+            "tokens": self.tokens,
+            "cache": self.cache,
+            "fragments": self.fragments,
+            "errors": self.errors,
+            **self.attributes,
+        }
+
+
+class Tracer:
+    """Agregador de trazas del proceso con exportación Prometheus/JSONL."""
+
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.background_turns = 0  # Turnos de fondo (precalentamiento): fuera de los agregados
+        self.stage_buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self.stage_sum = defaultdict(float)
+        self.stage_count = defaultdict(int)
+        self.recent = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))
+        self.tokens = defaultdict(int)
+        self.cache = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.fragments = defaultdict(int)
+        self.tier_turns = defaultdict(int)
+        self.tier_tokens = defaultdict(int)  # (nivel, tipo) → tokens
+        self.tier_recent = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))  # Duración total por nivel
+        self.hedged = 0
+        self.startup = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+
+    def start_turn(self, query):
+        return TurnTrace(query)
+
+    def finish_turn(self, trace):
+        """Incorpora la traza a los agregados y la exporta a JSONL si procede.
+
+        Las trazas con el atributo `background` solo se exportan: los
+        percentiles y Prometheus reflejan la latencia de los usuarios.
+        """
+        trace.add_span("total", trace.elapsed())
+        record = trace.to_dict()
+        with self._lock:
+            if trace.attributes.get("background"):
+                self.background_turns += 1
+                self._export(record)
+                return record
+            self.turns += 1
+            for stage, seconds in trace.spans.items():
+                buckets = self.stage_buckets[stage]
+                for position, bound in enumerate(LATENCY_BUCKETS):
+                    if seconds <= bound:
+                        buckets[position] += 1
+                        break
+                else:
+                    buckets[-1] += 1
+                self.stage_sum[stage] += seconds
+                self.stage_count[stage] += 1
+                self.recent[stage].append(seconds)
+            for kind, count in trace.tokens.items():
+                self.tokens[kind] += count or 0
+            for cache, hit in trace.cache.items():
+                self.cache[(cache, "hit" if hit else "miss")] += 1
+            for error in trace.errors:
+                self.errors[error["stage"]] += 1
+            for kind, count in trace.fragments.items():
+                self.fragments[kind] += count
+            tier = trace.attributes.get("model_tier")
+            if tier:
+                self.tier_turns[tier] += 1
+                self.tier_recent[tier].append(trace.spans["total"])
+                for kind in ("prompt", "response"):
+                    self.tier_tokens[(tier, kind)] += trace.tokens.get(kind) or 0
+            self.hedged += bool(trace.attributes.get("hedged"))
+            self._export(record)
+        return record
+
+    def _export(self, record):
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    @staticmethod
+    def _percentiles(samples, fractions):
+        ordered = sorted(samples)
+        return [ordered[min(len(ordered) - 1, int(f * len(ordered)))] for f in fractions]
+
+    def percentiles(self, fractions=(0.5, 0.95)):
+        """Percentiles recientes por etapa: `{etapa: [p50, p95, ...]}`."""
+        with self._lock:
+            return {stage: self._percentiles(samples, fractions) for stage, samples in self.recent.items()}
+
+    def tier_stats(self):
+        """Por nivel de modelo: turnos, tokens medios y latencia total reciente (p50/p95)."""
+        with self._lock:
+            return {
+                tier: {
+                    "turns": turns,
+                    "prompt_tokens": self.tier_tokens[(tier, "prompt")] / turns,
+                    "response_tokens": self.tier_tokens[(tier, "response")] / turns,
+                    "latency": self._percentiles(self.tier_recent[tier], (0.5, 0.95)),
+                }
+                for tier, turns in sorted(self.tier_turns.items())
+            }
+
+    def record_startup(self, report):
+        """Tiempos de arranque del proceso (ver `rag.startup`)."""
+        with self._lock:
+            self.startup = report
+
+    def render_prometheus(self):
+        """Métricas en formato de exposición de texto de Prometheus."""
+        lines = [
+            "# HELP rag_turns_total Turnos de consulta procesados.",
+            "# TYPE rag_turns_total counter",
+        ]
+        with self._lock:
+            lines.append(f"rag_turns_total {self.turns}")
+            lines += [
+                "# HELP rag_stage_seconds Duración de cada etapa del pipeline.",
+                "# TYPE rag_stage_seconds histogram",
+            ]
+            for stage, buckets in sorted(self.stage_buckets.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative + buckets[-1]}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {self.stage_sum[stage]:.6f}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {self.stage_count[stage]}')
+            lines += ["# HELP rag_tokens_total Tokens enviados y recibidos.", "# TYPE rag_tokens_total counter"]
+            lines += [f'rag_tokens_total{{kind="{kind}"}} {count}' for kind, count in sorted(self.tokens.items())]
+            lines += ["# HELP rag_cache_requests_total Consultas a cachés.", "# TYPE rag_cache_requests_total counter"]
+            lines += [
+                f'rag_cache_requests_total{{cache="{cache}",result="{result}"}} {count}'
+                for (cache, result), count in sorted(self.cache.items())
+            ]
+            lines += ["# HELP rag_errors_total Errores por etapa.", "# TYPE rag_errors_total counter"]
+            lines += [f'rag_errors_total{{stage="{stage}"}} {count}' for stage, count in sorted(self.errors.items())]
+            lines += ["# HELP rag_fragments_total Fragmentos recuperados.", "# TYPE rag_fragments_total counter"]
+            lines += [f'rag_fragments_total{{kind="{kind}"}} {count}' for kind, count in sorted(self.fragments.items())]
+            lines += ["# HELP rag_model_tier_turns_total Respuestas servidas por nivel de modelo.",
+                      "# TYPE rag_model_tier_turns_total counter"]
+            lines += [
+                f'rag_model_tier_turns_total{{tier="{tier}"}} {count}' for tier, count in sorted(self.tier_turns.items())
+            ]
+            lines += ["# HELP rag_model_tier_tokens_total Tokens por nivel de modelo.",
+                      "# TYPE rag_model_tier_tokens_total counter"]
+            lines += [
+                f'rag_model_tier_tokens_total{{tier="{tier}",kind="{kind}"}} {count}'
+                for (tier, kind), count in sorted(self.tier_tokens.items())
+            ]
+            lines += ["# HELP rag_generation_hedged_total Turnos con petición de respaldo por lentitud.",
+                      "# TYPE rag_generation_hedged_total counter", f"rag_generation_hedged_total {self.hedged}"]
+            if self.startup:
+                version = self.startup["version"]
+                lines += ["# HELP rag_startup_seconds Duración de cada fase del arranque.", "# TYPE rag_startup_seconds gauge"]
+                lines += [
+                    f'rag_startup_seconds{{phase="{phase}",version="{version}"}} {seconds:.6f}'
+                    for phase, seconds in self.startup["phases"].items()
+                ]
+        return "\n".join(lines) + "\n"
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(tracer, port, host="0.0.0.0"):
+    """Sirve `/metrics` en un hilo de fondo (una sola vez por puerto)."""
+    with _servers_lock:
+        if port in _servers:
+            return _servers[port]
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="rag-metrics", daemon=True).start()
+        _servers[port] = server
+        return server
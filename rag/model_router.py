@@ -0,0 +1,207 @@
+# --------------------------------------------------
+# Niveles de modelo y plazo de generación
+# --------------------------------------------------
+# 👉 Cada consulta se asigna a un nivel de modelo (rápido, estándar o
+#    avanzado) según el tamaño del prompt, los fragmentos recuperados y el
+#    tipo de pregunta: las definiciones cortas no necesitan el modelo más
+#    caro y las comparativas o cálculos sí.
+#
+#    La generación tiene un plazo: si el modelo elegido no ha empezado a
+#    responder tras `hedge_after` segundos se lanza en paralelo la misma
+#    petición al nivel más rápido y se sirve la que llegue antes; si falla
+#    antes del primer trozo se pasa directamente al respaldo. Si la
+#    respuesta no se completa en `deadline` segundos desde el inicio del
+#    turno se aborta con `GenerationTimeout`.
+# --------------------------------------------------
+
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+from rag.generation import GenerationBlocked
+
+TIER_FAST = "rapido"
+TIER_STANDARD = "estandar"
+TIER_ADVANCED = "avanzado"
+
+# Del más rápido al más capaz; None = `generation_model`
+MODEL_TIERS = (
+    (TIER_FAST, "gemini-2.0-flash-lite"),
+    (TIER_STANDARD, None),
+    (TIER_ADVANCED, "gemini-2.5-flash"),
+)
+TIER_LABELS = {TIER_FAST: "modelo rápido", TIER_STANDARD: "modelo estándar", TIER_ADVANCED: "modelo avanzado"}
+
+QUERY_SIMPLE = "simple"
+QUERY_STANDARD = "estandar"
+QUERY_COMPLEX = "compleja"
+
+SIMPLE_PATTERNS = re.compile(
+    r"^\W*(que es|que son|que significa|define|definicion de|cual es la definicion|a que se refiere)\b"
+)
+# Señales de razonamiento en varios pasos; «dimensiones mínimas» o «explica qué es» son consultas normales
+COMPLEX_PATTERNS = re.compile(
+    r"\b(compar\w*|diferencias?|calcul\w*|dimensiona(r|do|miento)|justific\w*|razona\w*|analiz\w*"
+    r"|paso a paso|procedimiento|por que|ventajas|inconvenientes|frente a|vs)\b"
+)
+COMPLEX_QUERY_WORDS = 40  # Consultas muy largas suelen mezclar varias preguntas
+
+ModelTier = namedtuple("ModelTier", "name model")
+TierChoice = namedtuple("TierChoice", "tier reason")
+Attempt = namedtuple("Attempt", "tier model prompt cached")  # Una petición al modelo de un nivel
+
+
+class GenerationTimeout(Exception):
+    """Ningún modelo ha respondido dentro del plazo."""
+
+
+def query_type(query):
+    """Tipo de pregunta: definición corta, estándar o compleja (comparar, calcular...)."""
+    normalized = unicodedata.normalize("NFKD", (query or "").casefold())
+    normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+    if COMPLEX_PATTERNS.search(normalized) or normalized.count("?") > 1 \
+            or len(normalized.split()) > COMPLEX_QUERY_WORDS:
+        return QUERY_COMPLEX
+    if SIMPLE_PATTERNS.search(normalized):
+        return QUERY_SIMPLE
+    return QUERY_STANDARD
+
+
+class ModelRouter:
+    """Elige el nivel de modelo de cada consulta."""
+
+    def __init__(self, tiers, default=TIER_STANDARD, small_prompt_tokens=1200, large_prompt_tokens=5000,
+                 few_fragments=2):
+        self.tiers = [ModelTier(name, model) for name, model in tiers]
+        self.by_name = {tier.name: tier for tier in self.tiers}
+        self.default = self.by_name.get(default, self.tiers[len(self.tiers) // 2])
+        self.small_prompt_tokens = small_prompt_tokens
+        self.large_prompt_tokens = large_prompt_tokens
+        self.few_fragments = few_fragments
+
+    @property
+    def fastest(self):
+        return self.tiers[0]
+
+    @property
+    def most_capable(self):
+        return self.tiers[-1]
+
+    def select(self, query, prompt_tokens, fragments):
+        """`TierChoice` para una consulta con ese prompt estimado y esos fragmentos."""
+        kind = query_type(query)
+        if not fragments:
+            return TierChoice(self.fastest, "sin fragmentos")
+        if kind == QUERY_COMPLEX:
+            return TierChoice(self.most_capable, "pregunta compleja")
+        if prompt_tokens >= self.large_prompt_tokens:
+            return TierChoice(self.most_capable, "prompt largo")
+        if kind == QUERY_SIMPLE:
+            return TierChoice(self.fastest, "definición")
+        if fragments <= self.few_fragments and prompt_tokens <= self.small_prompt_tokens:
+            return TierChoice(self.fastest, "prompt corto")
+        return TierChoice(self.default, "por defecto")
+
+    def faster(self, tier):
+        """Nivel inmediatamente más rápido, o None si ya es el más rápido."""
+        position = self.tiers.index(tier)
+        return self.tiers[position - 1] if position else None
+
+
+# ---------------- Generación con plazo y respaldo -----------------
+def hedged_chunks(primary, run, backup=None, hedge_after=None, deadline=None, elapsed=0.0, on_event=None):
+    """Trozos del primer intento que empiece a responder.
+
+    `run(attempt)` devuelve el iterador de trozos de un intento y se
+    ejecuta en un hilo propio. `backup` se lanza si `primary` falla antes
+    del primer trozo o, con `hedge_after`, si tarda más de esos segundos.
+    `on_event(evento, intento, error)` recibe "hedge", "failure" y
+    "served" (en el hilo del consumidor). Lanza `GenerationTimeout` si la
+    respuesta no ha terminado `deadline` segundos después de empezar el
+    turno; `elapsed` son los segundos ya consumidos antes de generar.
+    """
+    events = queue.Queue()
+    stops = {}
+    running = set()
+
+    def launch(attempt):
+        stop = stops[attempt] = threading.Event()
+        running.add(attempt)
+
+        def worker():
+            chunks = None
+            try:
+                chunks = iter(run(attempt))
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    events.put((attempt, "chunk", chunk))
+            except Exception as exc:
+                events.put((attempt, "error", exc))
+            else:
+                events.put((attempt, "done", None))
+            finally:
+                close = getattr(chunks, "close", None)  # None si `run` falló al empezar
+                if close is not None:
+                    close()  # Libera la conexión y el hueco del planificador
+
+        threading.Thread(target=worker, name=f"rag-generate-{attempt.tier.name}", daemon=True).start()
+
+    def notify(event, attempt, error=None):
+        if on_event is not None:
+            on_event(event, attempt, error)
+
+    started = time.monotonic()
+    deadline_at = started - elapsed + deadline if deadline is not None else None
+    winner = None
+    backup_pending = backup is not None
+    launch(primary)
+    try:
+        while True:
+            now = time.monotonic()
+            waits = []
+            if deadline is not None:
+                waits.append(deadline_at - now)
+            if winner is None and backup_pending and hedge_after is not None:
+                waits.append(started + hedge_after - now)
+            try:
+                attempt, kind, value = events.get(timeout=max(0.0, min(waits)) if waits else None)
+            except queue.Empty:
+                now = time.monotonic()
+                if winner is None and backup_pending and hedge_after is not None and now - started >= hedge_after:
+                    # El modelo elegido no ha empezado a responder: petición paralela al respaldo
+                    backup_pending = False
+                    notify("hedge", backup)
+                    launch(backup)
+                elif deadline is not None and now >= deadline_at:
+                    raise GenerationTimeout(f"El modelo no ha completado la respuesta en {deadline:.0f} s")
+                continue
+
+            if winner is not None and attempt is not winner:
+                continue  # Restos del intento descartado
+            if kind == "error":
+                running.discard(attempt)
+                if winner is not None or isinstance(value, GenerationBlocked):
+                    raise value
+                notify("failure", attempt, value)
+                if backup_pending:
+                    backup_pending = False
+                    launch(backup)
+                elif not running:
+                    raise value
+                continue
+            if winner is None:
+                winner = attempt
+                for other, stop in stops.items():
+                    if other is not attempt:
+                        stop.set()
+                notify("served", attempt)
+            if kind == "done":
+                return
+            yield value
+    finally:
+        for stop in stops.values():
+            stop.set()
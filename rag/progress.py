@@ -0,0 +1,77 @@
+# --------------------------------------------------
+# Seguimiento de etapas reales del pipeline RAG
+# --------------------------------------------------
+# 👉 Sustituye a las barras de progreso simuladas: el progreso avanza solo
+#    cuando ocurre un evento real (embedding, búsqueda, generación) y se
+#    guardan los tiempos medidos de cada etapa.
+# --------------------------------------------------
+
+import time
+from collections import namedtuple
+
+Stage = namedtuple("Stage", ["name", "percent", "label"])
+
+# Etapas del pipeline en orden, con el porcentaje y el texto a mostrar
+STAGES = (
+    Stage("embedding_start", 5, "Procesando consulta..."),
+    Stage("embedding_done", 30, "Buscando documentos relevantes..."),
+    Stage("retrieval_done", 60, "Generando respuesta técnica..."),
+    Stage("first_token", 90, "Redactando respuesta..."),
+    Stage("done", 100, "Finalizando..."),
+)
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+# Nombre legible de cada tramo (desde la etapa anterior hasta esta)
+SEGMENT_LABELS = {
+    "embedding_done": "Embedding",
+    "retrieval_done": "Búsqueda",
+    "first_token": "Primer token",
+    "done": "Generación",
+}
+
+
+class StageTracker:
+    """Registra los eventos reales del pipeline y notifica a la interfaz."""
+
+    def __init__(self, on_stage=None, clock=time.perf_counter):
+        self.on_stage = on_stage
+        self.clock = clock
+        self.started_at = clock()
+        self.events = []  # [(nombre_etapa, instante)]
+
+    def mark(self, name):
+        """Marca una etapa como alcanzada (las repetidas se ignoran)."""
+        if self.reached(name):
+            return
+        stage = STAGES_BY_NAME[name]
+        self.events.append((name, self.clock()))
+        if self.on_stage is not None:
+            self.on_stage(stage)
+
+    def reached(self, name):
+        return any(event_name == name for event_name, _ in self.events)
+
+    def elapsed(self):
+        """Segundos transcurridos desde el inicio de la consulta."""
+        return self.clock() - self.started_at
+
+    def timings(self):
+        """Duración en segundos de cada tramo medido, en orden."""
+        result = {}
+        previous = self.started_at
+        for name, instant in self.events:
+            if name in SEGMENT_LABELS:
+                result[name] = instant - previous
+            previous = instant
+        return result
+
+    def summary(self):
+        """Resumen compacto de tiempos para mostrar bajo la respuesta."""
+        parts = [
+            f"{SEGMENT_LABELS[name]} {seconds:.2f} s"
+            for name, seconds in self.timings().items()
+        ]
+        if self.reached("done"):
+            total = dict(self.events)["done"] - self.started_at
+            parts.append(f"Total {total:.2f} s")
+        return " · ".join(parts)
@@ -0,0 +1,66 @@
+# --------------------------------------------------
+# Prompt del asistente
+# --------------------------------------------------
+
+# ---------------- Prompt Base (sin cambios) -----------------
+CUSTOM_PROMPT = """
+Eres un asistente técnico inteligente especializado en documentación de ingeniería civil y proyectos de construcción.
+Tu objetivo es proporcionar respuestas precisas, técnicas y claras basadas únicamente en la documentación proporcionada.
+
+Recibirás:
+1. El historial de la conversación actual
+2. La última consulta (la actual) del usuario, la cual tienes que responder.
+3. Fragmentos relevantes de documentación técnica
+
+Instrucciones:
+- Utiliza el historial de la conversación para entender el contexto de la consulta
+- Responde principalmente con información contenida en los fragmentos proporcionados
+- Usa terminología técnica apropiada para ingenieros
+- Si la documentación no contiene la información solicitada, indícalo claramente
+- Sé conciso pero completo en tus respuestas
+- Cita números de sección, especificaciones o normas técnicas cuando estén disponibles en los fragmentos
+- Cuando identifiques la respuesta, cita textualmente de qué parte de la documentación la has sacado.
+
+Tu estilo debe ser técnico, preciso y objetivo.
+"""
+
+
+def format_context(fragments, references=None):
+    """Une los fragmentos recuperados en el bloque de contexto del prompt.
+
+    Los que están en `references` (id → etiqueta) ya los tiene el modelo en
+    la caché de contexto: solo se cita su etiqueta.
+    """
+    references = references or {}
+    return "\n---\n".join(
+        f"[{references[seg.get('id')]} · {seg['documento']}]: (fragmento de referencia, ver arriba)"
+        if seg.get("id") in references else f"[{seg['documento']}]: {seg['texto']}"
+        for seg in fragments
+    )
+
+
+def format_reference_block(entries):
+    """Fragmentos de referencia `(etiqueta, documento, texto)` del prefijo cacheado."""
+    body = "\n---\n".join(f"[{label} · {documento}]: {texto}" for label, documento, texto in entries)
+    return (
+        "📌 **Fragmentos de referencia:** documentación citada con frecuencia. Cuando una consulta "
+        f"incluya la etiqueta de uno de ellos (p. ej. R1), úsalo como fragmento relevante.\n{body}"
+    )
+
+
+def build_turn_prompt(formatted_history, retrieved_context, query):
+    """Parte variable del prompt; las instrucciones van como `system_instruction`.
+
+    El historial va primero: entre turnos de una sesión solo crece por el
+    final, así que el proveedor puede reutilizar el prefijo (caché implícita).
+    """
+    return (
+        f"📜 **Historial de la conversación:**\n{formatted_history}\n"
+        f"📚 **Fragmentos de documentación relevantes:**\n{retrieved_context}\n\n"
+        f"👤 **Consulta actual del usuario:** {query}"
+    )
+
+
+def build_prompt(system_prompt, formatted_history, retrieved_context, query):
+    """Prompt completo en un solo texto (modelos sin `system_instruction`)."""
+    return f"{system_prompt}\n\n" + build_turn_prompt(formatted_history, retrieved_context, query)
@@ -0,0 +1,45 @@
+# --------------------------------------------------
+# HTML de las tarjetas de fragmentos
+# --------------------------------------------------
+# 👉 Función pura (sin Streamlit) para poder memorizarla y medirla aparte.
+# --------------------------------------------------
+
+
+def build_fragments_html(fragments):
+    """Construye de una vez el HTML de todas las tarjetas de fragmentos."""
+    # Ordenar fragmentos por score (descendente); los solo léxicos, al final
+    sorted_fragments = sorted(
+        fragments, key=lambda x: (x.get("score") is not None, x.get("score") or 0), reverse=True
+    )
+
+    cards = []
+    for frag in sorted_fragments:
+        # Determinar el color del badge según el score
+        if frag.get("score") is None:
+            # Coincidencia por términos: BM25 no es un porcentaje de similitud
+            badge_class = "badge-lexical"
+            relevance_text = "Coincidencia de términos"
+        elif frag["score"] >= 0.8:
+            badge_class = "badge-success"
+            relevance_text = f"Alta relevancia ({frag['score']:.0%})"
+        elif frag["score"] >= 0.6:
+            badge_class = "badge-warning"
+            relevance_text = f"Relevancia media ({frag['score']:.0%})"
+        else:
+            badge_class = "badge-danger"
+            relevance_text = f"Baja relevancia ({frag['score']:.0%})"
+
+        # Formatear el texto para mostrar
+        texto_formateado = frag['texto'].replace('\n', '<br>')
+
+        cards.append(
+            f'<div class="fragment-container fadein">'
+            f'<div class="fragment-header">'
+            f'<div class="fragment-source">📄 {frag["documento"]}</div>'
+            f'<div class="fragment-score">'
+            f'<span class="badge {badge_class}">{relevance_text}</span>'
+            f'</div></div>'
+            f'<div class="fragment-content">{texto_formateado}</div>'
+            f'</div>'
+        )
+    return "".join(cards)
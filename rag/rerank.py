@@ -0,0 +1,86 @@
+# --------------------------------------------------
+# Reordenación local de fragmentos recuperados
+# --------------------------------------------------
+# 👉 Tras sobre-recuperar candidatos se puntúan todos a la vez (similitud
+#    vectorial + cobertura léxica de la consulta ponderada por IDF), se
+#    descartan casi-duplicados con MMR y solo los mejores que caben en el
+#    presupuesto de tokens de contexto llegan al prompt.
+# --------------------------------------------------
+
+import zlib
+
+import numpy as np
+
+from rag.bm25 import tokenize
+from rag.history import estimate_tokens
+
+
+class Reranker:
+    """Reordenación MMR ligera que se ejecuta en CPU en un único lote."""
+
+    def __init__(self, vector_weight=0.6, mmr_lambda=0.7, duplicate_threshold=0.9,
+                 max_fragments=5, token_budget=2500, hash_dim=4096):
+        self.vector_weight = vector_weight
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.max_fragments = max_fragments
+        self.token_budget = token_budget
+        self.hash_dim = hash_dim
+
+    def _bucket(self, token):
+        return zlib.crc32(token.encode("utf-8")) % self.hash_dim
+
+    def _term_matrix(self, token_lists):
+        """Matriz de frecuencias (una fila por fragmento) con hashing de términos."""
+        matrix = np.zeros((len(token_lists), self.hash_dim), dtype=np.float32)
+        for row, tokens in enumerate(token_lists):
+            np.add.at(matrix[row], [self._bucket(token) for token in tokens], 1.0)
+        return matrix
+
+    def rerank(self, query, candidates, idf=None):
+        """Devuelve los fragmentos seleccionados, con `rerank_score`, en orden.
+
+        `idf` es un callable opcional `token -> peso` (p. ej. del índice BM25).
+        """
+        if not candidates:
+            return []
+        query_tokens = sorted(set(tokenize(query)))
+        matrix = self._term_matrix([
+            tokenize(f"{candidate.get('documento', '')} {candidate.get('texto', '')}")
+            for candidate in candidates
+        ])
+
+        # Relevancia: mezcla de la similitud coseno y la cobertura léxica
+        # (las coincidencias solo léxicas compiten únicamente por cobertura)
+        vector_scores = np.asarray([candidate.get("score") or 0.0 for candidate in candidates], dtype=np.float32)
+        coverage = np.zeros(len(candidates), dtype=np.float32)
+        if query_tokens:
+            weights = np.zeros(self.hash_dim, dtype=np.float32)
+            for token in query_tokens:
+                weights[self._bucket(token)] += idf(token) if idf else 1.0
+            total = weights.sum()
+            if total > 0:
+                coverage = (matrix > 0).astype(np.float32) @ weights / total
+        relevance = self.vector_weight * vector_scores + (1 - self.vector_weight) * coverage
+
+        # Similitud entre fragmentos para detectar duplicados (coseno de TF)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        unit = matrix / np.where(norms == 0, 1, norms)
+        similarity = unit @ unit.T
+
+        selected, used_tokens = [], 0
+        remaining = list(range(len(candidates)))
+        max_similarity = np.zeros(len(candidates), dtype=np.float32)
+        while remaining and len(selected) < self.max_fragments:
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * max_similarity[remaining]
+            best = remaining.pop(int(np.argmax(mmr)))
+            if selected and max_similarity[best] >= self.duplicate_threshold:
+                continue  # Casi-duplicado de un fragmento ya elegido
+            tokens = estimate_tokens(candidates[best].get("texto", ""))
+            if selected and used_tokens + tokens > self.token_budget:
+                continue  # No cabe; quizá un fragmento más corto sí
+            selected.append(best)
+            used_tokens += tokens
+            max_similarity = np.maximum(max_similarity, similarity[best])
+
+        return [dict(candidates[row], rerank_score=float(relevance[row])) for row in selected]
@@ -0,0 +1,122 @@
+# --------------------------------------------------
+# Caché de resultados de recuperación
+# --------------------------------------------------
+# 👉 Guarda las respuestas de `index.query` indexadas por índice, namespace,
+#    hash del vector cuantizado, top_k y filtro. Una búsqueda repetida se
+#    sirve en microsegundos en lugar de hacer un viaje de red.
+# --------------------------------------------------
+
+import hashlib
+import json
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+QUANTIZATION_SCALE = 8192  # Resolución ~1e-4, suficiente para vectores normalizados
+
+
+def vector_hash(vector, scale=QUANTIZATION_SCALE):
+    """Hash estable del vector tras cuantizarlo a enteros de 16 bits."""
+    quantized = array("h", (max(-32768, min(32767, round(v * scale))) for v in vector))
+    return hashlib.blake2b(quantized.tobytes(), digest_size=16).hexdigest()
+
+
+def to_plain_response(response):
+    """Convierte la respuesta del índice en un dict simple con `matches`."""
+    if hasattr(response, "to_dict"):
+        response = response.to_dict()
+    matches = []
+    for match in response.get("matches", []) or []:
+        if hasattr(match, "to_dict"):
+            match = match.to_dict()
+        matches.append(dict(match))
+    return {"matches": matches, "namespace": response.get("namespace", "")}
+
+
+class RetrievalCache:
+    """Caché LRU con caducidad de respuestas del índice vectorial."""
+
+    def __init__(self, capacity=512, ttl=600, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._index_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(index_name, vector, top_k, namespace=None, filter=None, **options):
+        return (
+            index_name,
+            namespace or "",
+            vector_hash(vector),
+            top_k,
+            json.dumps(filter, sort_keys=True, ensure_ascii=False) if filter else "",
+            json.dumps(options, sort_keys=True),
+        )
+
+    def _check_version(self, index_version):
+        if index_version is not None and index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def get(self, key, index_version=None):
+        with self._lock:
+            self._check_version(index_version)
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response, index_version=None):
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[key] = (self.clock(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_query(self, query_fn, index_name, vector, top_k, namespace=None,
+                     filter=None, index_version=None, **options):
+        """Devuelve la respuesta cacheada o consulta el índice con `query_fn`."""
+        key = self.make_key(index_name, vector, top_k, namespace=namespace, filter=filter, **options)
+        response = self.get(key, index_version=index_version)
+        if response is None:
+            kwargs = dict(options, vector=vector, top_k=top_k)
+            if namespace:
+                kwargs["namespace"] = namespace
+            if filter:
+                kwargs["filter"] = filter
+            response = to_plain_response(query_fn(**kwargs))
+            self.put(key, response, index_version=index_version)
+        return response
+
+    def invalidate(self, index_name=None):
+        """Descarta entradas (todas o las de un índice) tras re-indexar."""
+        with self._lock:
+            if index_name is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == index_name]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
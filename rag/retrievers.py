@@ -0,0 +1,335 @@
+# --------------------------------------------------
+# Backends de recuperación vectorial
+# --------------------------------------------------
+# 👉 Interfaz común para buscar fragmentos: Pinecone (remoto) o un índice
+#    local en memoria / memory-mapped con NumPy. Ambos devuelven el mismo
+#    formato `{"matches": [{"id", "score", "metadata"}]}`.
+# --------------------------------------------------
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from rag.retrieval_cache import to_plain_response
+
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+MANIFEST_FILE = "index.json"
+IVF_FILE = "ivf.npz"
+
+
+def matches_filter(metadata, filter):
+    """Evalúa un filtro de metadatos con la sintaxis básica de Pinecone."""
+    for field, condition in (filter or {}).items():
+        if field == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, expected in condition.items():
+            if operator == "$eq" and value != expected:
+                return False
+            if operator == "$ne" and value == expected:
+                return False
+            if operator == "$in" and value not in expected:
+                return False
+            if operator == "$nin" and value in expected:
+                return False
+    return True
+
+
+class PineconeRetriever:
+    """Búsqueda en el índice remoto de Pinecone."""
+
+    remote = True  # Las consultas pasan por los límites del planificador
+
+    def __init__(self, clients, index_name):
+        self.clients = clients
+        self.name = index_name
+
+    @property
+    def version(self):
+        self.clients.index  # Asegura la conexión y la comprobación periódica
+        return self.clients.index_version
+
+    def query(self, vector, top_k, namespace=None, filter=None, **options):
+        kwargs = dict(options, vector=vector, top_k=top_k)
+        if namespace:
+            kwargs["namespace"] = namespace
+        if filter:
+            kwargs["filter"] = filter
+        return to_plain_response(self.clients.query(**kwargs))
+
+    def fetch(self, ids, namespace=None):
+        """Metadatos de los fragmentos indicados: `{id: metadata}`."""
+        kwargs = {"namespace": namespace} if namespace else {}
+        response = self.clients.fetch(ids=list(ids), **kwargs)
+        return {fid: dict(vector.metadata or {}) for fid, vector in response.vectors.items()}
+
+
+class LocalRetriever:
+    """Índice vectorial local: matriz float32 normalizada + metadatos.
+
+    La búsqueda exacta es un producto matriz-vector vectorizado con NumPy.
+    Opcionalmente se construye un índice IVF (k-means) que limita la
+    búsqueda a las `nprobe` listas más cercanas al vector de consulta.
+    Los filtros de metadatos se resuelven con las filas precalculadas de
+    cada valor de campo, sin evaluar el filtro fila a fila.
+    """
+
+    remote = False
+
+    def __init__(self, ids=None, vectors=None, metadata=None, name="local", directory=None):
+        self.name = name
+        self.directory = directory
+        self.ids = list(ids or [])
+        self.metadata = list(metadata or [])
+        dim = vectors.shape[1] if vectors is not None and len(vectors) else 0
+        self.vectors = vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        self._positions = {fragment_id: row for row, fragment_id in enumerate(self.ids)}
+        self._field_rows = {}  # campo → {valor: filas}, construido en el primer filtro por ese campo
+        self.centroids = None
+        self.lists = None
+        self.nprobe = 8
+        self._saved_version = None  # Huella del contenido al guardar (ver `version`)
+        self._writes = 0
+
+    # ---------- Persistencia ----------
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Carga el índice de disco (la matriz se proyecta en memoria si `mmap`)."""
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        count, dim = manifest["count"], manifest["dim"]
+        path = os.path.join(directory, VECTORS_FILE)
+        if count == 0:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        elif mmap:
+            vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            vectors = np.fromfile(path, dtype=np.float32).reshape(count, dim)
+        ids, metadata = [], []
+        with open(os.path.join(directory, METADATA_FILE), encoding="utf-8") as fh:
+            for line in fh:
+                record = json.loads(line)
+                ids.append(record["id"])
+                metadata.append(record["metadata"])
+        retriever = cls(ids, vectors, metadata, name=f"local:{manifest.get('name', 'index')}", directory=directory)
+        ivf_path = os.path.join(directory, IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                retriever.centroids = ivf["centroids"]
+                retriever.lists = ivf["lists"]
+        retriever.nprobe = manifest.get("nprobe", retriever.nprobe)
+        # Índices guardados antes de registrar la huella: la fecha del manifiesto
+        retriever._saved_version = manifest.get("version") \
+            or str(os.path.getmtime(os.path.join(directory, MANIFEST_FILE)))
+        return retriever
+
+    def save(self, directory=None):
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+        digest = hashlib.sha1(memoryview(vectors).cast("B"))
+        # Se escribe en un fichero temporal por si hay un memmap abierto sobre el original
+        tmp_path = os.path.join(directory, VECTORS_FILE + ".tmp")
+        vectors.tofile(tmp_path)
+        os.replace(tmp_path, os.path.join(directory, VECTORS_FILE))
+        with open(os.path.join(directory, METADATA_FILE), "w", encoding="utf-8") as fh:
+            for fragment_id, metadata in zip(self.ids, self.metadata):
+                line = json.dumps({"id": fragment_id, "metadata": metadata}, ensure_ascii=False) + "\n"
+                digest.update(line.encode("utf-8"))
+                fh.write(line)
+        ivf_path = os.path.join(directory, IVF_FILE)
+        if self.centroids is not None:
+            np.savez(ivf_path, centroids=self.centroids, lists=self.lists)
+            digest.update(np.ascontiguousarray(self.centroids).tobytes())  # El IVF cambia los resultados
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        manifest = {
+            "name": os.path.basename(os.path.normpath(directory)),
+            "count": len(self.ids),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "nprobe": self.nprobe,
+            "version": digest.hexdigest()[:16],
+        }
+        with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        self.directory = directory
+        self._saved_version, self._writes = manifest["version"], 0
+
+    @property
+    def version(self):
+        """Huella del contenido guardado y escrituras en memoria desde entonces.
+
+        Cambia aunque un re-indexado conserve el número de vectores.
+        """
+        return self._saved_version, self._writes
+
+    # ---------- Escritura ----------
+    def upsert(self, records):
+        """Inserta o reemplaza registros `(id, vector, metadata)`."""
+        vectors = np.array(self.vectors, dtype=np.float32)  # Copia editable (el memmap es de solo lectura)
+        new_rows = []
+        for fragment_id, values, metadata in records:
+            row = _normalize(np.asarray(values, dtype=np.float32))
+            position = self._positions.get(fragment_id)
+            if position is None:
+                self._positions[fragment_id] = len(self.ids)
+                self.ids.append(fragment_id)
+                self.metadata.append(metadata)
+                new_rows.append(row)
+            else:
+                if position < len(vectors):
+                    vectors[position] = row
+                else:
+                    new_rows[position - len(vectors)] = row  # Repetido dentro del mismo lote
+                self.metadata[position] = metadata
+        if new_rows:
+            stacked = np.vstack(new_rows)
+            vectors = np.vstack([vectors, stacked]) if len(vectors) else stacked
+        self.vectors = vectors
+        self._field_rows = {}
+        self.centroids = self.lists = None  # El IVF queda obsoleto
+        self._writes += 1
+
+    def delete(self, ids):
+        remove = set(ids)
+        keep = [row for row, fragment_id in enumerate(self.ids) if fragment_id not in remove]
+        self.vectors = np.array(self.vectors[keep], dtype=np.float32)
+        self.ids = [self.ids[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self._positions = {fragment_id: row for row, fragment_id in enumerate(self.ids)}
+        self._field_rows = {}
+        self.centroids = self.lists = None
+        self._writes += 1
+
+    # ---------- Índice aproximado ----------
+    def build_ivf(self, n_lists=None, iterations=10, nprobe=8, seed=0):
+        """Agrupa los vectores con k-means para búsquedas aproximadas."""
+        count = len(self.ids)
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(self.vectors)
+        centroids = vectors[rng.choice(count, size=min(n_lists, count), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for cluster in range(len(centroids)):
+                members = vectors[assignment == cluster]
+                if len(members):
+                    centroids[cluster] = _normalize(members.mean(axis=0))
+        self.centroids = centroids
+        self.lists = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        self.nprobe = nprobe
+        self._writes += 1
+
+    # ---------- Filtros ----------
+    def _rows_by_value(self, field):
+        """Filas de cada valor del campo (los valores no hashables lanzan TypeError)."""
+        index = self._field_rows.get(field)
+        if index is None:
+            groups = {}
+            for row, metadata in enumerate(self.metadata):
+                groups.setdefault(metadata.get(field), []).append(row)
+            index = {value: np.asarray(rows, dtype=np.int64) for value, rows in groups.items()}
+            self._field_rows[field] = index
+        return index
+
+    def _filter_rows(self, filter):
+        """Filas (ordenadas) que cumplen el filtro, o None si son todas."""
+        everything = np.arange(len(self.ids), dtype=np.int64)
+        empty = np.zeros(0, dtype=np.int64)
+        rows = None
+        for field, condition in filter.items():
+            if field in ("$and", "$or"):
+                parts = [self._filter_rows(sub) for sub in condition]
+                if field == "$and":
+                    selected = None
+                    for part in parts:
+                        if part is not None:
+                            selected = part if selected is None else np.intersect1d(selected, part)
+                else:
+                    selected = None if any(part is None for part in parts) else \
+                        np.unique(np.concatenate(parts)) if parts else empty
+            else:
+                index = self._rows_by_value(field)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                selected = None
+                for operator, expected in condition.items():
+                    if operator == "$eq":
+                        part = index.get(expected, empty)
+                    elif operator in ("$in", "$nin"):
+                        values = [index[value] for value in expected if value in index]
+                        part = np.unique(np.concatenate(values)) if values else empty
+                    elif operator == "$ne":
+                        part = index.get(expected, empty)
+                    else:
+                        continue
+                    if operator in ("$ne", "$nin"):
+                        part = np.setdiff1d(everything, part)
+                    selected = part if selected is None else np.intersect1d(selected, part)
+            if selected is not None:
+                rows = selected if rows is None else np.intersect1d(rows, selected)
+        return rows
+
+    # ---------- Búsqueda ----------
+    def _candidate_rows(self, unit):
+        if self.centroids is None or len(self.centroids) <= self.nprobe:
+            return None
+        nearest = np.argpartition(-(self.centroids @ unit), self.nprobe)[:self.nprobe]
+        return np.flatnonzero(np.isin(self.lists, nearest))
+
+    def query(self, vector, top_k, namespace=None, filter=None,
+              include_metadata=True, include_values=False, **_options):
+        """Top-k por similitud coseno con el mismo formato que Pinecone."""
+        if not self.ids:
+            return {"matches": [], "namespace": namespace or ""}
+        unit = _normalize(np.asarray(vector, dtype=np.float32))
+        rows = self._candidate_rows(unit)
+        if namespace or filter:
+            query_filter = {"$and": [filter or {}, {"namespace": namespace}]} if namespace else filter
+            try:
+                allowed = self._filter_rows(query_filter)
+            except TypeError:  # Metadatos con listas: se evalúa fila a fila
+                allowed = np.asarray(
+                    [row for row, metadata in enumerate(self.metadata) if matches_filter(metadata, query_filter)],
+                    dtype=np.int64,
+                )
+            if allowed is not None:
+                rows = allowed if rows is None else np.intersect1d(rows, allowed)
+        candidates = self.vectors if rows is None else self.vectors[rows]
+        if len(candidates) == 0:
+            return {"matches": [], "namespace": namespace or ""}
+
+        scores = candidates @ unit
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        matches = []
+        for position in best:
+            row = int(position if rows is None else rows[position])
+            match = {"id": self.ids[row], "score": float(scores[position])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            if include_values:
+                match["values"] = self.vectors[row].tolist()
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def fetch(self, ids, namespace=None):
+        """Metadatos de los fragmentos indicados: `{id: metadata}`."""
+        return {fid: self.metadata[self._positions[fid]] for fid in ids if fid in self._positions}
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
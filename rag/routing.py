@@ -0,0 +1,149 @@
+# --------------------------------------------------
+# Enrutado de consultas por familia normativa
+# --------------------------------------------------
+# 👉 Clasificador de reglas (códigos del CTE y palabras clave) que asigna
+#    la consulta a una familia de documentos (incendios, estructuras,
+#    accesibilidad...) y la traduce en un filtro de metadatos `familia` o
+#    en un namespace. Los documentos fijados por el usuario en la barra
+#    lateral tienen prioridad sobre la clasificación automática.
+#
+#    La ingesta guarda `familia` en los metadatos de cada fragmento con
+#    `classify_document`.
+# --------------------------------------------------
+
+import re
+import unicodedata
+from collections import namedtuple
+
+from rag.bm25 import tokenize
+
+# `stems` se comparan como prefijo de cada palabra; `words` (siglas cortas
+# como «BIE», que como prefijo coincidirían con «bien») solo completas
+Family = namedtuple("Family", "key label codes stems words", defaults=((),))
+
+FAMILIES = (
+    Family(
+        "incendios",
+        "Seguridad en caso de incendio (DB-SI)",
+        (r"db[\s_-]?si",),
+        ("incendi", "fuego", "evacu", "humo", "rociador", "extintor", "sectoriz", "ignifug"),
+        ("bie", "bies"),
+    ),
+    Family(
+        "estructuras",
+        "Seguridad estructural (DB-SE)",
+        (r"db[\s_-]?se", r"se[\s_-](ae|c|a|m|f)", r"ehe", r"ncse", r"eurocodigo[a-z]*"),
+        ("estructur", "cimentaci", "forjado", "viga", "pilar", "zapata", "sismic", "hormigon",
+         "arcill", "terreno", "pilote", "muro"),
+    ),
+    Family(
+        "accesibilidad",
+        "Utilización y accesibilidad (DB-SUA)",
+        (r"db[\s_-]?sua", r"sua"),
+        ("accesib", "escalera", "rampa", "barandill", "desnivel", "caida", "resbal", "huella", "tabica",
+         "peldan", "ascensor", "movilidad", "discapacidad"),
+    ),
+    Family(
+        "salubridad",
+        "Salubridad (DB-HS)",
+        (r"db[\s_-]?hs",),
+        ("ventilaci", "humedad", "saneamiento", "aguas", "residuos", "radon", "fontaner", "condensaci"),
+    ),
+    Family(
+        "energia",
+        "Ahorro de energía (DB-HE)",
+        (r"db[\s_-]?he", r"rite"),
+        ("energ", "aislamiento", "termic", "transmitancia", "eficiencia", "renovable", "solar",
+         "climatiz", "calefacci", "iluminaci"),
+    ),
+    Family(
+        "ruido",
+        "Protección frente al ruido (DB-HR)",
+        (r"db[\s_-]?hr",),
+        ("ruido", "acustic", "reverberaci", "vibraci"),
+    ),
+)
+
+CODE_WEIGHT = 3  # Un código explícito (p. ej. «DB-SI») pesa más que varias palabras clave
+CODE_BOUNDARY = r"(?<![a-z0-9]){}(?![a-z])"  # «DB-SI_2019» y «DB-SI 3» sí; «decisión» no
+
+Route = namedtuple("Route", "families filter namespaces automatic pinned")
+NO_ROUTE = Route((), None, None, False, ())
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", (text or "").casefold())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def family_scores(text, families=FAMILIES):
+    """Puntuación de cada familia: códigos × CODE_WEIGHT + palabras clave y siglas."""
+    normalized = _normalize(text)
+    tokens = tokenize(text)
+    scores = {}
+    for family in families:
+        score = CODE_WEIGHT * sum(
+            len(re.findall(CODE_BOUNDARY.format(code), normalized)) for code in family.codes
+        )
+        score += sum(1 for token in tokens if token.startswith(family.stems) or token in family.words)
+        if score:
+            scores[family.key] = score
+    return scores
+
+
+def classify(text, families=FAMILIES, min_score=1, dominance=2.0):
+    """Familia claramente dominante del texto, o None si es ambiguo."""
+    ranked = sorted(family_scores(text, families).items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] < min_score:
+        return None
+    if len(ranked) > 1 and ranked[0][1] < dominance * ranked[1][1]:
+        return None
+    return ranked[0][0]
+
+
+def classify_document(name, text, families=FAMILIES):
+    """Familia de un documento: por el código en su nombre o, si no, por su contenido."""
+    return classify(name, families, min_score=CODE_WEIGHT) or classify(text, families, min_score=5)
+
+
+class QueryRouter:
+    """Traduce una consulta (y las preferencias del usuario) en filtro/namespaces."""
+
+    def __init__(self, families=FAMILIES, family_namespaces=None, min_score=1, dominance=2.0):
+        self.families = families
+        self.family_namespaces = dict(family_namespaces or {})
+        self.min_score = min_score
+        self.dominance = dominance
+        self.labels = {family.key: family.label for family in families}
+
+    def route(self, query, pinned_documents=None, family=None):
+        """Devuelve la `Route` de la consulta.
+
+        `family` fuerza una familia y `pinned_documents` limita la búsqueda a
+        esos documentos; si no se indica nada se clasifica la consulta.
+        """
+        automatic = family is None and not pinned_documents
+        if automatic:
+            family = classify(query, self.families, self.min_score, self.dominance)
+        clauses = []
+        namespaces = None
+        if family is not None:
+            if family in self.family_namespaces:
+                namespaces = (self.family_namespaces[family],)
+            else:
+                clauses.append({"familia": {"$eq": family}})
+        if pinned_documents:
+            clauses.append({"documento": {"$in": sorted(pinned_documents)}})
+        if not clauses and namespaces is None:
+            return NO_ROUTE
+        query_filter = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        return Route(
+            (family,) if family else (), query_filter, namespaces, automatic, tuple(sorted(pinned_documents or ()))
+        )
+
+    def describe(self, route):
+        """Texto breve para la interfaz."""
+        parts = [self.labels.get(family, family) for family in route.families]
+        if route.pinned:
+            parts.append(f"{len(route.pinned)} documento(s) fijado(s)")
+        return " · ".join(parts)
@@ -0,0 +1,246 @@
+# --------------------------------------------------
+# Planificador de llamadas a Gemini y Pinecone
+# --------------------------------------------------
+# 👉 Compartido por todo el proceso:
+#    - Admisión: número acotado de turnos simultáneos, con una cola justa
+#      entre sesiones (primero la sesión con menos turnos en curso) y la
+#      posición en la cola notificada a la interfaz.
+#    - Por proveedor: token bucket (peticiones/segundo), límite de
+#      llamadas concurrentes y reintentos con backoff exponencial y
+#      jitter ante 429 / 5xx.
+# --------------------------------------------------
+
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+UPSTREAM_EMBED = "embed"
+UPSTREAM_GENERATE = "generate"
+UPSTREAM_INDEX = "index"
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                   "DeadlineExceeded", "GatewayTimeout", "BadGateway"}
+
+
+class QueueTimeout(Exception):
+    """La petición no obtuvo turno dentro del plazo."""
+
+
+def http_status(exc):
+    """Código HTTP del error (google.api_core usa `code`, Pinecone `status`)."""
+    for attribute in ("code", "status", "status_code"):
+        value = getattr(exc, attribute, None)
+        value = getattr(value, "value", value)  # HTTPStatus / enums
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc):
+    """¿Es un error transitorio del proveedor (cuota, sobrecarga, 5xx)?"""
+    if http_status(exc) in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in RETRYABLE_NAMES or isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=20.0):
+    """Espera con backoff exponencial y jitter completo."""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class TokenBucket:
+    """Limita el ritmo a `rate` peticiones/segundo con ráfagas de `burst`."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Consume un token esperando lo necesario; False si se agota el plazo."""
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+
+
+class Upstream:
+    """Proveedor externo con ritmo, concurrencia y reintentos limitados."""
+
+    def __init__(self, name, rate=None, burst=None, max_concurrent=None, attempts=4,
+                 base_delay=0.5, max_delay=20.0, acquire_timeout=60.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def _take_token(self):
+        if self.bucket is not None and not self.bucket.acquire(self.acquire_timeout):
+            raise QueueTimeout(f"Límite de peticiones de {self.name} agotado")
+
+    @contextmanager
+    def slot(self):
+        """Reserva una llamada concurrente (y un token) mientras dura el bloque."""
+        if self._slots is not None and not self._slots.acquire(timeout=self.acquire_timeout):
+            raise QueueTimeout(f"Demasiadas llamadas simultáneas a {self.name}")
+        try:
+            self._take_token()
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def retry(self, fn, *args, **kwargs):
+        """Llama a `fn` reintentando los errores transitorios (el primer token ya está tomado)."""
+        for attempt in range(self.attempts):
+            if attempt:
+                self._take_token()
+            with self._lock:
+                self.calls += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as exc:
+                if attempt == self.attempts - 1 or not is_retryable(exc):
+                    raise
+                with self._lock:
+                    self.retries += 1
+                    self.throttled += http_status(exc) == 429
+                time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+
+    def call(self, fn, *args, **kwargs):
+        """`fn(*args, **kwargs)` con ritmo, concurrencia y reintentos."""
+        with self.slot():
+            return self.retry(fn, *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "retries": self.retries, "throttled": self.throttled}
+
+
+class AdmissionQueue:
+    """Turnos simultáneos acotados con cola justa entre sesiones."""
+
+    def __init__(self, max_active=8, poll_interval=0.25):
+        self.max_active = max_active
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._waiting = []  # (orden de llegada, sesión)
+        self._active = {}  # sesión → turnos en curso
+        self._served = {}  # sesión → orden de su última admisión (turno rotatorio)
+        self._arrivals = itertools.count()
+        self._admissions = itertools.count(1)
+
+    def _order(self):
+        # Primero las sesiones con menos turnos en curso, después la que
+        # lleva más tiempo sin ser atendida y, a igualdad, por llegada
+        return sorted(self._waiting, key=lambda ticket: (
+            self._active.get(ticket[1], 0), self._served.get(ticket[1], 0), ticket[0]
+        ))
+
+    @contextmanager
+    def admit(self, session_id=None, on_wait=None, timeout=None):
+        """Espera turno; `on_wait(posición)` se llama (en este hilo) mientras espera."""
+        ticket = (next(self._arrivals), session_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._waiting.append(ticket)
+            last_position = None
+            try:
+                while True:
+                    position = self._order().index(ticket)
+                    if position == 0 and sum(self._active.values()) < self.max_active:
+                        break
+                    # En cada despertar, también si solo ha cambiado la posición
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise QueueTimeout("No hay capacidad disponible en este momento")
+                    if on_wait is not None and position != last_position:
+                        last_position = position
+                        self._condition.release()
+                        try:
+                            on_wait(position + 1)
+                        finally:
+                            self._condition.acquire()
+                        continue
+                    self._condition.wait(min(self.poll_interval, remaining) if remaining is not None
+                                         else self.poll_interval)
+            finally:
+                self._waiting.remove(ticket)
+            self._active[session_id] = self._active.get(session_id, 0) + 1
+            self._served[session_id] = next(self._admissions)
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active[session_id] -= 1
+                if not self._active[session_id]:
+                    del self._active[session_id]
+                    if all(ticket[1] != session_id for ticket in self._waiting):
+                        del self._served[session_id]
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {"active": sum(self._active.values()), "waiting": len(self._waiting)}
+
+
+class Scheduler:
+    """Admisión de turnos y límites por proveedor para todo el proceso."""
+
+    def __init__(self, max_active_turns=8, upstreams=None):
+        self.admission = AdmissionQueue(max_active_turns)
+        self.upstreams = {upstream.name: upstream for upstream in upstreams or ()}
+
+    def upstream(self, name):
+        """Proveedor registrado; uno sin límites si no se ha configurado."""
+        if name not in self.upstreams:
+            self.upstreams[name] = Upstream(name)
+        return self.upstreams[name]
+
+    def admit(self, session_id=None, on_wait=None, timeout=None):
+        return self.admission.admit(session_id, on_wait=on_wait, timeout=timeout)
+
+    def stats(self):
+        return dict(
+            {name: upstream.stats() for name, upstream in self.upstreams.items()},
+            admission=self.admission.stats(),
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_active_turns=config.max_active_turns,
+            upstreams=[
+                Upstream(UPSTREAM_EMBED, rate=config.embed_rate_limit, max_concurrent=config.embed_concurrency),
+                Upstream(UPSTREAM_GENERATE, rate=config.generate_rate_limit,
+                         max_concurrent=config.generate_concurrency),
+                Upstream(UPSTREAM_INDEX, rate=config.index_rate_limit, max_concurrent=config.index_concurrency),
+            ],
+        )
@@ -0,0 +1,365 @@
+# --------------------------------------------------
+# Almacén de conversaciones en el servidor
+# --------------------------------------------------
+# 👉 La conversación de cada sesión sale de `st.session_state`: los
+#    mensajes se guardan en memoria o en SQLite y los fragmentos
+#    recuperados se almacenan una sola vez por ID (cada mensaje solo
+#    guarda referencias). La retención (mensajes por sesión, sesiones
+#    inactivas, número de sesiones) mantiene acotada la RAM.
+#
+#    Las posiciones de los mensajes son absolutas: al descartar los más
+#    antiguos, `offset()` indica la posición del primero conservado.
+# --------------------------------------------------
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+
+FRAGMENT_BODY_FIELDS = ("texto", "documento")  # Se guardan una vez; el resto va en la referencia
+
+
+def fragment_key(fragment):
+    """ID del fragmento o, si no lo tiene, un hash de su contenido."""
+    if fragment.get("id"):
+        return str(fragment["id"])
+    content = f"{fragment.get('documento', '')}\n{fragment.get('texto', '')}"
+    return "sha:" + hashlib.blake2b(content.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def compact_message(message):
+    """Devuelve (mensaje compacto, cuerpos de fragmentos por clave)."""
+    compact = {key: value for key, value in message.items() if key not in ("fragments", "fragments_html")}
+    bodies = {}
+    if "fragments" in message:
+        refs = []
+        for fragment in message["fragments"] or []:
+            key = fragment_key(fragment)
+            bodies[key] = {field: fragment.get(field, "") for field in FRAGMENT_BODY_FIELDS}
+            refs.append(dict(
+                {name: value for name, value in fragment.items() if name not in FRAGMENT_BODY_FIELDS}, key=key
+            ))
+        compact["fragment_refs"] = refs
+    return compact, bodies
+
+
+def expand_message(compact, bodies):
+    """Reconstruye el mensaje original a partir de las referencias."""
+    message = {key: value for key, value in compact.items() if key != "fragment_refs"}
+    if "fragment_refs" in compact:
+        fragments = []
+        for ref in compact["fragment_refs"]:
+            fragment = {name: value for name, value in ref.items() if name != "key"}
+            fragment.update(bodies.get(ref["key"], {}))
+            fragments.append(fragment)
+        message["fragments"] = fragments
+    return message
+
+
+class ConversationStore(ABC):
+    """Interfaz común de los almacenes de conversación."""
+
+    @abstractmethod
+    def append(self, session_id, message):
+        """Añade un mensaje y devuelve su posición absoluta."""
+
+    @abstractmethod
+    def count(self, session_id):
+        """Posición siguiente (mensajes añadidos, incluidos los descartados)."""
+
+    @abstractmethod
+    def offset(self, session_id):
+        """Posición del mensaje más antiguo que se conserva."""
+
+    @abstractmethod
+    def messages(self, session_id, start=None, end=None, fragments=True):
+        """Mensajes `[start, end)` con su `position`; sin fragmentos si `fragments=False`."""
+
+    @abstractmethod
+    def clear(self, session_id):
+        """Elimina la conversación de la sesión."""
+
+    @abstractmethod
+    def purge(self):
+        """Aplica la retención: elimina sesiones caducadas y fragmentos huérfanos."""
+
+    @abstractmethod
+    def stats(self):
+        """Sesiones, mensajes y fragmentos almacenados."""
+
+
+class MemoryConversationStore(ConversationStore):
+    """Conversaciones en memoria del proceso, con fragmentos compartidos.
+
+    Por encima de `max_sessions` se descartan las sesiones más inactivas,
+    pero solo las que llevan al menos `min_idle` segundos sin actividad:
+    una conversación en curso nunca pierde su historial (el límite se
+    excede temporalmente si todas están activas).
+    """
+
+    def __init__(self, max_messages=None, ttl=None, max_sessions=None, min_idle=900, clock=time.time):
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.min_idle = min_idle
+        self.clock = clock
+        self._sessions = OrderedDict()  # id → {...}, de la más inactiva a la más reciente
+        self._fragments = {}
+        self._refcounts = Counter()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id, create=False):
+        session = self._sessions.get(session_id)
+        if session is None and create:
+            session = self._sessions[session_id] = {"messages": [], "offset": 0, "touched": self.clock()}
+        if session is not None:
+            session["touched"] = self.clock()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def _release(self, compact):
+        for ref in compact.get("fragment_refs", ()):
+            self._refcounts[ref["key"]] -= 1
+            if self._refcounts[ref["key"]] <= 0:
+                del self._refcounts[ref["key"]]
+                self._fragments.pop(ref["key"], None)
+
+    def _drop_session(self, session_id):
+        for compact in self._sessions.pop(session_id)["messages"]:
+            self._release(compact)
+
+    def append(self, session_id, message):
+        compact, bodies = compact_message(message)
+        with self._lock:
+            session = self._session(session_id, create=True)
+            for ref in compact.get("fragment_refs", ()):
+                self._fragments.setdefault(ref["key"], bodies[ref["key"]])
+                self._refcounts[ref["key"]] += 1
+            session["messages"].append(compact)
+            position = session["offset"] + len(session["messages"]) - 1
+            if self.max_messages and len(session["messages"]) > self.max_messages:
+                excess = len(session["messages"]) - self.max_messages
+                for old in session["messages"][:excess]:
+                    self._release(old)
+                del session["messages"][:excess]
+                session["offset"] += excess
+            self._evict_idle()
+            return position
+
+    def _evict_idle(self):
+        """Descarta las sesiones más inactivas que sobran, si llevan `min_idle` sin uso."""
+        if not self.max_sessions:
+            return
+        limit = self.clock() - self.min_idle
+        while len(self._sessions) > self.max_sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session["touched"] > limit:
+                break  # La más inactiva sigue en uso: también todas las demás
+            self._drop_session(session_id)
+
+    def count(self, session_id):
+        with self._lock:
+            session = self._session(session_id)
+            return session["offset"] + len(session["messages"]) if session else 0
+
+    def offset(self, session_id):
+        with self._lock:
+            session = self._session(session_id)
+            return session["offset"] if session else 0
+
+    def messages(self, session_id, start=None, end=None, fragments=True):
+        with self._lock:
+            session = self._session(session_id)
+            if session is None:
+                return []
+            first = session["offset"]
+            start = first if start is None else max(start, first)
+            end = first + len(session["messages"]) if end is None else end
+            selected = session["messages"][start - first:max(start, end) - first]
+            result = []
+            for position, compact in enumerate(selected, start):
+                message = expand_message(compact, self._fragments) if fragments else dict(compact)
+                message["position"] = position
+                result.append(message)
+            return result
+
+    def clear(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop_session(session_id)
+
+    def purge(self):
+        if not self.ttl:
+            return 0
+        limit = self.clock() - self.ttl
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session["touched"] < limit]
+            for session_id in expired:
+                self._drop_session(session_id)
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(session["messages"]) for session in self._sessions.values()),
+                "fragments": len(self._fragments),
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversaciones en SQLite: la RAM por sesión no crece con el historial."""
+
+    def __init__(self, path, max_messages=None, ttl=None, clock=time.time):
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.clock = clock
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, touched REAL NOT NULL,"
+            " first INTEGER NOT NULL DEFAULT 0, next INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session TEXT NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (session, position));"
+            "CREATE TABLE IF NOT EXISTS message_fragments ("
+            " session TEXT NOT NULL, position INTEGER NOT NULL, key TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS message_fragments_key ON message_fragments (key);"
+            "CREATE INDEX IF NOT EXISTS message_fragments_message ON message_fragments (session, position);"
+            "CREATE TABLE IF NOT EXISTS fragments (key TEXT PRIMARY KEY, data TEXT NOT NULL);"
+        )
+        self._db.commit()
+
+    def _bounds(self, session_id):
+        row = self._db.execute("SELECT first, next FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row or (0, 0)
+
+    def _delete_messages(self, session_id, before=None):
+        condition, params = "session = ?", [session_id]
+        if before is not None:
+            condition += " AND position < ?"
+            params.append(before)
+        self._db.execute(f"DELETE FROM messages WHERE {condition}", params)
+        self._db.execute(f"DELETE FROM message_fragments WHERE {condition}", params)
+
+    def _delete_orphan_fragments(self):
+        self._db.execute(
+            "DELETE FROM fragments WHERE key NOT IN (SELECT DISTINCT key FROM message_fragments)"
+        )
+
+    def append(self, session_id, message):
+        compact, bodies = compact_message(message)
+        now = self.clock()
+        with self._lock, self._db:
+            first, position = self._bounds(session_id)
+            self._db.execute(
+                "INSERT INTO sessions (id, touched, first, next) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET touched = excluded.touched, next = excluded.next",
+                (session_id, now, first, position + 1),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages (session, position, data) VALUES (?, ?, ?)",
+                (session_id, position, json.dumps(compact, ensure_ascii=False, default=str)),
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO fragments (key, data) VALUES (?, ?)",
+                [(key, json.dumps(body, ensure_ascii=False)) for key, body in bodies.items()],
+            )
+            self._db.executemany(
+                "INSERT INTO message_fragments (session, position, key) VALUES (?, ?, ?)",
+                [(session_id, position, ref["key"]) for ref in compact.get("fragment_refs", ())],
+            )
+            if self.max_messages and position + 1 - first > self.max_messages:
+                first = position + 1 - self.max_messages
+                self._delete_messages(session_id, before=first)
+                self._db.execute("UPDATE sessions SET first = ? WHERE id = ?", (first, session_id))
+                self._delete_orphan_fragments()
+        return position
+
+    def count(self, session_id):
+        with self._lock:
+            return self._bounds(session_id)[1]
+
+    def offset(self, session_id):
+        with self._lock:
+            return self._bounds(session_id)[0]
+
+    def messages(self, session_id, start=None, end=None, fragments=True):
+        with self._lock:
+            first, next_position = self._bounds(session_id)
+            start = first if start is None else max(start, first)
+            end = next_position if end is None else end
+            rows = self._db.execute(
+                "SELECT position, data FROM messages WHERE session = ? AND position >= ? AND position < ?"
+                " ORDER BY position",
+                (session_id, start, end),
+            ).fetchall()
+            compacts = [(position, json.loads(data)) for position, data in rows]
+            bodies = {}
+            if fragments:
+                keys = sorted({ref["key"] for _, compact in compacts for ref in compact.get("fragment_refs", ())})
+                for batch_start in range(0, len(keys), 500):
+                    batch = keys[batch_start:batch_start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    for key, data in self._db.execute(
+                        f"SELECT key, data FROM fragments WHERE key IN ({placeholders})", batch
+                    ):
+                        bodies[key] = json.loads(data)
+            if rows:
+                self._db.execute("UPDATE sessions SET touched = ? WHERE id = ?", (self.clock(), session_id))
+                self._db.commit()
+        result = []
+        for position, compact in compacts:
+            message = expand_message(compact, bodies) if fragments else compact
+            message["position"] = position
+            result.append(message)
+        return result
+
+    def clear(self, session_id):
+        with self._lock, self._db:
+            self._delete_messages(session_id)
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._delete_orphan_fragments()
+
+    def purge(self):
+        if not self.ttl:
+            return 0
+        limit = self.clock() - self.ttl
+        with self._lock, self._db:
+            expired = [row[0] for row in self._db.execute("SELECT id FROM sessions WHERE touched < ?", (limit,))]
+            for session_id in expired:
+                self._delete_messages(session_id)
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            if expired:
+                self._delete_orphan_fragments()
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            sessions, messages, fragments = (
+                self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("sessions", "messages", "fragments")
+            )
+        return {"sessions": sessions, "messages": messages, "fragments": fragments}
+
+
+def open_conversation_store(config):
+    """Crea el almacén indicado en la configuración (`memory` o `sqlite`)."""
+    if config.session_backend == "sqlite":
+        return SQLiteConversationStore(
+            config.session_db_path, max_messages=config.session_max_messages, ttl=config.session_ttl
+        )
+    return MemoryConversationStore(
+        max_messages=config.session_max_messages,
+        ttl=config.session_ttl,
+        max_sessions=config.session_max_sessions,
+        min_idle=config.session_min_idle,
+    )
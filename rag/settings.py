@@ -0,0 +1,25 @@
+# --------------------------------------------------
+# Lectura de credenciales fuera de Streamlit
+# --------------------------------------------------
+# 👉 Los comandos de línea (ingesta, evaluación...) usan el mismo
+#    `.streamlit/secrets.toml` que la app; las variables de entorno
+#    GENAI_API_KEY y PINECONE_API_KEY tienen prioridad.
+# --------------------------------------------------
+
+import os
+import tomllib
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+
+def load_secrets(path=SECRETS_PATH):
+    """Devuelve la sección `general` de los secretos con los overrides de entorno."""
+    general = {}
+    if os.path.exists(path):
+        with open(path, "rb") as fh:
+            general = dict(tomllib.load(fh).get("general", {}))
+    for key in ("genai_api_key", "pinecone_api_key"):
+        value = os.environ.get(key.upper())
+        if value:
+            general[key] = value
+    return general
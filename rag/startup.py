@@ -0,0 +1,52 @@
+# --------------------------------------------------
+# Tiempos de arranque de la interfaz
+# --------------------------------------------------
+# 👉 Mide las fases del primer run de cada proceso (imports, estilos,
+#    motor, primer pintado) y las guarda en JSONL junto con la versión,
+#    para seguir la evolución del arranque en frío entre versiones.
+#    `python -m benchmarks.startup` mide lo mismo en un intérprete limpio.
+#
+#    Solo depende de la biblioteca estándar: se importa antes que el resto.
+# --------------------------------------------------
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from rag import APP_VERSION
+
+
+class StartupTimer:
+    """Duración de cada fase (desde la marca anterior) y tiempo acumulado de cada marca."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self._last = self.started
+        self.phases = {}
+        self.marks = {}
+
+    def mark(self, phase):
+        now = self.clock()
+        self.phases[phase] = now - self._last
+        self.marks[phase] = now - self.started
+        self._last = now
+
+    def report(self, version=APP_VERSION, **extra):
+        return dict(
+            extra,
+            version=version,
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            phases={phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            total=round(self._last - self.started, 6),
+        )
+
+
+def append_startup_report(path, report):
+    """Añade el informe de arranque al histórico JSONL (si hay ruta)."""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(report, ensure_ascii=False) + "\n")
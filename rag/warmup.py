@@ -0,0 +1,127 @@
+# --------------------------------------------------
+# Precalentamiento de las consultas de ejemplo
+# --------------------------------------------------
+# 👉 Un hilo de fondo responde las consultas de ejemplo de la barra
+#    lateral al arrancar el proceso y guarda cada respuesta con sus
+#    fragmentos para servirla al instante cuando se pulsa el botón. De
+#    paso deja calientes las cachés de embeddings, búsquedas y respuestas.
+#
+#    Se refresca cada `interval` segundos y en cuanto cambia el índice
+#    (re-indexado); las consultas que fallan se reintentan en la siguiente
+#    comprobación. Pasa por la cola de admisión como una sesión más, así
+#    que nunca bloquea a los usuarios, y sus turnos no cuentan en las
+#    métricas de latencia.
+# --------------------------------------------------
+
+import os
+import threading
+import time
+
+WARMUP_SESSION = "__warmup__"
+
+
+def normalize_query(query):
+    return " ".join((query or "").split()).casefold()
+
+
+def index_signature(engine):
+    """Versión del índice vectorial y del corpus: si cambia, las respuestas están obsoletas."""
+    path = engine.config.corpus_path
+    return engine.retriever.version, os.path.getmtime(path) if os.path.exists(path) else None
+
+
+class WarmupJob:
+    """Respuestas precalculadas de una lista fija de consultas."""
+
+    def __init__(self, engine, queries, interval=3600, check_interval=60):
+        self.engine = engine
+        self.queries = list(queries)
+        self.interval = interval
+        self.check_interval = check_interval
+        self._answers = {}  # consulta normalizada → resultado de `engine.answer`
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._force = False
+        self._thread = None
+        self._signature = None
+        self.refreshed_at = None
+        self.errors = {}
+
+    # ---------- Consulta ----------
+    def get(self, query):
+        """Resultado precalculado de la consulta, o None si no lo hay (aún)."""
+        with self._lock:
+            return self._answers.get(normalize_query(query))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": len(self._answers),
+                "total": len(self.queries),
+                "errors": len(self.errors),
+                "refreshed_at": self.refreshed_at,
+            }
+
+    # ---------- Refresco ----------
+    def refresh(self, queries=None):
+        """Recalcula las consultas indicadas (todas por defecto) en este hilo."""
+        for query in self.queries if queries is None else queries:
+            if self._stop.is_set():
+                return
+            try:
+                result = self.engine.answer(query, session_id=WARMUP_SESSION, background=True)
+            except Exception as exc:
+                self.errors[query] = str(exc)
+                continue
+            if not result["completed"] or not result["response"]:
+                self.errors[query] = result["error"] or "Respuesta vacía"
+                continue
+            with self._lock:
+                self._answers[normalize_query(query)] = dict(result, refreshed_at=time.time())
+            self.errors.pop(query, None)
+        self.refreshed_at = time.time()
+
+    def invalidate(self):
+        """Descarta las respuestas y pide un refresco completo (p. ej. tras vaciar las cachés)."""
+        with self._lock:
+            self._answers.clear()
+            self._force = True
+        self._wake.set()
+
+    def _missing(self):
+        with self._lock:
+            return [query for query in self.queries if normalize_query(query) not in self._answers]
+
+    def _run(self):
+        next_refresh = 0.0
+        while not self._stop.is_set():
+            try:
+                signature = index_signature(self.engine)
+            except Exception:
+                signature = self._signature  # Índice no disponible: se reintenta en la próxima comprobación
+            with self._lock:
+                force, self._force = self._force, False
+                if signature != self._signature:
+                    self._answers.clear()  # Re-indexado: nada de respuestas obsoletas
+                    self._signature = signature
+                    force = True
+            if force or time.monotonic() >= next_refresh:
+                self.refresh()
+                next_refresh = time.monotonic() + self.interval
+            elif self.errors:
+                self.refresh(self._missing())
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Arranca el hilo de fondo (una sola vez, aunque lo pidan varias sesiones a la vez)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rag-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,98 @@
+# --------------------------------------------------
+# Recursos estáticos de la interfaz
+# --------------------------------------------------
+# 👉 Genera lo que la interfaz sirve desde `static/` (ver
+#    `.streamlit/config.toml`):
+#    - Variantes del logo redimensionadas y comprimidas (WebP y PNG
+#      cuantizado) a partir de `caeys_logo_3.png` (1024×1024, 1,4 MB).
+#    - Fuentes Inter y DM Sans autoalojadas (`static/fonts/*.woff2`) y su
+#      `static/fonts.css`, que sustituye al @import a Google Fonts del
+#      fichero de partida. Requiere red una sola vez.
+#
+#    Requiere Pillow (ver requirements.txt).
+#
+#    python scripts/build_static_assets.py              # logo + fuentes
+#    python scripts/build_static_assets.py --skip-fonts
+# --------------------------------------------------
+"""Genera las variantes del logo y las fuentes autoalojadas de `static/`."""
+
+import argparse
+import os
+import re
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT, "static")
+LOGO_SOURCE = os.path.join(ROOT, "caeys_logo_3.png")
+LOGO_SIZES = (64, 128, 256)
+
+FONTS_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=DM+Sans:wght@400;500;700&display=swap"
+FONT_SUBSETS = ("latin", "latin-ext")  # Suficiente para el castellano
+FONTS_HEADER = """/* Inter y DM Sans autoalojadas: generado por scripts/build_static_assets.py */
+"""
+# Google Fonts devuelve WOFF2 solo a navegadores que lo anuncian
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+
+def build_logo_variants(source=LOGO_SOURCE, directory=STATIC_DIR, sizes=LOGO_SIZES):
+    """Escribe `logo-<tamaño>.webp` y `logo-<tamaño>.png` y devuelve sus rutas."""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    with Image.open(source) as original:
+        original = original.convert("RGBA")
+        for size in sizes:
+            image = original.resize((size, size), Image.LANCZOS)
+            webp_path = os.path.join(directory, f"logo-{size}.webp")
+            image.save(webp_path, "WEBP", quality=85, method=6)
+            png_path = os.path.join(directory, f"logo-{size}.png")
+            image.quantize(colors=128, method=Image.Quantize.FASTOCTREE).save(png_path, "PNG", optimize=True)
+            written += [webp_path, png_path]
+    return written
+
+
+def _get(url):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+def build_fonts(directory=STATIC_DIR, url=FONTS_URL, subsets=FONT_SUBSETS):
+    """Descarga los WOFF2 de los subconjuntos indicados y escribe `fonts.css`."""
+    css = _get(url).decode("utf-8")
+    fonts_dir = os.path.join(directory, "fonts")
+    os.makedirs(fonts_dir, exist_ok=True)
+    blocks = []
+    downloaded = {}  # Las fuentes variables repiten el mismo fichero para cada peso
+    # Cada @font-face va precedido de un comentario con su subconjunto: /* latin */
+    for subset, block in re.findall(r"/\* ([\w-]+) \*/\s*(@font-face \{.*?\})", css, re.S):
+        if subset not in subsets:
+            continue
+        family = re.search(r"font-family: '([^']+)'", block).group(1)
+        weight = re.search(r"font-weight: (\d+)", block).group(1)
+        remote = re.search(r"url\(([^)]+)\)", block).group(1)
+        name = downloaded.get(remote)
+        if name is None:
+            name = downloaded[remote] = f"{family.lower().replace(' ', '-')}-{weight}-{subset}.woff2"
+            with open(os.path.join(fonts_dir, name), "wb") as fh:
+                fh.write(_get(remote))
+        blocks.append(block.replace(remote, f"fonts/{name}"))
+    with open(os.path.join(directory, "fonts.css"), "w", encoding="utf-8") as fh:
+        fh.write(FONTS_HEADER + "\n".join(blocks) + "\n")
+    return len(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--skip-fonts", action="store_true", help="Solo regenera las variantes del logo")
+    args = parser.parse_args()
+
+    for path in build_logo_variants():
+        print(f"{os.path.relpath(path, ROOT)}: {os.path.getsize(path) / 1024:.1f} KB")
+    if not args.skip_fonts:
+        print(f"static/fonts.css: {build_fonts()} @font-face")
+
+
+if __name__ == "__main__":
+    main()
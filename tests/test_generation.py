@@ -0,0 +1,87 @@
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+from google.generativeai import protos
+from google.generativeai.types import generation_types
+
+from rag.generation import GenerationBlocked, generate_chunks
+from rag.model_router import GenerationTimeout, hedged_chunks
+
+Tier = namedtuple("Tier", "name")
+Attempt = namedtuple("Attempt", "tier")
+
+
+def text_chunk(text):
+    return SimpleNamespace(
+        prompt_feedback=None,
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]), finish_reason=None)],
+        usage_metadata=None,
+    )
+
+
+class StreamingModel:
+    """Modelo cuyo stream entrega `texts` y después lanza `error`."""
+
+    def __init__(self, texts, error):
+        self.texts = texts
+        self.error = error
+
+    def generate_content(self, prompt, stream=False):
+        def chunks():
+            for text in self.texts:
+                yield text_chunk(text)
+            raise self.error
+        return chunks()
+
+
+@pytest.mark.parametrize("error, reason", [
+    (generation_types.StopCandidateException(protos.Candidate(finish_reason=protos.Candidate.FinishReason.SAFETY)),
+     "SAFETY"),
+    (generation_types.BlockedPromptException(
+        protos.GenerateContentResponse.PromptFeedback(
+            block_reason=protos.GenerateContentResponse.PromptFeedback.BlockReason.PROHIBITED_CONTENT)),
+     "PROHIBITED_CONTENT"),
+])
+def test_stream_exceptions_become_generation_blocked(error, reason):
+    received = []
+    with pytest.raises(GenerationBlocked) as blocked:
+        for chunk in generate_chunks(StreamingModel(["Según el DB-SI, "], error), "prompt"):
+            received.append(chunk)
+
+    assert received == ["Según el DB-SI, "]
+    assert blocked.value.reason == reason
+
+
+def test_blocked_stream_is_not_retried_on_the_backup_tier():
+    error = generation_types.StopCandidateException(protos.Candidate(finish_reason=protos.Candidate.FinishReason.SAFETY))
+    primary, backup = Attempt(Tier("avanzado")), Attempt(Tier("rapido"))
+    launched = []
+
+    def run(attempt):
+        launched.append(attempt.tier.name)
+        return generate_chunks(StreamingModel([], error), "prompt")
+
+    with pytest.raises(GenerationBlocked):
+        list(hedged_chunks(primary, run, backup=backup))
+
+    assert launched == ["avanzado"]
+
+
+def test_other_stream_errors_are_not_reported_as_blocks():
+    with pytest.raises(ValueError):
+        list(generate_chunks(StreamingModel(["texto"], ValueError("conexión perdida")), "prompt"))
+
+
+def test_deadline_counts_time_spent_before_generation():
+    def run(attempt):
+        for number in range(20):
+            time.sleep(0.05)
+            yield f"trozo {number} "
+
+    started = time.monotonic()
+    with pytest.raises(GenerationTimeout):
+        list(hedged_chunks(Attempt(Tier("estandar")), run, deadline=1.0, elapsed=0.8))
+
+    assert time.monotonic() - started < 0.5
@@ -0,0 +1,28 @@
+from rag.history import HistoryManager
+
+
+def message(number, words=5):
+    return {"role": "Usuario" if number % 2 == 0 else "Asistente", "content": f"mensaje {number} " + "x " * words}
+
+
+def test_summary_is_kept_when_the_verbatim_window_grows_back():
+    calls = []
+
+    def summarizer(previous, messages):
+        calls.append([m["content"].split()[1] for m in messages])
+        return (previous + " " if previous else "") + "+".join(m["content"].split()[1] for m in messages)
+
+    manager = HistoryManager(token_budget=400, keep_turns=2, summary_tokens=100, summarizer=summarizer)
+    # Un mensaje largo al final obliga a recortar la ventana literal
+    history = [message(number) for number in range(5)] + [message(5, words=800)]
+    text, state, _ = manager.build(history, {})
+    assert state["covered"] == 5
+
+    # Con mensajes cortos la ventana vuelve a crecer: nada se re-resume desde el principio
+    history = history[:5] + [message(5), message(6), message(7)]
+    text, state, _ = manager.build(history, state)
+
+    assert calls == [["0", "1", "2", "3", "4"]]
+    assert state["covered"] == 5
+    assert "mensaje 4 " not in text.split("\n\n", 1)[1]
+    assert all(f"mensaje {number}" in text for number in (5, 6, 7))
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from rag.ingest import Ingestor, LocalSink, load_manifest
+from rag.retrievers import LocalRetriever
+
+
+def write_documents(directory, count):
+    for number in range(count):
+        (directory / f"doc-{number}.txt").write_text(f"Documento {number}: requisitos {number * 7}.", encoding="utf-8")
+
+
+def test_interrupted_local_run_keeps_manifest_and_index_in_step(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_documents(docs, 3)
+    index_dir = str(tmp_path / "index")
+    manifest = str(tmp_path / "manifest.json")
+    calls = []
+
+    def embed_batch(texts):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise KeyboardInterrupt  # Interrupción a mitad de la ingesta
+        return [np.ones(8) * len(calls) for _ in texts]
+
+    ingestor = Ingestor(embed_batch, LocalSink(index_dir), manifest_path=manifest, workers=1, log=lambda *_: None)
+    with pytest.raises(KeyboardInterrupt):
+        ingestor.run([str(docs)])
+
+    indexed = load_manifest(manifest)["documents"]
+    saved = LocalRetriever.load(index_dir)
+    assert len(indexed) == 1
+    assert set(saved.ids) == {fid for entry in indexed.values() for fid in entry["ids"]}
+
+    # La siguiente ejecución solo omite lo que de verdad está en el índice
+    stats = Ingestor(lambda texts: [np.ones(8) for _ in texts], LocalSink(index_dir), manifest_path=manifest,
+                     workers=1, log=lambda *_: None).run([str(docs)])
+    assert (stats["skipped"], stats["indexed"]) == (1, 2)
+    assert len(LocalRetriever.load(index_dir).ids) == 3
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+from rag.retrievers import LocalRetriever, matches_filter
+
+FAMILIES = ("incendios", "estructuras", "accesibilidad", None)
+
+
+def make_records(count, dim=16, seed=0, prefix="frag"):
+    rng = np.random.default_rng(seed)
+    return [
+        (
+            f"{prefix}-{number}",
+            rng.normal(size=dim),
+            {
+                "documento": f"doc-{number % 5}",
+                "familia": FAMILIES[number % len(FAMILIES)],
+                "namespace": "normas" if number % 3 else "",
+            },
+        )
+        for number in range(count)
+    ]
+
+
+def top_id(retriever, vector, **kwargs):
+    return retriever.query(vector, top_k=1, **kwargs)["matches"][0]["id"]
+
+
+def test_upsert_then_query_finds_every_new_record():
+    retriever = LocalRetriever()
+    retriever.upsert(make_records(10))
+    new = make_records(5, seed=1, prefix="nuevo")
+    retriever.upsert(new)
+
+    assert len(retriever.ids) == len(retriever.vectors) == 15
+    for fragment_id, vector, metadata in new:
+        match = retriever.query(vector, top_k=1)["matches"][0]
+        assert match["id"] == fragment_id
+        assert match["score"] == pytest.approx(1.0, abs=1e-5)
+        assert retriever.fetch([fragment_id]) == {fragment_id: metadata}
+
+
+def test_upsert_replaces_existing_and_repeated_ids():
+    retriever = LocalRetriever()
+    retriever.upsert(make_records(4))
+    replacement = np.ones(16)
+    batch = [
+        ("frag-1", replacement, {"documento": "actualizado"}),
+        ("otro", np.arange(16.0), {"documento": "primera versión"}),
+        ("otro", -np.arange(16.0), {"documento": "segunda versión"}),
+    ]
+    retriever.upsert(batch)
+
+    assert len(retriever.ids) == len(retriever.vectors) == 5
+    assert top_id(retriever, replacement) == "frag-1"
+    assert retriever.fetch(["frag-1"])["frag-1"] == {"documento": "actualizado"}
+    assert top_id(retriever, -np.arange(16.0)) == "otro"
+    assert retriever.fetch(["otro"])["otro"] == {"documento": "segunda versión"}
+
+
+def test_delete_removes_records_and_keeps_positions():
+    records = make_records(8)
+    retriever = LocalRetriever()
+    retriever.upsert(records)
+    retriever.delete(["frag-0", "frag-5"])
+
+    assert "frag-0" not in retriever.ids and "frag-5" not in retriever.ids
+    assert retriever.fetch(["frag-0", "frag-5"]) == {}
+    for fragment_id, vector, metadata in records:
+        if fragment_id not in ("frag-0", "frag-5"):
+            assert top_id(retriever, vector) == fragment_id
+            assert retriever.fetch([fragment_id])[fragment_id] == metadata
+
+
+@pytest.mark.parametrize("query_filter, namespace", [
+    ({"familia": {"$eq": "incendios"}}, None),
+    ({"familia": "estructuras"}, "normas"),
+    ({"documento": {"$in": ["doc-1", "doc-3"]}}, None),
+    ({"familia": {"$ne": "incendios"}, "documento": {"$nin": ["doc-2"]}}, None),
+    ({"$and": [{"familia": {"$eq": "accesibilidad"}}, {"documento": {"$in": ["doc-0", "doc-2"]}}]}, None),
+    ({"$or": [{"familia": {"$eq": None}}, {"documento": "doc-4"}]}, "normas"),
+    ({"familia": {"$eq": "inexistente"}}, None),
+    (None, "normas"),
+])
+def test_filtered_query_matches_row_by_row_evaluation(query_filter, namespace):
+    records = make_records(60)
+    retriever = LocalRetriever()
+    retriever.upsert(records)
+    expected = {
+        fragment_id for fragment_id, _, metadata in records
+        if matches_filter(metadata, query_filter)
+        and (not namespace or metadata.get("namespace", "") == namespace)
+    }
+
+    response = retriever.query(np.ones(16), top_k=len(records), namespace=namespace, filter=query_filter)
+
+    assert {match["id"] for match in response["matches"]} == expected
+
+
+def test_filter_index_is_rebuilt_after_writes():
+    retriever = LocalRetriever()
+    retriever.upsert(make_records(6))
+    incendios = {"familia": {"$eq": "incendios"}}
+    assert {m["id"] for m in retriever.query(np.ones(16), top_k=10, filter=incendios)["matches"]} == \
+        {"frag-0", "frag-4"}
+
+    retriever.upsert([("frag-1", np.ones(16), {"familia": "incendios"})])
+    retriever.delete(["frag-0"])
+
+    assert {m["id"] for m in retriever.query(np.ones(16), top_k=10, filter=incendios)["matches"]} == \
+        {"frag-1", "frag-4"}
+
+
+def test_version_changes_when_reindexed_with_the_same_count(tmp_path):
+    directory = str(tmp_path / "index")
+    retriever = LocalRetriever()
+    retriever.upsert(make_records(10))
+    retriever.save(directory)
+    saved = LocalRetriever.load(directory)
+    assert saved.version == retriever.version
+
+    edited = LocalRetriever()
+    edited.upsert(make_records(10, seed=1))  # Mismos IDs y número de vectores, contenido nuevo
+    edited.save(directory)
+
+    assert LocalRetriever.load(directory).version != saved.version
+
+
+def test_version_changes_with_unsaved_writes():
+    retriever = LocalRetriever()
+    retriever.upsert(make_records(4))
+    before = retriever.version
+    retriever.upsert([("frag-1", np.ones(16), {"documento": "actualizado"})])
+    after_upsert = retriever.version
+    retriever.delete(["frag-2"])
+
+    assert len({before, after_upsert, retriever.version}) == 3
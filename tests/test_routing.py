@@ -0,0 +1,13 @@
+import pytest
+
+from rag.routing import classify
+
+
+@pytest.mark.parametrize("query, family", [
+    ("¿Dónde se colocan las BIE?", "incendios"),
+    ("Distancia máxima entre BIEs", "incendios"),
+    ("¿Cómo se protegen bien los bienes del edificio?", None),
+    ("Huella mínima de una escalera según el DB-SUA", "accesibilidad"),
+])
+def test_short_acronyms_match_whole_words_only(query, family):
+    assert classify(query) == family
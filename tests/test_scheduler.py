@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+
+from rag.scheduler import AdmissionQueue, QueueTimeout
+
+
+def test_admission_deadline_holds_while_queue_position_keeps_changing():
+    queue = AdmissionQueue(max_active=1, poll_interval=10)
+    release = threading.Event()
+
+    def hold(session_id):
+        with queue.admit(session_id):
+            release.wait()
+
+    threading.Thread(target=hold, args=("ocupada",), daemon=True).start()
+    time.sleep(0.05)
+    positions = []
+
+    def on_wait(position):
+        # Cada aviso cambia la cola y despierta al que espera, que cambia de posición
+        positions.append(position)
+        if len(positions) > 500:
+            return
+        with queue._condition:
+            queue._waiting.insert(0, (-len(positions), f"otra-{len(positions)}"))
+            queue._condition.notify_all()
+
+    started = time.monotonic()
+    with pytest.raises(QueueTimeout):
+        with queue.admit("lenta", on_wait=on_wait, timeout=0.2):
+            pass
+    release.set()
+
+    assert time.monotonic() - started < 1
+    assert len(positions) > 1